@@ -0,0 +1,25 @@
+"""Capa de datos de la gestión de cueros, utilizable sin Streamlit.
+
+    import cueros
+    df = cueros.obtener_datos_con_apertura()
+
+La conexión a Firebase se abre en el primer acceso a datos (ver cueros.conexion).
+"""
+from .conexion import SinCredenciales, inicializar, obtener_db
+from .datos import (
+    init_db, agregar_movimiento, obtener_datos, obtener_datos_con_apertura, obtener_saldos_apertura,
+    autenticar_usuario, crear_usuario, obtener_usuarios, actualizar_estado_usuario, actualizar_password,
+    actualizar_rol_usuario, eliminar_usuario, actualizar_movimiento, eliminar_movimiento,
+    eliminar_movimientos_cliente, crear_cliente, obtener_clientes, actualizar_cliente,
+    eliminar_cliente, obtener_cliente_por_id, agregar_pago_cuenta, obtener_pagos_cuenta,
+    obtener_pagos_cuenta_cliente, calcular_saldo_cliente, eliminar_pago_cuenta,
+    obtener_politica, obtener_almacen, obtener_cola, version_datos, buscar,
+    precargar_pagina, CAMPOS_RESUMEN, totales_cliente, obtener_motor_costos, reporte_antiguedad,
+    obtener_registro_cambios, reconstruir_vista, verificar_vista, escanear_coleccion,
+    acumular_movimientos, metricas_en_flujo, usar_almacen, almacen_activo, metricas_globales, verificar_kpi,
+    obtener_motor_filtros, actualizar_en_bloque, obtener_indice_lotes, obtener_resumen_clientes,
+    obtener_programador, iniciar_recalculo, estado_recalculo,
+)
+from .calculos import metricas_stock, saldo_pagos, balance_cliente, resumen_clientes, antiguedad_deudas, AcumuladorMovimientos
+from .dinero import a_centavos, a_pesos, importes, migrar_a_centavos
+from .duplicados import aplicar_fusion, buscar_duplicados
@@ -0,0 +1,295 @@
+"""Almacén compartido de datos: un listener por colección para todo el proceso"""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+
+import pandas as pd
+
+from . import avisos
+
+COLECCIONES_ALMACEN = ('usuarios', 'clientes', 'movimientos', 'pagos_cuenta', 'saldos_apertura')
+# Orden en que cada lectura devolvía los datos: (campo, ascendente)
+ORDEN_COLECCIONES = {
+    'usuarios': None,
+    'clientes': ('nombre', True),
+    'movimientos': ('fecha', False),
+    'pagos_cuenta': ('fecha', False),
+    'saldos_apertura': ('fecha', False),
+}
+
+class BloqueoLecturaEscritura:
+    """Permite varios lectores simultáneos o un único escritor (con prioridad de escritura)"""
+
+    def __init__(self):
+        self._condicion = threading.Condition(threading.Lock())
+        self._lectores = 0
+        self._escribiendo = False
+        self._escritores_esperando = 0
+
+    @contextmanager
+    def lectura(self):
+        with self._condicion:
+            while self._escribiendo or self._escritores_esperando:
+                self._condicion.wait()
+            self._lectores += 1
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._lectores -= 1
+                if self._lectores == 0:
+                    self._condicion.notify_all()
+
+    @contextmanager
+    def escritura(self):
+        with self._condicion:
+            self._escritores_esperando += 1
+            while self._escribiendo or self._lectores:
+                self._condicion.wait()
+            self._escritores_esperando -= 1
+            self._escribiendo = True
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._escribiendo = False
+                self._condicion.notify_all()
+
+class AlmacenDatos:
+    """Copia en memoria de las colecciones, mantenida por listeners on_snapshot.
+
+    Todas las sesiones de Streamlit del proceso leen de la misma instancia, de modo
+    que el costo en lecturas de Firestore no depende de la cantidad de usuarios.
+    Si se le pasa un diario, arranca desde la última instantánea local y la mantiene
+    al día, para poder servir lecturas sin conexión. Un suscriptor que falla, o una
+    instantánea local que no se pudo guardar, no frena a los demás: se cuenta en
+    errores() y se avisa.
+    """
+
+    def __init__(self, db, colecciones=COLECCIONES_ALMACEN, diario=None):
+        self._db = db
+        self._diario = diario
+        self._docs = {c: {} for c in colecciones}
+        self._tiempos = {c: {} for c in colecciones}
+        self._locales = {c: set() for c in colecciones}
+        self._versiones = {c: 0 for c in colecciones}
+        self._version = 0
+        self._cargadas = {c: threading.Event() for c in colecciones}
+        self._en_vivo = {c: False for c in colecciones}
+        self._frames = {}
+        self._watches = {}
+        self._bloqueo = BloqueoLecturaEscritura()
+        self._cambio = threading.Condition()
+        self._suscriptores = {c: [] for c in colecciones}
+        self._errores = {}
+        self._lock_errores = threading.Lock()
+        self.documentos_recibidos = 0
+
+    def precargar(self):
+        """Carga la última instantánea local de cada colección (si existe)"""
+        if self._diario is None:
+            return
+        for coleccion in self._docs:
+            documentos = self._diario.cargar_instantanea(coleccion)
+            if documentos is None:
+                continue
+            with self._bloqueo.escritura():
+                if self._en_vivo[coleccion]:
+                    continue
+                self._docs[coleccion] = documentos
+                self._versiones[coleccion] += 1
+                self._version += 1
+            self._cargadas[coleccion].set()
+            self._notificar(coleccion, documentos, reemplazar=True)
+
+    def iniciar(self):
+        for coleccion in self._docs:
+            if coleccion not in self._watches:
+                self._watches[coleccion] = self._db.collection(coleccion).on_snapshot(self._crear_callback(coleccion))
+
+    def detener(self):
+        for watch in self._watches.values():
+            watch.unsubscribe()
+        self._watches = {}
+
+    def _crear_callback(self, coleccion):
+        def on_snapshot(documentos, cambios, _read_time):
+            with self._bloqueo.escritura():
+                primera_carga = not self._en_vivo[coleccion]
+                if primera_carga:
+                    # La primera entrega trae la colección completa: reemplaza la instantánea
+                    # local, conservando las escrituras propias que aún no se confirmaron
+                    locales = {i: self._docs[coleccion].get(i) for i in self._locales[coleccion]}
+                    self._docs[coleccion] = {}
+                    self._tiempos[coleccion] = {}
+                    cambios = [SimpleNamespace(type=SimpleNamespace(name='ADDED'), document=doc) for doc in documentos]
+                destino = self._docs[coleccion]
+                guardar = {}
+                for cambio in cambios:
+                    doc = cambio.document
+                    self._locales[coleccion].discard(doc.id)
+                    if cambio.type.name == 'REMOVED':
+                        destino.pop(doc.id, None)
+                        self._tiempos[coleccion].pop(doc.id, None)
+                        guardar[doc.id] = None
+                    else:
+                        datos = doc.to_dict()
+                        datos['id'] = doc.id
+                        destino[doc.id] = datos
+                        self._tiempos[coleccion][doc.id] = doc.update_time
+                        guardar[doc.id] = datos
+                if primera_carga:
+                    for doc_id, datos in locales.items():
+                        if datos is None:
+                            destino.pop(doc_id, None)
+                        else:
+                            destino[doc_id] = datos
+                    self._locales[coleccion].update(locales)
+                    self._en_vivo[coleccion] = True
+                    notificar = dict(destino)
+                else:
+                    notificar = guardar
+                self.documentos_recibidos += len(cambios)
+                self._versiones[coleccion] += 1
+                self._version += 1
+            self._cargadas[coleccion].set()
+            if self._diario is not None:
+                try:
+                    self._diario.guardar_instantanea(coleccion, guardar, reemplazar=primera_carga)
+                except Exception as e:
+                    self._registrar_error(f"instantánea local de {coleccion}", e)
+            self._notificar(coleccion, notificar, reemplazar=primera_carga)
+            with self._cambio:
+                self._cambio.notify_all()
+        return on_snapshot
+
+    def suscribir(self, coleccion, funcion):
+        """Registra funcion(coleccion, documentos, reemplazar) para recibir los cambios de la colección.
+
+        La primera llamada entrega el contenido actual con reemplazar=True; después
+        llegan solo los documentos modificados ({doc_id: datos o None si se borró}).
+        Un mismo cambio puede llegar dos veces, así que aplicarlo debe ser idempotente.
+        """
+        with self._bloqueo.escritura():
+            self._suscriptores[coleccion].append(funcion)
+            actuales = {doc_id: dict(datos) for doc_id, datos in self._docs[coleccion].items()}
+        funcion(coleccion, actuales, True)
+
+    def _notificar(self, coleccion, documentos, reemplazar=False):
+        for funcion in list(self._suscriptores[coleccion]):
+            try:
+                funcion(coleccion, documentos, reemplazar)
+            except Exception as e:
+                nombre = getattr(funcion, '__qualname__', repr(funcion))
+                self._registrar_error(f"suscriptor {nombre} ({coleccion})", e)
+
+    def _registrar_error(self, origen, error):
+        mensaje = str(error) or type(error).__name__
+        with self._lock_errores:
+            fila = self._errores.setdefault(origen, {'origen': origen, 'errores': 0, 'ultimo_error': None, 'momento_error': None})
+            repetido = fila['ultimo_error'] == mensaje
+            fila['errores'] += 1
+            fila['ultimo_error'] = mensaje
+            fila['momento_error'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # El mismo error en cada cambio se avisa una vez; el contador sigue sumando
+        if not repetido:
+            avisos.aviso(f"⚠️ Almacén: falló {origen}: {mensaje}")
+
+    def errores(self):
+        """Una fila por suscriptor o instantánea que falló: cantidad de errores, último error y cuándo"""
+        with self._lock_errores:
+            return [dict(fila) for fila in self._errores.values()]
+
+    def esperar_carga(self, timeout=None):
+        limite = None if timeout is None else time.monotonic() + timeout
+        for evento in self._cargadas.values():
+            restante = None if limite is None else max(0, limite - time.monotonic())
+            if not evento.wait(restante):
+                return False
+        return True
+
+    def listo(self, coleccion):
+        """La colección tiene datos para servir (del listener o de la instantánea local)"""
+        return self._cargadas[coleccion].is_set()
+
+    def en_vivo(self, coleccion):
+        """Los datos vienen del listener y este sigue activo"""
+        watch = self._watches.get(coleccion)
+        return self._en_vivo[coleccion] and watch is not None and watch.is_active
+
+    def version(self, coleccion=None):
+        with self._bloqueo.lectura():
+            return self._version if coleccion is None else self._versiones[coleccion]
+
+    def esperar_cambio(self, coleccion, version_previa, timeout=2.0):
+        """Bloquea hasta que el listener entregue una versión posterior (p. ej. tras una escritura propia)"""
+        with self._cambio:
+            return self._cambio.wait_for(lambda: self.version(coleccion) > version_previa, timeout)
+
+    def contar(self, coleccion):
+        with self._bloqueo.lectura():
+            return len(self._docs[coleccion])
+
+    def documento(self, coleccion, doc_id):
+        with self._bloqueo.lectura():
+            datos = self._docs[coleccion].get(doc_id)
+            return dict(datos) if datos is not None else None
+
+    def tiempo_actualizacion(self, coleccion, doc_id):
+        """update_time del documento según el último snapshot recibido"""
+        with self._bloqueo.lectura():
+            return self._tiempos[coleccion].get(doc_id)
+
+    def aplicar_local(self, coleccion, doc_id, datos):
+        """Refleja una escritura aún no confirmada por Firestore (vista optimista)"""
+        with self._bloqueo.escritura():
+            if datos is None:
+                self._docs[coleccion].pop(doc_id, None)
+            else:
+                registro = dict(datos)
+                registro['id'] = doc_id
+                self._docs[coleccion][doc_id] = registro
+            self._locales[coleccion].add(doc_id)
+            self._versiones[coleccion] += 1
+            self._version += 1
+        self._notificar(coleccion, {doc_id: datos if datos is None else {**datos, 'id': doc_id}})
+
+    def restaurar_local(self, coleccion, doc_id, datos):
+        """Deshace una escritura optimista volviendo a los datos previos (None = no existía)"""
+        with self._bloqueo.escritura():
+            self._locales[coleccion].discard(doc_id)
+            if datos is None:
+                self._docs[coleccion].pop(doc_id, None)
+            else:
+                self._docs[coleccion][doc_id] = dict(datos)
+            self._versiones[coleccion] += 1
+            self._version += 1
+        self._notificar(coleccion, {doc_id: datos})
+
+    def dataframe(self, coleccion, campos=None):
+        """DataFrame de la colección, reconstruido solo cuando cambia su versión.
+
+        Con campos se arma solo con esas columnas (más 'id'), lo que evita copiar
+        al DataFrame textos largos que la vista no usa.
+        """
+        clave = (coleccion, tuple(campos) if campos is not None else None)
+        with self._bloqueo.lectura():
+            version = self._versiones[coleccion]
+            cache = self._frames.get(clave)
+            if cache is not None and cache[0] == version:
+                return cache[1].copy(deep=False)
+            registros = list(self._docs[coleccion].values())
+        if campos is None:
+            df = pd.DataFrame(registros) if registros else pd.DataFrame()
+        else:
+            columnas = list(dict.fromkeys(['id', *campos]))
+            df = pd.DataFrame(registros, columns=columnas) if registros else pd.DataFrame()
+        orden = ORDEN_COLECCIONES.get(coleccion)
+        if orden and not df.empty and orden[0] in df.columns:
+            df = df.sort_values(orden[0], ascending=orden[1], kind='stable').reset_index(drop=True)
+        # La versión de la que salió el DataFrame viaja con él (y con sus copias)
+        df.attrs['version'] = version
+        self._frames[clave] = (version, df)
+        return df.copy(deep=False)
@@ -0,0 +1,155 @@
+"""Punto de entrada HTTP/JSON liviano para consultar los datos sin la app de Streamlit.
+
+Uso:
+    python -m cueros.api --host 127.0.0.1 --port 8765 [--sin-almacen]
+
+Rutas (solo lectura):
+    GET /salud                        estado del almacén y de la política de llamadas
+    GET /movimientos?cliente=&limite= movimientos (incluye saldos de apertura)
+    GET /clientes                     clientes
+    GET /saldos?cliente=              balance de un cliente o de todos
+    GET /stock?cliente=&producto=     stock y finanzas, con filtros opcionales
+"""
+import argparse
+import json
+import math
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .calculos import balance_cliente, metricas_stock
+from .datos import (CAMPOS_RESUMEN, _almacen_listo, acumular_movimientos, almacen_activo, metricas_en_flujo,
+                    obtener_almacen, obtener_clientes, obtener_datos_con_apertura, obtener_pagos_cuenta,
+                    obtener_politica, usar_almacen)
+
+def _registros(df):
+    """Filas del DataFrame como dicts serializables (NaN -> null)"""
+    if df.empty:
+        return []
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def _valor_json(valor):
+    if hasattr(valor, 'item'):
+        valor = valor.item()
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    return valor if isinstance(valor, (int, float)) else str(valor)
+
+def _filtrar_cliente(df, cliente, columna='descripcion'):
+    if not cliente:
+        return df
+    if df.empty or columna not in df.columns:
+        return df.iloc[0:0]
+    return df[df[columna] == cliente]
+
+def salud(_parametros):
+    politica = obtener_politica()
+    if not almacen_activo():
+        return {'estado': 'ok', 'circuito': politica.estado(), 'almacen': 'desactivado'}
+    almacen = obtener_almacen()
+    return {
+        'estado': 'ok',
+        'circuito': politica.estado(),
+        'colecciones': {c: {'listo': almacen.listo(c), 'en_vivo': almacen.en_vivo(c), 'documentos': almacen.contar(c)}
+                        for c in ('clientes', 'movimientos', 'pagos_cuenta', 'saldos_apertura')},
+    }
+
+def _en_flujo():
+    # Sin las colecciones en memoria, las sumas se hacen mientras se leen en vez de armar DataFrames
+    return _almacen_listo('movimientos') is None
+
+def movimientos(parametros):
+    df = _filtrar_cliente(obtener_datos_con_apertura(), parametros.get('cliente'))
+    if parametros.get('limite'):
+        df = df.head(int(parametros['limite']))
+    return _registros(df)
+
+def clientes(_parametros):
+    return _registros(obtener_clientes())
+
+def saldos(parametros):
+    if _en_flujo():
+        acumulador = acumular_movimientos()
+        nombres = [parametros['cliente']] if parametros.get('cliente') else acumulador.clientes()
+        return [{'cliente': nombre, **acumulador.balance(nombre)} for nombre in nombres]
+    df_movimientos = obtener_datos_con_apertura(CAMPOS_RESUMEN)
+    df_pagos = obtener_pagos_cuenta()
+    if parametros.get('cliente'):
+        nombres = [parametros['cliente']]
+    else:
+        nombres = set()
+        if 'descripcion' in df_movimientos.columns:
+            nombres.update(df_movimientos['descripcion'].dropna())
+        if 'cliente_nombre' in df_pagos.columns:
+            nombres.update(df_pagos['cliente_nombre'].dropna())
+        nombres = sorted(nombres)
+    return [
+        {'cliente': nombre, **balance_cliente(_filtrar_cliente(df_movimientos, nombre),
+                                              _filtrar_cliente(df_pagos, nombre, 'cliente_nombre'))}
+        for nombre in nombres
+    ]
+
+def stock(parametros):
+    if _en_flujo():
+        return metricas_en_flujo(cliente=parametros.get('cliente') or None, producto=parametros.get('producto') or None)
+    df = _filtrar_cliente(obtener_datos_con_apertura(CAMPOS_RESUMEN), parametros.get('cliente'))
+    if parametros.get('producto'):
+        df = _filtrar_cliente(df, parametros['producto'], 'producto')
+    return metricas_stock(df)
+
+RUTAS = {
+    '/salud': salud,
+    '/movimientos': movimientos,
+    '/clientes': clientes,
+    '/saldos': saldos,
+    '/stock': stock,
+}
+
+class ManejadorAPI(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        ruta = RUTAS.get(url.path.rstrip('/') or '/')
+        if ruta is None:
+            self._responder(404, {'error': f"Ruta desconocida: {url.path}", 'rutas': sorted(RUTAS)})
+            return
+        parametros = {clave: valores[-1] for clave, valores in parse_qs(url.query).items()}
+        try:
+            self._responder(200, ruta(parametros))
+        except ValueError as e:
+            self._responder(400, {'error': str(e)})
+        except Exception as e:
+            self._responder(500, {'error': str(e)})
+
+    def _responder(self, estado, cuerpo):
+        datos = json.dumps(cuerpo, default=_valor_json, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+def crear_servidor(host='127.0.0.1', puerto=8765):
+    return ThreadingHTTPServer((host, puerto), ManejadorAPI)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API JSON de solo lectura de la gestión de cueros")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--sin-almacen', action='store_true',
+                        help="no mantener las colecciones en memoria; /stock y /saldos se calculan en flujo")
+    args = parser.parse_args(argv)
+    servidor = crear_servidor(args.host, args.port)
+    if args.sin_almacen:
+        usar_almacen(False)
+    if almacen_activo():
+        # Arranca los listeners antes de aceptar pedidos
+        obtener_almacen()
+    print(f"Sirviendo en http://{args.host}:{args.port}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""Archivo de movimientos antiguos por año, con saldos de apertura.
+
+Cada año archivado se guarda en Firestore, en la colección archivo_movimientos:
+un manifiesto por año (doc AAAA) con la cantidad de movimientos, las partes y el
+sha256 del contenido, y las partes (docs AAAA_NNNN) con las líneas JSON del año
+comprimidas con gzip, de a TAM_PARTE movimientos y por debajo del límite de 1 MB
+por documento. Los movimientos se borran recién después de releer el archivo y
+comprobar que coincide. archivo/movimientos_AAAA.jsonl.gz es solo una copia
+local para no volver a descargar el año.
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from . import avisos
+from .config import ARCHIVO_CORTE_DIAS, ARCHIVO_DIR
+from .conexion import obtener_db
+from .datos import confirmar_lote, llamar, obtener_cola, obtener_datos, obtener_registro_cambios, obtener_saldos_apertura
+from .dinero import a_pesos, campo_centavos, columna_centavos
+from .kpi import IncrementosKpi
+
+COLECCION_ARCHIVO = 'archivo_movimientos'
+TAM_PARTE = 1000
+# Margen bajo el límite de 1 MiB por documento de Firestore
+MAX_BYTES_PARTE = 900_000
+# Los manifiestos se vuelven a listar cada tanto: otro proceso puede haber archivado un año
+VIGENCIA_MANIFIESTOS = 300
+_manifiestos = {}
+
+def anio_corte_archivo(dias=ARCHIVO_CORTE_DIAS):
+    """Primer año que queda activo: solo se archivan años completos anteriores al corte"""
+    return (datetime.now() - timedelta(days=dias)).year
+
+def _ruta_archivo_anio(anio):
+    return ARCHIVO_DIR / f"movimientos_{anio}.jsonl.gz"
+
+def manifiestos_archivo(refrescar=False):
+    """{año: manifiesto} de los años archivados en Firestore (se listan cada VIGENCIA_MANIFIESTOS segundos)"""
+    if refrescar or not _manifiestos or time.monotonic() - _manifiestos['momento'] > VIGENCIA_MANIFIESTOS:
+        consulta = obtener_db().collection(COLECCION_ARCHIVO).where('manifiesto', '==', True)
+        documentos = llamar('archivo.manifiestos', lambda plazo: list(consulta.stream(retry=None, timeout=plazo)))
+        _manifiestos.update(momento=time.monotonic(), anios={int(doc.id): doc.to_dict() for doc in documentos})
+    return dict(_manifiestos['anios'])
+
+def _anios_locales():
+    if not ARCHIVO_DIR.exists():
+        return set()
+    return {int(ruta.name[len("movimientos_"):-len(".jsonl.gz")]) for ruta in ARCHIVO_DIR.glob("movimientos_*.jsonl.gz")}
+
+def anios_archivados():
+    """Años archivados en Firestore, más los que solo tienen copia local (archivados antes de guardarse en Firestore)"""
+    try:
+        return sorted(set(manifiestos_archivo()) | _anios_locales())
+    except Exception as e:
+        avisos.error(f"Error al listar los años archivados: {str(e)}")
+        return sorted(_anios_locales())
+
+def huella_archivo_anio(anio):
+    """sha256 del contenido archivado del año (cambia si se vuelve a archivar); None si solo hay copia local"""
+    return manifiestos_archivo().get(int(anio), {}).get('sha256')
+
+def _contenido(registros):
+    return "".join(json.dumps(registro, default=_valor_json, ensure_ascii=False) + "\n" for registro in registros).encode('utf-8')
+
+def _huella(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+def _partes(registros, tam=TAM_PARTE):
+    """Líneas JSON comprimidas de a tam registros; una parte que pasa MAX_BYTES_PARTE se divide"""
+    partes = []
+    for inicio in range(0, len(registros), tam):
+        grupo = registros[inicio:inicio + tam]
+        comprimido = gzip.compress(_contenido(grupo))
+        if len(comprimido) > MAX_BYTES_PARTE and len(grupo) > 1:
+            partes.extend(_partes(grupo, max(1, len(grupo) // 2)))
+        else:
+            partes.append(comprimido)
+    return partes
+
+def _leer_partes(anio, manifiesto):
+    db = obtener_db()
+    registros = []
+    for parte in range(manifiesto['partes']):
+        ref = db.collection(COLECCION_ARCHIVO).document(f"{anio}_{parte:04d}")
+        doc = llamar('archivo.leer_parte', lambda plazo: ref.get(retry=None, timeout=plazo))
+        if not doc.exists:
+            raise RuntimeError(f"Falta la parte {parte} del archivo {anio}")
+        texto = gzip.decompress(doc.to_dict()['datos']).decode('utf-8')
+        registros.extend(json.loads(linea) for linea in texto.splitlines() if linea.strip())
+    return registros
+
+def _guardar_archivo_anio(anio, registros):
+    """Guarda el año en Firestore (partes y después el manifiesto) y lo relee para comprobarlo.
+
+    Devuelve el manifiesto; si lo releído no coincide con lo escrito, lanza un error
+    y no se debe borrar nada.
+    """
+    from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+    db = obtener_db()
+    archivo = db.collection(COLECCION_ARCHIVO)
+    partes = _partes(registros)
+    for numero, datos in enumerate(partes):
+        ref = archivo.document(f"{anio}_{numero:04d}")
+        llamar('archivo.guardar_parte', lambda plazo: ref.set({'anio': int(anio), 'parte': numero, 'datos': datos},
+                                                              retry=None, timeout=plazo))
+    manifiesto = {
+        'manifiesto': True,
+        'anio': int(anio),
+        'partes': len(partes),
+        'movimientos': len(registros),
+        'sha256': _huella(_contenido(registros)),
+    }
+    ref = archivo.document(str(anio))
+    previo = llamar('archivo.leer_manifiesto', lambda plazo: ref.get(retry=None, timeout=plazo))
+    llamar('archivo.guardar_manifiesto', lambda plazo: ref.set({**manifiesto, 'actualizado': SERVER_TIMESTAMP},
+                                                               retry=None, timeout=plazo))
+    # Partes sobrantes de un archivo anterior más largo del mismo año
+    for numero in range(len(partes), previo.to_dict().get('partes', 0) if previo.exists else 0):
+        ref_sobrante = archivo.document(f"{anio}_{numero:04d}")
+        llamar('archivo.borrar_parte', lambda plazo: ref_sobrante.delete(retry=None, timeout=plazo))
+    releidos = _leer_partes(anio, manifiesto)
+    if len(releidos) != len(registros) or _huella(_contenido(releidos)) != manifiesto['sha256']:
+        raise RuntimeError(f"El archivo de {anio} guardado en Firebase no coincide con los movimientos; no se borró nada")
+    _manifiestos.clear()
+    return manifiesto
+
+def _leer_archivo_anio(anio):
+    """Registros archivados del año: de la copia local si coincide con el manifiesto, si no de Firestore"""
+    manifiesto = manifiestos_archivo().get(int(anio))
+    ruta = _ruta_archivo_anio(anio)
+    if ruta.exists():
+        with gzip.open(ruta, 'rb') as f:
+            contenido = f.read()
+        # Sin manifiesto es un año archivado solo en local: se sube a Firestore al volver a archivarlo
+        if manifiesto is None or _huella(contenido) == manifiesto['sha256']:
+            return [json.loads(linea) for linea in contenido.decode('utf-8').splitlines() if linea.strip()]
+    if manifiesto is None:
+        return []
+    registros = _leer_partes(anio, manifiesto)
+    _escribir_archivo_anio(anio, registros)
+    return registros
+
+def leer_archivo_anio(anio):
+    """Movimientos archivados de un año, del más reciente al más antiguo"""
+    data = _leer_archivo_anio(anio)
+    df_anio = pd.DataFrame(data) if data else pd.DataFrame()
+    if not df_anio.empty and 'fecha' in df_anio.columns:
+        df_anio = df_anio.sort_values('fecha', ascending=False).reset_index(drop=True)
+    return df_anio
+
+def _valor_json(valor):
+    """Convierte escalares de numpy a tipos nativos; el resto se guarda como texto"""
+    return valor.item() if hasattr(valor, 'item') else str(valor)
+
+def _escribir_archivo_anio(anio, registros):
+    """Escribe la copia local del año de forma atómica (archivo temporal + rename)"""
+    ARCHIVO_DIR.mkdir(parents=True, exist_ok=True)
+    ruta = _ruta_archivo_anio(anio)
+    temporal = ruta.with_suffix('.tmp')
+    with gzip.open(temporal, 'wb') as f:
+        f.write(_contenido(registros))
+    os.replace(temporal, ruta)
+
+def resumir_anio(df_anio, anio):
+    """Saldos de apertura de un año: una fila por (tipo, producto, cliente, estado de pago)"""
+    claves = ['tipo', 'producto', 'descripcion', 'estado_pago']
+    df_anio = df_anio.copy()
+    for clave in claves:
+        if clave not in df_anio.columns:
+            df_anio[clave] = ''
+    for campo in ('cantidad', 'peso_kg'):
+        df_anio[campo] = pd.to_numeric(df_anio.get(campo, 0), errors='coerce').fillna(0)
+    # Los importes se suman en centavos enteros
+    for campo in ('precio_total', 'neto'):
+        df_anio[campo_centavos(campo)] = columna_centavos(df_anio, campo)
+    grupos = df_anio.fillna({c: '' for c in claves}).groupby(claves, sort=True)
+    resumen = grupos.agg(
+        cantidad=('cantidad', 'sum'),
+        peso_kg=('peso_kg', 'sum'),
+        precio_total_centavos=('precio_total_centavos', 'sum'),
+        neto_centavos=('neto_centavos', 'sum'),
+        movimientos_archivados=('cantidad', 'size'),
+    ).reset_index()
+    saldos = []
+    for fila in resumen.to_dict('records'):
+        base = json.dumps([anio, fila['tipo'], fila['producto'], fila['descripcion'], fila['estado_pago']], ensure_ascii=False)
+        fila.update({
+            'doc_id': f"{anio}_{hashlib.sha1(base.encode('utf-8')).hexdigest()[:20]}",
+            'anio': int(anio),
+            'fecha': f"{anio}-12-31 23:59:59",
+            'cantidad': int(fila['cantidad']),
+            'peso_kg': float(fila['peso_kg']),
+            'precio_total': a_pesos(int(fila['precio_total_centavos'])),
+            'precio_total_centavos': int(fila['precio_total_centavos']),
+            'neto': a_pesos(int(fila['neto_centavos'])),
+            'neto_centavos': int(fila['neto_centavos']),
+            'movimientos_archivados': int(fila['movimientos_archivados']),
+            'modo_pago': '-',
+            'detalle_pago': f"Saldo de apertura (archivo {anio})",
+        })
+        saldos.append(fila)
+    return saldos
+
+def _sin_nulos(registro):
+    return {k: v for k, v in registro.items() if not (pd.api.types.is_scalar(v) and pd.isna(v))}
+
+def anios_con_escrituras_en_curso():
+    """{año: operaciones} de movimientos con escrituras en la cola sin confirmar o fallidas.
+
+    El almacén ya los muestra con la escritura aplicada; archivarlos así dejaría el
+    archivo y los saldos distintos de lo que termine quedando en Firestore.
+    """
+    cola = obtener_cola()
+    anios = {}
+    for entrada in cola.pendientes() + cola.fallidas():
+        if entrada['coleccion'] != 'movimientos':
+            continue
+        fechas = {str(datos.get('fecha', ''))[:4] for datos in (entrada['anterior'], entrada['datos']) if datos}
+        for anio in fechas:
+            if anio.isdigit():
+                anios[int(anio)] = anios.get(int(anio), 0) + 1
+    return anios
+
+def archivar_movimientos(anio_corte=None):
+    """Mueve los movimientos de los años anteriores a anio_corte a la colección archivo_movimientos.
+
+    Por cada año guarda y comprueba el archivo, escribe sus saldos de apertura en
+    'saldos_apertura' y recién después borra los movimientos, en lotes. Si un año ya tenía archivo,
+    se combina con lo nuevo, así que se puede volver a ejecutar tras un corte. Los
+    años con escrituras sin confirmar o fallidas se saltean hasta que se resuelvan.
+    """
+    anio_corte = anio_corte or anio_corte_archivo()
+    archivados = {}
+    # Los eventos llevan claves fijas de esta ejecución: si un lote se reintenta tras
+    # aplicarse, sus altas chocan y no se duplican eventos ni totales
+    corrida = uuid.uuid4().hex[:12]
+    try:
+        df_movimientos = obtener_datos()
+        if df_movimientos.empty or 'fecha' not in df_movimientos.columns:
+            return archivados
+        en_curso = anios_con_escrituras_en_curso()
+        anios = pd.to_numeric(df_movimientos['fecha'].astype(str).str[:4], errors='coerce')
+        for anio in sorted(int(a) for a in anios[anios < anio_corte].dropna().unique()):
+            if anio in en_curso:
+                avisos.aviso(f"⚠️ No se archiva {anio}: tiene {en_curso[anio]} escritura(s) sin confirmar o fallidas; "
+                             "se puede archivar cuando se confirmen o se descarten")
+                continue
+            df_anio = df_movimientos[anios == anio]
+            registros = {r['id']: r for r in _leer_archivo_anio(anio)}
+            for registro in df_anio.to_dict('records'):
+                registros[registro['id']] = _sin_nulos(registro)
+            registros = sorted(registros.values(), key=lambda r: str(r.get('fecha', '')))
+            # Primero el archivo durable en Firestore, comprobado; sin él no se borra nada
+            _guardar_archivo_anio(anio, registros)
+            _escribir_archivo_anio(anio, registros)
+
+            db = obtener_db()
+            registro_cambios = obtener_registro_cambios()
+            df_saldos = obtener_saldos_apertura()
+            saldos_previos = df_saldos.set_index('id').to_dict('index') if not df_saldos.empty else {}
+            saldos = resumir_anio(pd.DataFrame(registros), anio)
+            # Cada escritura lleva su evento en el mismo lote (dos operaciones de las 500 por lote)
+            for inicio in range(0, len(saldos), 200):
+                batch = db.batch()
+                incrementos = IncrementosKpi()
+                claves = []
+                for saldo in saldos[inicio:inicio + 200]:
+                    doc_id = saldo.pop('doc_id')
+                    batch.set(db.collection('saldos_apertura').document(doc_id), saldo)
+                    anterior = saldos_previos.get(doc_id)
+                    anterior = _sin_nulos(anterior) if anterior is not None else None
+                    claves.append(f"archivo-{anio}-{corrida}-{doc_id}")
+                    registro_cambios.agregar(batch, 'crear' if anterior is None else 'actualizar', 'saldos_apertura', doc_id,
+                                             anterior, saldo, clave=claves[-1])
+                    incrementos.sumar('saldos_apertura', anterior, saldo)
+                incrementos.agregar(db, batch)
+                confirmar_lote('archivo.saldos_apertura', batch, claves)
+
+            movimientos_anio = df_anio.to_dict('records')
+            for inicio in range(0, len(movimientos_anio), 200):
+                batch = db.batch()
+                incrementos = IncrementosKpi()
+                claves = []
+                for movimiento in movimientos_anio[inicio:inicio + 200]:
+                    batch.delete(db.collection('movimientos').document(movimiento['id']))
+                    claves.append(f"archivo-{anio}-{corrida}-{movimiento['id']}")
+                    registro_cambios.agregar(batch, 'eliminar', 'movimientos', movimiento['id'], _sin_nulos(movimiento), None,
+                                             clave=claves[-1])
+                    incrementos.sumar('movimientos', _sin_nulos(movimiento), None)
+                incrementos.agregar(db, batch)
+                confirmar_lote('archivo.borrar_movimientos', batch, claves)
+            archivados[int(anio)] = len(movimientos_anio)
+    except Exception as e:
+        avisos.error(f"Error al archivar movimientos: {str(e)}")
+    return archivados
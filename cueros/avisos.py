@@ -0,0 +1,50 @@
+"""Salida de errores y avisos de la capa de datos.
+
+Fuera de Streamlit van al logging; la app los redirige a st.error / st.warning
+con configurar(). En hilos auxiliares se pueden capturar() para mostrarlos
+después desde el hilo que dibuja la página.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("cueros")
+
+_manejadores = {
+    'error': logger.error,
+    'aviso': logger.warning,
+}
+_local = threading.local()
+
+def configurar(error=None, aviso=None):
+    if error is not None:
+        _manejadores['error'] = error
+    if aviso is not None:
+        _manejadores['aviso'] = aviso
+
+def _emitir(tipo, mensaje):
+    capturados = getattr(_local, 'capturados', None)
+    if capturados is not None:
+        capturados.append((tipo, mensaje))
+    else:
+        _manejadores[tipo](mensaje)
+
+def error(mensaje):
+    _emitir('error', mensaje)
+
+def aviso(mensaje):
+    _emitir('aviso', mensaje)
+
+@contextmanager
+def capturar():
+    """Junta los mensajes emitidos en este hilo en una lista en vez de mostrarlos"""
+    previos = getattr(_local, 'capturados', None)
+    _local.capturados = []
+    try:
+        yield _local.capturados
+    finally:
+        _local.capturados = previos
+
+def reemitir(mensajes):
+    for tipo, mensaje in mensajes:
+        _manejadores[tipo](mensaje)
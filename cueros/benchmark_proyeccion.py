@@ -0,0 +1,108 @@
+"""Mide cuánto ahorran las lecturas proyectadas (select) frente a leer documentos completos.
+
+Uso:
+    python -m cueros.benchmark_proyeccion                 # contra Firestore (colección movimientos)
+    python -m cueros.benchmark_proyeccion --sintetico 50000
+
+Para cada variante informa documentos, bytes de los campos (tamaño del Document
+protobuf, lo que viaja por la red) y tiempos de lectura y de armado del DataFrame.
+Con --sintetico no se conecta: genera movimientos, los serializa como Document y
+mide solo decodificación y DataFrame.
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+from google.cloud.firestore_v1 import _helpers
+from google.cloud.firestore_v1.types import Document
+
+from .datos import CAMPOS_RESUMEN
+
+def _bytes_documento(datos):
+    documento = Document(fields=_helpers.encode_dict(datos))
+    return len(Document.serialize(documento))
+
+def _resultado(variante, documentos, bytes_totales, segundos_lectura, segundos_df):
+    return {
+        'variante': variante,
+        'documentos': documentos,
+        'bytes': bytes_totales,
+        'bytes_por_doc': bytes_totales / documentos if documentos else 0,
+        'lectura_ms': segundos_lectura * 1000,
+        'dataframe_ms': segundos_df * 1000,
+    }
+
+def medir_firestore(db, coleccion='movimientos', campos=CAMPOS_RESUMEN, limite=None):
+    """Lee la colección completa y proyectada y devuelve las mediciones de cada variante"""
+    resultados = []
+    for variante, consulta in (
+        ('completo', db.collection(coleccion)),
+        ('proyectado', db.collection(coleccion).select(list(campos))),
+    ):
+        if limite:
+            consulta = consulta.limit(limite)
+        inicio = time.perf_counter()
+        datos = [doc.to_dict() for doc in consulta.stream()]
+        segundos_lectura = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        pd.DataFrame(datos)
+        segundos_df = time.perf_counter() - inicio
+        bytes_totales = sum(_bytes_documento(d) for d in datos)
+        resultados.append(_resultado(variante, len(datos), bytes_totales, segundos_lectura, segundos_df))
+    return resultados
+
+def movimiento_sintetico(i):
+    return {
+        'fecha': f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} 10:00:00",
+        'tipo': random.choice(['Ingreso (Compra)', 'Egreso (Venta)']),
+        'producto': random.choice(['Sal', 'Cueros']),
+        'descripcion': f"Cliente {i % 300}",
+        'cantidad': random.randint(1, 200),
+        'peso_kg': round(random.uniform(10, 4000), 1),
+        'precio_total': round(random.uniform(1000, 900000), 2),
+        'neto': round(random.uniform(1000, 700000), 2),
+        'iva_rate': 0.21,
+        'modo_pago': random.choice(['Efectivo', 'Transferencia', 'Cheque']),
+        'detalle_pago': f"Transferencia Banco Nación ref. {random.randint(10**8, 10**9)} - entrega en planta, retira chofer",
+        'dinero_a_cuenta': 0.0,
+        'estado_pago': random.choice(['Pagado', 'Impago']),
+    }
+
+def medir_sintetico(cantidad, campos=CAMPOS_RESUMEN):
+    """Igual que medir_firestore, sobre documentos generados y serializados en memoria"""
+    completos = [movimiento_sintetico(i) for i in range(cantidad)]
+    resultados = []
+    for variante, documentos in (
+        ('completo', completos),
+        ('proyectado', [{c: d[c] for c in campos if c in d} for d in completos]),
+    ):
+        serializados = [Document.serialize(Document(fields=_helpers.encode_dict(d))) for d in documentos]
+        inicio = time.perf_counter()
+        datos = [_helpers.decode_dict(Document.deserialize(b).fields, None) for b in serializados]
+        segundos_lectura = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        pd.DataFrame(datos)
+        segundos_df = time.perf_counter() - inicio
+        resultados.append(_resultado(variante, len(datos), sum(len(b) for b in serializados), segundos_lectura, segundos_df))
+    return resultados
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara lecturas completas y proyectadas de movimientos")
+    parser.add_argument('--sintetico', type=int, metavar='N', help="generar N movimientos en memoria en vez de leer Firestore")
+    parser.add_argument('--limite', type=int, help="leer como máximo N documentos de Firestore")
+    args = parser.parse_args(argv)
+    if args.sintetico:
+        resultados = medir_sintetico(args.sintetico)
+    else:
+        from .conexion import obtener_db
+        resultados = medir_firestore(obtener_db(), limite=args.limite)
+    tabla = pd.DataFrame(resultados).set_index('variante')
+    print(tabla.round(1).to_string())
+    completo, proyectado = tabla.loc['completo'], tabla.loc['proyectado']
+    for columna, nombre in (('bytes', 'Bytes'), ('lectura_ms', 'Lectura'), ('dataframe_ms', 'DataFrame')):
+        if completo[columna]:
+            print(f"{nombre}: {100 * (1 - proyectado[columna] / completo[columna]):.0f}% menos con la proyección")
+
+if __name__ == '__main__':
+    main()
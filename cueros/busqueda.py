@@ -0,0 +1,151 @@
+"""Índice de búsqueda en memoria (por prefijo, sin acentos) sobre clientes y movimientos"""
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+
+# Campos indexados por colección y su peso en el puntaje
+CAMPOS_BUSQUEDA = {
+    'clientes': {'nombre': 3, 'contacto': 2, 'notas': 1},
+    'movimientos': {'descripcion': 3, 'detalle_pago': 1},
+}
+
+_PALABRA = re.compile(r"\w+")
+
+def normalizar(texto):
+    """Minúsculas y sin acentos: 'Curtiembre Peñón' -> 'curtiembre penon'"""
+    descompuesto = unicodedata.normalize('NFKD', str(texto))
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+def tokenizar(texto):
+    if texto is None or texto != texto:
+        return []
+    return _PALABRA.findall(normalizar(texto))
+
+class IndiceBusqueda:
+    """Índice invertido con vocabulario ordenado para búsquedas por prefijo.
+
+    Cada término guarda los documentos que lo contienen agrupados por el peso del
+    campo donde aparece, y el vocabulario se mantiene ordenado para encontrar con
+    bisect los términos que empiezan con un prefijo. El puntaje de una consulta se
+    arma con operaciones de conjuntos por nivel de puntaje, sin recorrer documento
+    por documento. Se actualiza de a un documento y se engancha a AlmacenDatos.suscribir.
+    """
+
+    def __init__(self, campos=CAMPOS_BUSQUEDA):
+        self._campos = campos
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._vocabulario = []
+        self._terminos_doc = {}
+        self._documentos = {}
+        self._etiquetas = {}
+
+    def __len__(self):
+        return len(self._documentos)
+
+    def actualizar(self, coleccion, doc_id, datos):
+        """Indexa (o reindexa) un documento; datos=None lo quita del índice"""
+        clave = (coleccion, str(doc_id))
+        terminos = {}
+        if datos is not None:
+            for campo, peso in self._campos[coleccion].items():
+                for termino in tokenizar(datos.get(campo)):
+                    terminos[termino] = max(peso, terminos.get(termino, 0))
+        with self._lock:
+            self._quitar(clave)
+            if datos is None:
+                return
+            for termino, peso in terminos.items():
+                por_peso = self._postings.get(termino)
+                if por_peso is None:
+                    por_peso = self._postings[termino] = {}
+                    bisect.insort(self._vocabulario, termino)
+                por_peso.setdefault(peso, set()).add(clave)
+            self._terminos_doc[clave] = terminos
+            self._documentos[clave] = {campo: datos.get(campo) for campo in self._campos[coleccion]}
+            principal = next(iter(self._campos[coleccion]))
+            self._etiquetas[clave] = normalizar(datos.get(principal) or '')
+
+    def eliminar(self, coleccion, doc_id):
+        self.actualizar(coleccion, doc_id, None)
+
+    def _quitar(self, clave):
+        for termino, peso in self._terminos_doc.pop(clave, {}).items():
+            por_peso = self._postings[termino]
+            por_peso[peso].discard(clave)
+            if not por_peso[peso]:
+                del por_peso[peso]
+            if not por_peso:
+                del self._postings[termino]
+                posicion = bisect.bisect_left(self._vocabulario, termino)
+                del self._vocabulario[posicion]
+        self._documentos.pop(clave, None)
+        self._etiquetas.pop(clave, None)
+
+    def aplicar_cambios(self, coleccion, documentos, reemplazar=False):
+        """Callback para AlmacenDatos.suscribir: {doc_id: datos o None}"""
+        if reemplazar:
+            with self._lock:
+                for clave in [c for c in self._terminos_doc if c[0] == coleccion]:
+                    self._quitar(clave)
+        for doc_id, datos in documentos.items():
+            self.actualizar(coleccion, doc_id, datos)
+
+    def _terminos_con_prefijo(self, prefijo):
+        inicio = bisect.bisect_left(self._vocabulario, prefijo)
+        fin = bisect.bisect_left(self._vocabulario, prefijo + '\uffff', inicio)
+        return self._vocabulario[inicio:fin]
+
+    def _niveles(self, prefijo):
+        """{puntaje: documentos} para un término de la consulta; cada documento queda en su mejor nivel"""
+        niveles = {}
+        for termino in self._terminos_con_prefijo(prefijo):
+            # La coincidencia exacta vale el doble que la de prefijo
+            factor = 2 if termino == prefijo else 1
+            for peso, claves in self._postings[termino].items():
+                niveles.setdefault(peso * factor, set()).update(claves)
+        vistos = set()
+        for puntaje in sorted(niveles, reverse=True):
+            niveles[puntaje] -= vistos
+            vistos |= niveles[puntaje]
+        return {puntaje: claves for puntaje, claves in niveles.items() if claves}
+
+    def buscar(self, consulta, colecciones=None, limite=20):
+        """Documentos que contienen todos los términos de la consulta (como prefijo), ordenados por puntaje.
+
+        A igual puntaje se ordena alfabéticamente por el campo principal (nombre o
+        descripción). Devuelve dicts con coleccion, id, puntaje y los campos indexados.
+        """
+        prefijos = set(tokenizar(consulta))
+        if not prefijos or limite <= 0:
+            return []
+        with self._lock:
+            # Puntaje total -> documentos; cada término nuevo combina sus niveles con los anteriores
+            grupos = None
+            for prefijo in sorted(prefijos, key=len, reverse=True):
+                niveles = self._niveles(prefijo)
+                if grupos is None:
+                    grupos = niveles
+                else:
+                    combinados = {}
+                    for total, claves in grupos.items():
+                        for puntaje, nivel in niveles.items():
+                            comunes = claves & nivel
+                            if comunes:
+                                combinados.setdefault(total + puntaje, set()).update(comunes)
+                    grupos = combinados
+                if not grupos:
+                    return []
+            resultados = []
+            for puntaje in sorted(grupos, reverse=True):
+                claves = grupos[puntaje]
+                if colecciones is not None:
+                    claves = [clave for clave in claves if clave[0] in colecciones]
+                faltan = limite - len(resultados)
+                for clave in heapq.nsmallest(faltan, claves, key=self._etiquetas.__getitem__):
+                    resultados.append({'coleccion': clave[0], 'id': clave[1], 'puntaje': puntaje, **self._documentos[clave]})
+                if len(resultados) >= limite:
+                    break
+            return resultados
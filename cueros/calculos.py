@@ -0,0 +1,251 @@
+"""Cálculos de stock y saldos sobre los DataFrames de movimientos y pagos"""
+import numpy as np
+import pandas as pd
+
+from .dinero import a_pesos, centavos_documento, columna_centavos, sumar_centavos
+
+# Tramos de antigüedad de deudas, en días desde la fecha del movimiento
+TRAMOS_ANTIGUEDAD = ('0-30', '31-60', '61-90', '90+')
+_LIMITES_TRAMOS = np.array([30, 60, 90])
+
+def metricas_stock(df_movimientos):
+    """Stock y finanzas de un conjunto de movimientos (ya filtrado si corresponde)"""
+    metricas = {
+        'stock_unidades': 0,
+        'stock_kg': 0,
+        'deuda_compras': 0,
+        'a_cobrar_ventas': 0,
+        'cobrado_ventas': 0,
+        'pagado_compras': 0,
+        'dinero_esperado': 0,
+    }
+    if df_movimientos.empty or 'tipo' not in df_movimientos.columns:
+        return metricas
+    ingresos = df_movimientos[df_movimientos['tipo'] == 'Ingreso (Compra)']
+    egresos = df_movimientos[df_movimientos['tipo'] == 'Egreso (Venta)']
+
+    if 'cantidad' in df_movimientos.columns:
+        metricas['stock_unidades'] = ingresos['cantidad'].sum() - egresos['cantidad'].sum()
+    if 'peso_kg' in df_movimientos.columns:
+        metricas['stock_kg'] = ingresos['peso_kg'].sum() - egresos['peso_kg'].sum()
+
+    if 'estado_pago' in df_movimientos.columns and 'precio_total' in df_movimientos.columns:
+        # Sumas exactas en centavos (int64); se pasan a pesos al final
+        tipo = df_movimientos['tipo']
+        estado = df_movimientos['estado_pago']
+        def sumar(tipo_movimiento, estado_pago):
+            return sumar_centavos(df_movimientos, 'precio_total', (tipo == tipo_movimiento) & (estado == estado_pago))
+        # Deudas (lo que debo pagar por compras impagas) y lo que me deben por ventas impagas
+        deuda_compras = sumar('Ingreso (Compra)', 'Impago')
+        a_cobrar_ventas = sumar('Egreso (Venta)', 'Impago')
+        # Dinero esperado (cobrado ventas - pagado compras)
+        cobrado_ventas = sumar('Egreso (Venta)', 'Pagado')
+        pagado_compras = sumar('Ingreso (Compra)', 'Pagado')
+        metricas['deuda_compras'] = a_pesos(deuda_compras)
+        metricas['a_cobrar_ventas'] = a_pesos(a_cobrar_ventas)
+        metricas['cobrado_ventas'] = a_pesos(cobrado_ventas)
+        metricas['pagado_compras'] = a_pesos(pagado_compras)
+        metricas['dinero_esperado'] = a_pesos(cobrado_ventas - pagado_compras)
+    return metricas
+
+def _sumable(valor):
+    """Valor numérico para acumular (los enteros siguen enteros); lo que no es número cuenta 0"""
+    if isinstance(valor, bool):
+        return int(valor)
+    if isinstance(valor, int):
+        return valor
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return 0
+    return 0 if numero != numero else numero
+
+class AcumuladorMovimientos:
+    """Sumas de movimientos agrupadas por (tipo, producto, estado_pago, cliente), sin guardar las filas.
+
+    Se alimenta documento a documento (por ejemplo, las páginas de un escaneo) y
+    ocupa memoria proporcional a la cantidad de grupos, no de movimientos. Da las
+    mismas métricas que metricas_stock y balance_cliente, con los mismos filtros
+    que la vista (cliente, producto, estado de pago).
+    """
+
+    def __init__(self):
+        # (tipo, producto, estado_pago, cliente) -> [cantidad, peso_kg, precio_total en centavos, movimientos]
+        self._grupos = {}
+        self._saldos_cuenta = {}
+        self.movimientos = 0
+        self.pagos = 0
+
+    def agregar(self, datos):
+        clave = (datos.get('tipo'), datos.get('producto'), datos.get('estado_pago'), datos.get('descripcion'))
+        grupo = self._grupos.get(clave)
+        if grupo is None:
+            grupo = self._grupos[clave] = [0, 0, 0, 0]
+        grupo[0] += _sumable(datos.get('cantidad'))
+        grupo[1] += _sumable(datos.get('peso_kg'))
+        grupo[2] += centavos_documento(datos, 'precio_total')
+        grupo[3] += 1
+        self.movimientos += 1
+
+    def agregar_pago(self, datos):
+        monto = centavos_documento(datos, 'monto')
+        cliente = datos.get('cliente_nombre')
+        self._saldos_cuenta[cliente] = self._saldos_cuenta.get(cliente, 0) + (monto if datos.get('tipo') == 'ingreso' else -monto)
+        self.pagos += 1
+
+    def consumir(self, documentos):
+        for datos in documentos:
+            self.agregar(datos)
+        return self
+
+    def __len__(self):
+        return len(self._grupos)
+
+    def clientes(self):
+        nombres = {clave[3] for clave in self._grupos} | set(self._saldos_cuenta)
+        return sorted(n for n in nombres if n is not None)
+
+    def _sumar(self, tipo, estado_pago=None, cliente=None, producto=None, indice=2):
+        return sum(grupo[indice] for (t, p, e, c), grupo in self._grupos.items()
+                   if t == tipo and (estado_pago is None or e == estado_pago)
+                   and (cliente is None or c == cliente) and (producto is None or p == producto))
+
+    def metricas(self, cliente=None, producto=None, estado_pago=None):
+        """Lo mismo que metricas_stock sobre los movimientos que pasan los filtros"""
+        def sumar(tipo, indice=2, estado=None):
+            if estado_pago is not None and estado is not None and estado != estado_pago:
+                return 0
+            return self._sumar(tipo, estado if estado is not None else estado_pago, cliente, producto, indice)
+        centavos = {
+            'deuda_compras': sumar('Ingreso (Compra)', estado='Impago'),
+            'a_cobrar_ventas': sumar('Egreso (Venta)', estado='Impago'),
+            'cobrado_ventas': sumar('Egreso (Venta)', estado='Pagado'),
+            'pagado_compras': sumar('Ingreso (Compra)', estado='Pagado'),
+        }
+        centavos['dinero_esperado'] = centavos['cobrado_ventas'] - centavos['pagado_compras']
+        metricas = {
+            'stock_unidades': sumar('Ingreso (Compra)', 0) - sumar('Egreso (Venta)', 0),
+            'stock_kg': sumar('Ingreso (Compra)', 1) - sumar('Egreso (Venta)', 1),
+        }
+        metricas.update({campo: a_pesos(valor) for campo, valor in centavos.items()})
+        return metricas
+
+    def balance(self, cliente):
+        """Lo mismo que balance_cliente para un cliente"""
+        centavos = {
+            'total_comprado': self._sumar('Ingreso (Compra)', cliente=cliente),
+            'total_vendido': self._sumar('Egreso (Venta)', cliente=cliente),
+            'deuda_compras': self._sumar('Ingreso (Compra)', 'Impago', cliente),
+            'deuda_ventas': self._sumar('Egreso (Venta)', 'Impago', cliente),
+            'saldo_cuenta': self._saldos_cuenta.get(cliente, 0),
+        }
+        centavos['balance_final'] = centavos['deuda_ventas'] - centavos['deuda_compras'] + centavos['saldo_cuenta']
+        return {campo: a_pesos(valor) for campo, valor in centavos.items()}
+
+def _saldo_pagos_centavos(df_pagos):
+    if df_pagos.empty or not {'tipo', 'monto'} <= set(df_pagos.columns):
+        return 0
+    montos = columna_centavos(df_pagos, 'monto')
+    return int(montos.where(df_pagos['tipo'] == 'ingreso', -montos).sum())
+
+def saldo_pagos(df_pagos):
+    """Saldo a cuenta: ingresos menos egresos de pagos a cuenta"""
+    return a_pesos(_saldo_pagos_centavos(df_pagos))
+
+def balance_cliente(df_cliente, df_pagos_cliente):
+    """Totales y balance de un cliente (positivo: me debe; negativo: le debo)"""
+    centavos = {
+        'total_comprado': 0,
+        'total_vendido': 0,
+        'deuda_compras': 0,
+        'deuda_ventas': 0,
+        'saldo_cuenta': _saldo_pagos_centavos(df_pagos_cliente),
+    }
+    if not df_cliente.empty and {'tipo', 'estado_pago', 'precio_total'} <= set(df_cliente.columns):
+        compras = df_cliente['tipo'] == 'Ingreso (Compra)'
+        ventas = df_cliente['tipo'] == 'Egreso (Venta)'
+        impagos = df_cliente['estado_pago'] == 'Impago'
+        centavos['total_comprado'] = sumar_centavos(df_cliente, 'precio_total', compras)
+        centavos['total_vendido'] = sumar_centavos(df_cliente, 'precio_total', ventas)
+        centavos['deuda_compras'] = sumar_centavos(df_cliente, 'precio_total', compras & impagos)
+        centavos['deuda_ventas'] = sumar_centavos(df_cliente, 'precio_total', ventas & impagos)
+    centavos['balance_final'] = centavos['deuda_ventas'] - centavos['deuda_compras'] + centavos['saldo_cuenta']
+    return {campo: a_pesos(valor) for campo, valor in centavos.items()}
+
+CAMPOS_BALANCE = ('total_comprado', 'total_vendido', 'deuda_compras', 'deuda_ventas', 'saldo_cuenta', 'balance_final')
+
+def resumen_clientes(df_movimientos, df_pagos):
+    """balance_cliente de todos los clientes (de movimientos y de pagos a cuenta), del mayor balance al menor.
+
+    Se agrupa una sola vez por cliente en centavos, en lugar de filtrar las tablas
+    una vez por cliente.
+    """
+    nombres = set()
+    if not df_movimientos.empty and 'descripcion' in df_movimientos.columns:
+        nombres.update(df_movimientos['descripcion'].dropna())
+    if not df_pagos.empty and 'cliente_nombre' in df_pagos.columns:
+        nombres.update(df_pagos['cliente_nombre'].dropna())
+    centavos = pd.DataFrame(0, index=pd.Index(sorted(nombres), name='cliente'), columns=list(CAMPOS_BALANCE), dtype='int64')
+    if nombres and {'descripcion', 'tipo', 'estado_pago', 'precio_total'} <= set(df_movimientos.columns):
+        montos = columna_centavos(df_movimientos, 'precio_total')
+        compras = df_movimientos['tipo'] == 'Ingreso (Compra)'
+        ventas = df_movimientos['tipo'] == 'Egreso (Venta)'
+        impagos = df_movimientos['estado_pago'] == 'Impago'
+        partes = pd.DataFrame({
+            'total_comprado': montos.where(compras, 0),
+            'total_vendido': montos.where(ventas, 0),
+            'deuda_compras': montos.where(compras & impagos, 0),
+            'deuda_ventas': montos.where(ventas & impagos, 0),
+        })
+        sumas = partes.groupby(df_movimientos['descripcion']).sum()
+        centavos.loc[sumas.index, sumas.columns] = sumas
+    if nombres and {'cliente_nombre', 'tipo', 'monto'} <= set(df_pagos.columns):
+        montos = columna_centavos(df_pagos, 'monto')
+        saldos = montos.where(df_pagos['tipo'] == 'ingreso', -montos).groupby(df_pagos['cliente_nombre']).sum()
+        centavos.loc[saldos.index, 'saldo_cuenta'] = saldos
+    centavos['balance_final'] = centavos['deuda_ventas'] - centavos['deuda_compras'] + centavos['saldo_cuenta']
+    resumen = a_pesos(centavos).reset_index()
+    return resumen.sort_values('balance_final', ascending=False)
+
+def antiguedad_deudas(df_movimientos, hoy=None):
+    """Deudas impagas por cliente y tramo de antigüedad (0-30, 31-60, 61-90, 90+ días).
+
+    Una fila por cliente y sentido ('Por cobrar' para ventas, 'Por pagar' para
+    compras) con el monto de cada tramo, el total, la cantidad de movimientos y
+    los días del más viejo. Se calcula en una pasada vectorizada: la fecha se
+    convierte una vez y el tramo sale de searchsorted sobre los días.
+    """
+    columnas = ['cliente', 'sentido', *TRAMOS_ANTIGUEDAD, 'total', 'movimientos', 'dias_max']
+    requeridas = {'fecha', 'tipo', 'descripcion', 'precio_total', 'estado_pago'}
+    if df_movimientos.empty or not requeridas <= set(df_movimientos.columns):
+        return pd.DataFrame(columns=columnas)
+    impagos = df_movimientos[(df_movimientos['estado_pago'] == 'Impago')
+                             & df_movimientos['tipo'].isin(['Egreso (Venta)', 'Ingreso (Compra)'])]
+    if impagos.empty:
+        return pd.DataFrame(columns=columnas)
+    hoy = pd.Timestamp(hoy).normalize() if hoy is not None else pd.Timestamp.now().normalize()
+    fechas = pd.to_datetime(impagos['fecha'].astype(str), format='ISO8601', errors='coerce')
+    # Sin fecha válida no se puede saber la antigüedad: se la trata como la más vieja
+    dias = (hoy - fechas.dt.normalize()).dt.days.fillna(_LIMITES_TRAMOS[-1] + 1).clip(lower=0).astype(int).to_numpy()
+    tramos = np.searchsorted(_LIMITES_TRAMOS, dias, side='left')
+    montos = columna_centavos(impagos, 'precio_total').to_numpy()
+    largo = pd.DataFrame({
+        'cliente': impagos['descripcion'].fillna('').astype(str).to_numpy(),
+        'sentido': np.where(impagos['tipo'].to_numpy() == 'Egreso (Venta)', 'Por cobrar', 'Por pagar'),
+        'tramo': pd.Categorical.from_codes(tramos, TRAMOS_ANTIGUEDAD),
+        'monto': montos,
+        'dias': dias,
+    })
+    claves = ['cliente', 'sentido']
+    reporte = largo.pivot_table(index=claves, columns='tramo', values='monto', aggfunc='sum', fill_value=0, observed=False)
+    reporte = reporte.reindex(columns=list(TRAMOS_ANTIGUEDAD), fill_value=0)
+    reporte.columns = list(TRAMOS_ANTIGUEDAD)
+    agrupado = largo.groupby(claves, sort=False)
+    reporte['total'] = reporte[list(TRAMOS_ANTIGUEDAD)].sum(axis=1)
+    reporte['movimientos'] = agrupado.size()
+    reporte['dias_max'] = agrupado['dias'].max()
+    reporte = reporte.reset_index().sort_values(['sentido', 'total'], ascending=[True, False], ignore_index=True)
+    # Las sumas se hicieron en centavos (int64): recién aquí pasan a pesos
+    for columna in [*TRAMOS_ANTIGUEDAD, 'total']:
+        reporte[columna] = reporte[columna] / 100
+    return reporte[columnas]
@@ -0,0 +1,190 @@
+"""Registro de cambios append-only, instantáneas de vistas derivadas y reproducción.
+
+Cada escritura de la cola (y del archivo anual) agrega en el mismo lote un evento
+a la colección 'cambios' con el documento como estaba y como queda. Una vista
+derivada (stock por producto, saldos por cliente) es la suma de los aportes de
+cada documento, así que un evento se aplica restando el aporte anterior y sumando
+el nuevo. Las instantáneas guardan el estado de cada vista y el momento del último
+evento incluido: reconstruir cuesta lo que los eventos posteriores, no la historia.
+
+Uso:
+    python -m cueros.cambios --vista saldos [--instantanea]
+"""
+import argparse
+import json
+
+from .costos import TIPO_COMPRA, TIPO_VENTA, _numero
+from .dinero import a_pesos, centavos_documento
+
+COLECCION_CAMBIOS = 'cambios'
+COLECCION_INSTANTANEAS = 'instantaneas'
+# Versión del estado guardado; una instantánea de otra versión se descarta (los saldos pasaron a centavos)
+FORMATO_INSTANTANEA = 2
+
+def _aporte_stock(coleccion, datos):
+    if coleccion not in ('movimientos', 'saldos_apertura'):
+        return {}
+    signo = {TIPO_COMPRA: 1, TIPO_VENTA: -1}.get(datos.get('tipo'), 0)
+    return {str(datos.get('producto') or ''): {
+        'unidades': signo * _numero(datos.get('cantidad')),
+        'kg': signo * _numero(datos.get('peso_kg')),
+    }}
+
+def _aporte_saldos(coleccion, datos):
+    if coleccion == 'pagos_cuenta':
+        monto = centavos_documento(datos, 'monto')
+        return {str(datos.get('cliente_nombre') or ''): {'saldo_cuenta_centavos': monto if datos.get('tipo') == 'ingreso' else -monto}}
+    if coleccion not in ('movimientos', 'saldos_apertura') or datos.get('estado_pago') != 'Impago':
+        return {}
+    campo = {TIPO_COMPRA: 'deuda_compras_centavos', TIPO_VENTA: 'deuda_ventas_centavos'}.get(datos.get('tipo'))
+    if campo is None:
+        return {}
+    return {str(datos.get('descripcion') or ''): {campo: centavos_documento(datos, 'precio_total')}}
+
+# Vista -> aporte(coleccion, datos) de un documento: {clave: {campo: valor}}
+VISTAS = {
+    'stock': _aporte_stock,
+    'saldos': _aporte_saldos,
+}
+
+def _sumar(estado, aportes, signo):
+    for clave, valores in aportes.items():
+        destino = estado.setdefault(clave, {})
+        for campo, valor in valores.items():
+            # Los centavos son enteros y siguen enteros: la suma es exacta
+            destino[campo] = destino.get(campo, 0) + signo * valor
+
+def aplicar_evento(vista, estado, evento):
+    """Aplica un evento a una vista: resta el aporte del documento anterior y suma el del nuevo"""
+    aporte = VISTAS[vista]
+    if evento.get('anterior'):
+        _sumar(estado, aporte(evento['coleccion'], evento['anterior']), -1)
+    if evento.get('datos'):
+        _sumar(estado, aporte(evento['coleccion'], evento['datos']), 1)
+    return estado
+
+def estado_desde_documentos(vista, documentos):
+    """Estado de una vista calculado desde cero: {coleccion: iterable de datos}"""
+    estado = {}
+    aporte = VISTAS[vista]
+    for coleccion, docs in documentos.items():
+        for datos in docs:
+            _sumar(estado, aporte(coleccion, datos), 1)
+    return estado
+
+def _sin_id(datos):
+    # El almacén agrega el ID del documento como campo 'id'; en el evento ya va en doc_id
+    if datos is None:
+        return None
+    return {campo: valor for campo, valor in datos.items() if campo != 'id'}
+
+class RegistroCambios:
+    """Escribe eventos en 'cambios' y reconstruye vistas desde la última instantánea"""
+
+    def __init__(self, db, politica):
+        self._db = db
+        self._politica = politica
+
+    def agregar(self, batch, operacion, coleccion, doc_id, anterior, datos, clave=None):
+        """Suma al lote el evento de una escritura; con clave, el evento es idempotente (create)"""
+        from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+        cambios = self._db.collection(COLECCION_CAMBIOS)
+        ref = cambios.document(clave) if clave else cambios.document()
+        batch.create(ref, {
+            'momento': SERVER_TIMESTAMP,
+            'operacion': operacion,
+            'coleccion': coleccion,
+            'doc_id': str(doc_id),
+            'anterior': _sin_id(anterior),
+            'datos': _sin_id(datos),
+        })
+
+    def registrado(self, clave):
+        """Si ya existe el evento con esa clave, es decir, si se aplicó el lote que lo llevaba"""
+        ref = self._db.collection(COLECCION_CAMBIOS).document(clave)
+        return self._politica.ejecutar('cambios.registrado', lambda plazo: ref.get(retry=None, timeout=plazo)).exists
+
+    def instantanea(self, vista):
+        """Última instantánea guardada de la vista, o None (también si es de otro formato)"""
+        ref = self._db.collection(COLECCION_INSTANTANEAS).document(vista)
+        doc = self._politica.ejecutar('cambios.instantanea', lambda plazo: ref.get(retry=None, timeout=plazo))
+        if not doc.exists:
+            return None
+        instantanea = doc.to_dict()
+        if instantanea.get('formato') != FORMATO_INSTANTANEA:
+            return None
+        instantanea['estado'] = json.loads(instantanea['estado'])
+        return instantanea
+
+    def eventos_desde(self, momento=None):
+        """Eventos posteriores a momento (todos si es None), en orden de confirmación"""
+        consulta = self._db.collection(COLECCION_CAMBIOS)
+        if momento is not None:
+            consulta = consulta.where('momento', '>', momento)
+        consulta = consulta.order_by('momento')
+        documentos = self._politica.ejecutar('cambios.eventos', lambda plazo: list(consulta.stream(retry=None, timeout=plazo)))
+        eventos = []
+        for documento in documentos:
+            evento = documento.to_dict()
+            evento['id'] = documento.id
+            eventos.append(evento)
+        return eventos
+
+    def ultimo_momento(self):
+        consulta = self._db.collection(COLECCION_CAMBIOS).order_by('momento', direction='DESCENDING').limit(1)
+        documentos = self._politica.ejecutar('cambios.ultimo', lambda plazo: list(consulta.stream(retry=None, timeout=plazo)))
+        return documentos[0].to_dict().get('momento') if documentos else None
+
+    def reconstruir(self, vista):
+        """Estado de la vista desde la última instantánea más los eventos posteriores.
+
+        Devuelve (estado, informe) con el momento de la instantánea, los eventos
+        aplicados y el momento del último.
+        """
+        instantanea = self.instantanea(vista)
+        estado = instantanea['estado'] if instantanea else {}
+        desde = instantanea['hasta'] if instantanea else None
+        eventos = self.eventos_desde(desde)
+        for evento in eventos:
+            aplicar_evento(vista, estado, evento)
+        informe = {
+            'vista': vista,
+            'instantanea': instantanea is not None,
+            'desde': desde,
+            'eventos': len(eventos),
+            'hasta': eventos[-1]['momento'] if eventos else desde,
+        }
+        return estado, informe
+
+    def guardar_instantanea(self, vista, estado, hasta):
+        from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+        ref = self._db.collection(COLECCION_INSTANTANEAS).document(vista)
+        datos = {'vista': vista, 'estado': json.dumps(estado), 'hasta': hasta, 'formato': FORMATO_INSTANTANEA, 'creada': SERVER_TIMESTAMP}
+        self._politica.ejecutar('cambios.guardar_instantanea', lambda plazo: ref.set(datos, retry=None, timeout=plazo))
+
+    def instantanea_inicial(self, vista, documentos):
+        """Primera instantánea, desde los documentos actuales (para datos anteriores al registro).
+
+        Se toma como cubierto todo evento hasta el último existente al empezar, así
+        que conviene hacerla sin escrituras en curso.
+        """
+        hasta = self.ultimo_momento()
+        estado = estado_desde_documentos(vista, documentos)
+        self.guardar_instantanea(vista, estado, hasta)
+        return estado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconstruye una vista derivada desde la última instantánea y el registro de cambios")
+    parser.add_argument('--vista', choices=sorted(VISTAS), default='saldos')
+    parser.add_argument('--instantanea', action='store_true', help="guardar una instantánea nueva con el resultado")
+    args = parser.parse_args(argv)
+    from .datos import reconstruir_vista
+    estado, informe = reconstruir_vista(args.vista, guardar=args.instantanea)
+    print(f"{args.vista}: {informe['eventos']} eventos aplicados desde {informe['desde'] or 'el inicio'}")
+    for clave, valores in sorted(estado.items()):
+        print(f"  {clave or '(sin nombre)'}: " + ", ".join(
+            f"{campo.removesuffix('_centavos')} {a_pesos(valor) if campo.endswith('_centavos') else valor:,.2f}"
+            for campo, valor in sorted(valores.items())))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""Prueba de carga: varias sesiones simultáneas de la app contra el Firestore local.
+
+Cada sesión es un AppTest de Streamlit (la app corre sin navegador, en este mismo
+proceso, como en el servidor) que sigue un guion realista: ingresar, filtrar, abrir
+un estado de cuenta, guardar un movimiento y exportar el resumen. Las sesiones
+comparten el almacén, la cola y las cachés del proceso, igual que las reales.
+
+Informa la latencia de cada rerun (p50/p95 por paso y en total), las lecturas de
+Firestore por rerun y la memoria del proceso. Con varias sesiones a la vez, las
+lecturas de un rerun incluyen las de otros que corren en paralelo: el promedio
+total es exacto, el de cada paso es aproximado.
+
+Uso:
+    python -m cueros.carga --sesiones 10 [--repeticiones 2] [--movimientos 20000] [--latencia 0.02]
+"""
+import argparse
+import contextlib
+import hashlib
+import random
+import resource
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from .config import BASE_DIR
+
+APP = BASE_DIR / "gestion_cueros.py"
+SESION_GUARDADA = BASE_DIR / ".session.json"
+USUARIO = 'admin'
+PASSWORD = 'admin'
+
+def memoria_mb():
+    """Memoria residente actual del proceso (o el pico, si no hay /proc)"""
+    try:
+        with open('/proc/self/status', encoding='ascii') as estado:
+            for linea in estado:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return memoria_pico_mb()
+
+def memoria_pico_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def poblar(db, movimientos=5000, clientes=60, pagos=500, semilla=0):
+    """Carga en el Firestore local un usuario admin, clientes, movimientos y pagos a cuenta sintéticos"""
+    from .benchmark_proyeccion import movimiento_sintetico
+    from .dinero import con_centavos
+    random.seed(semilla)
+    nombres = [f"Cliente {i}" for i in range(clientes)]
+    db.cargar('usuarios', {'admin': {
+        'usuario': USUARIO, 'password_hash': hashlib.sha256(PASSWORD.encode('utf-8')).hexdigest(),
+        'rol': 'admin', 'activo': 1, 'fecha_creacion': '2024-01-01 00:00:00',
+    }})
+    db.cargar('clientes', {f"c{i:05d}": {
+        'nombre': nombre, 'tipo': 'Cliente' if i % 3 else 'Proveedor', 'contacto': '', 'telefono': '',
+        'email': '', 'direccion': '', 'notas': '', 'activo': 1, 'fecha_creacion': '2024-01-01 00:00:00',
+    } for i, nombre in enumerate(nombres)})
+    db.cargar('movimientos', {f"m{i:08d}": con_centavos('movimientos', {**movimiento_sintetico(i), 'descripcion': nombres[i % clientes]})
+                              for i in range(movimientos)})
+    db.cargar('pagos_cuenta', {f"p{i:07d}": con_centavos('pagos_cuenta', {
+        'fecha': f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} 12:00:00", 'cliente_nombre': random.choice(nombres),
+        'monto': round(random.uniform(1000, 50000), 2), 'concepto': 'Pago a cuenta',
+        'tipo': random.choice(['ingreso', 'egreso']),
+    }) for i in range(pagos)})
+
+@contextlib.contextmanager
+def _runtime_compartido():
+    """Mantiene visible el runtime simulado mientras corren varias sesiones a la vez.
+
+    AppTest pone su runtime simulado en Runtime._instance al empezar cada rerun y lo
+    borra al terminar: con sesiones en paralelo, el final de un rerun se lo quitaba
+    a los demás. Mientras dure el bloque, Runtime.instance() devuelve el último que
+    se vio.
+    """
+    from streamlit.runtime import Runtime
+    instance, exists = Runtime.__dict__['instance'], Runtime.__dict__['exists']
+    ultimo = []
+
+    def vigente(cls):
+        if cls._instance is not None:
+            ultimo[:] = [cls._instance]
+        return cls._instance or (ultimo[0] if ultimo else None)
+
+    def instancia(cls):
+        runtime = vigente(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instancia)
+    Runtime.exists = classmethod(lambda cls: vigente(cls) is not None)
+    try:
+        yield
+    finally:
+        Runtime.instance, Runtime.exists = instance, exists
+
+def _buscar(elementos, etiqueta):
+    return next((elemento for elemento in elementos if elemento.label == etiqueta), None)
+
+class SesionSimulada:
+    """Una sesión de la app manejada por un guion; registra cada rerun como (paso, segundos, lecturas)"""
+
+    def __init__(self, db, azar, timeout=120):
+        from streamlit.testing.v1 import AppTest
+        self._db = db
+        self._azar = azar
+        self.app = AppTest.from_file(str(APP), default_timeout=timeout)
+        self.reruns = []
+        self.errores = []
+
+    def _rerun(self, paso):
+        lecturas = self._db.contadores()['lecturas']
+        inicio = time.perf_counter()
+        self.app.run()
+        segundos = time.perf_counter() - inicio
+        self.reruns.append((paso, segundos, self._db.contadores()['lecturas'] - lecturas))
+        self.errores.extend(f"{paso}: {excepcion.message}" for excepcion in self.app.exception)
+
+    def ingresar(self):
+        self._rerun('inicio')
+        boton = _buscar(self.app.button, "Ingresar")
+        if boton is None:
+            # Ya entró (otra sesión dejó guardada la sesión en disco, como en la app real)
+            return
+        self.app.text_input(key='login_user').input(USUARIO)
+        self.app.text_input(key='login_pass').input(PASSWORD)
+        boton.click()
+        self._rerun('ingresar')
+
+    def _elegir(self, clave, paso):
+        selector = self.app.selectbox(key=clave)
+        opciones = [o for o in selector.options if o != selector.value] or selector.options
+        selector.select(self._azar.choice(opciones))
+        self._rerun(paso)
+
+    def filtrar(self):
+        for clave in ('filtro_pago', 'filtro_producto', 'filtro_cliente'):
+            self._elegir(clave, 'filtrar')
+
+    def estado_cuenta(self):
+        selector = self.app.sidebar.selectbox(key='cliente_sidebar_estado')
+        cliente = self._azar.choice(selector.options[1:] or selector.options)
+        selector.select(cliente)
+        self._rerun('estado_cuenta')
+        resumen = self.app.selectbox(key='cliente_resumen')
+        if cliente in resumen.options:
+            resumen.select(cliente)
+            self._rerun('estado_cuenta')
+
+    def guardar_movimiento(self):
+        barra = self.app.sidebar
+        cliente = _buscar(barra.selectbox, "Cliente / Proveedor")
+        if cliente is not None and len(cliente.options) > 1:
+            cliente.select(self._azar.choice(cliente.options[1:]))
+        else:
+            _buscar(barra.text_input, "Descripción / Cliente / Proveedor").input("Cliente de prueba")
+        _buscar(barra.number_input, "Cantidad (Unidades)").set_value(self._azar.randint(1, 50))
+        _buscar(barra.number_input, "Peso Total (kg)").set_value(round(self._azar.uniform(10, 900), 1))
+        _buscar(barra.number_input, "Precio por kg ($)").set_value(round(self._azar.uniform(100, 900), 1))
+        _buscar(barra.button, "Guardar Movimiento").click()
+        self._rerun('guardar_movimiento')
+
+    def exportar(self):
+        # El resumen de todos los clientes arma sus archivos Excel y CSV para descargar en cada rerun
+        self.app.selectbox(key='cliente_resumen').select("Todos")
+        self._rerun('exportar')
+
+    def ejecutar(self, repeticiones=1, pausa=0.0):
+        try:
+            self.ingresar()
+            for _ in range(repeticiones):
+                for paso in (self.filtrar, self.estado_cuenta, self.guardar_movimiento, self.exportar):
+                    paso()
+                    if pausa:
+                        time.sleep(self._azar.uniform(0, pausa))
+        except Exception as e:
+            self.errores.append(f"guion: {type(e).__name__}: {str(e)}")
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0.0
+
+def resumir(reruns):
+    """Tabla por paso (y total) con reruns, p50/p95/máx en ms y lecturas promedio por rerun"""
+    filas = []
+    pasos = sorted({paso for paso, _s, _l in reruns})
+    for paso in [*pasos, 'total']:
+        elegidos = [(s, l) for p, s, l in reruns if paso == 'total' or p == paso]
+        segundos = [s for s, _l in elegidos]
+        filas.append({
+            'paso': paso,
+            'reruns': len(elegidos),
+            'p50_ms': _percentil(segundos, 0.5) * 1000,
+            'p95_ms': _percentil(segundos, 0.95) * 1000,
+            'max_ms': max(segundos) * 1000 if segundos else 0.0,
+            'lecturas_por_rerun': sum(l for _s, l in elegidos) / len(elegidos) if elegidos else 0.0,
+        })
+    return pd.DataFrame(filas).set_index('paso')
+
+def ejecutar_carga(sesiones=10, repeticiones=1, movimientos=5000, clientes=60, latencia=0.0, pausa=0.0,
+                   calentar=True, semilla=0):
+    """Corre las sesiones simultáneas contra un Firestore local nuevo y devuelve el informe.
+
+    El diario y la base de costos van a un directorio temporal, y la sesión que la
+    app guarda en disco al ingresar se restaura al terminar.
+    """
+    from . import conexion, datos
+    from .firestore_local import FirestoreLocal
+    if conexion.inicializada():
+        raise RuntimeError("La prueba de carga necesita un proceso propio (ya hay una conexión a Firestore)")
+    db = FirestoreLocal(latencia=latencia)
+    poblar(db, movimientos=movimientos, clientes=clientes, pagos=max(1, movimientos // 10), semilla=semilla)
+    sesion_previa = SESION_GUARDADA.read_bytes() if SESION_GUARDADA.exists() else None
+    with tempfile.TemporaryDirectory(prefix="carga_cueros_") as directorio:
+        conexion.usar_db(db)
+        datos.usar_archivos_locales(directorio)
+        memoria_inicial = memoria_mb()
+        try:
+            with _runtime_compartido():
+                if calentar:
+                    # El servidor real ya tiene el almacén cargado cuando llegan los usuarios
+                    SesionSimulada(db, random.Random(semilla)).ingresar()
+                    SESION_GUARDADA.unlink(missing_ok=True)
+                db.reiniciar_contadores()
+                simuladas = [SesionSimulada(db, random.Random(semilla + i + 1)) for i in range(sesiones)]
+                hilos = [threading.Thread(target=sesion.ejecutar, args=(repeticiones, pausa), name=f"sesion-{i}")
+                         for i, sesion in enumerate(simuladas)]
+                inicio = time.perf_counter()
+                for hilo in hilos:
+                    hilo.start()
+                for hilo in hilos:
+                    hilo.join()
+                duracion = time.perf_counter() - inicio
+        finally:
+            if sesion_previa is not None:
+                SESION_GUARDADA.write_bytes(sesion_previa)
+            else:
+                SESION_GUARDADA.unlink(missing_ok=True)
+        # La cola termina de confirmar los movimientos guardados antes de borrar el diario temporal
+        cola = datos.obtener_cola()
+        limite = time.monotonic() + 30
+        while cola.pendientes() and time.monotonic() < limite:
+            time.sleep(0.1)
+        contadores = db.contadores()
+    reruns = [rerun for sesion in simuladas for rerun in sesion.reruns]
+    return {
+        'tabla': resumir(reruns),
+        'sesiones': sesiones,
+        'duracion_s': duracion,
+        'reruns_por_s': len(reruns) / duracion if duracion else 0.0,
+        'contadores': contadores,
+        'memoria_inicial_mb': memoria_inicial,
+        'memoria_final_mb': memoria_mb(),
+        'memoria_pico_mb': memoria_pico_mb(),
+        'errores': [error for sesion in simuladas for error in sesion.errores],
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simula sesiones simultáneas de la app contra un Firestore local en memoria")
+    parser.add_argument('--sesiones', type=int, default=10)
+    parser.add_argument('--repeticiones', type=int, default=1, help="veces que cada sesión repite el guion")
+    parser.add_argument('--movimientos', type=int, default=5000)
+    parser.add_argument('--clientes', type=int, default=60)
+    parser.add_argument('--latencia', type=float, default=0.0, help="segundos de red simulados por llamada a Firestore")
+    parser.add_argument('--pausa', type=float, default=0.0, help="espera máxima (segundos) entre pasos, al azar")
+    parser.add_argument('--sin-calentar', action='store_true', help="medir también la carga inicial del almacén")
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+    informe = ejecutar_carga(args.sesiones, args.repeticiones, args.movimientos, args.clientes, args.latencia,
+                             args.pausa, calentar=not args.sin_calentar, semilla=args.semilla)
+    print(informe['tabla'].round(1).to_string())
+    contadores = informe['contadores']
+    print(f"{informe['sesiones']} sesiones en {informe['duracion_s']:.1f} s ({informe['reruns_por_s']:.1f} reruns/s); "
+          f"Firestore: {contadores['lecturas']} lecturas, {contadores['escrituras']} escrituras, {contadores['llamadas']} llamadas")
+    print(f"Memoria: {informe['memoria_inicial_mb']:.0f} MB al empezar, {informe['memoria_final_mb']:.0f} MB al terminar, "
+          f"pico {informe['memoria_pico_mb']:.0f} MB")
+    if informe['errores']:
+        print(f"{len(informe['errores'])} errores:")
+        for error in informe['errores'][:10]:
+            print(f"  {error}")
+
+if __name__ == '__main__':
+    main()
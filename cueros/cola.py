@@ -0,0 +1,323 @@
+"""Cola de escritura diferida (write-behind) con diario local"""
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from google.api_core import exceptions as google_exceptions
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+from .kpi import IncrementosKpi
+from .politica import ERRORES_REINTENTABLES, CircuitoAbierto
+
+ERRORES_DE_CONEXION = ERRORES_REINTENTABLES + (google_exceptions.RetryError, CircuitoAbierto)
+
+class ColaEscritura:
+    """Aplica cada escritura al almacén en el momento y la confirma en Firestore desde un hilo.
+
+    Cada operación se anota primero en el diario local, así que sobrevive a cortes de
+    conexión y reinicios. Se confirman en lotes (batch); sin conexión se reintentan
+    indefinidamente y, al volver, el diario se reproduce en orden. Las altas usan el ID
+    del documento como clave de idempotencia (create) y las ediciones y bajas llevan
+    como precondición la versión del documento que se editó, para detectar conflictos.
+    Con un registro de cambios, cada operación suma su evento al mismo lote. Los
+    totales globales (cueros.kpi) se incrementan en el mismo lote con una escritura.
+    Una operación cuyo envío pudo haberse aplicado sin respuesta (error de conexión,
+    reintento, diario de una ejecución anterior) queda dudosa: antes de reenviarla se
+    busca su evento y, si existe, se da por confirmada sin volver a sumar los totales.
+    Las ediciones en bloque (encolar_actualizaciones) viajan juntas y se confirman
+    en un único lote de hasta MAX_GRUPO operaciones. Sin almacén (almacen=None) no hay
+    vista optimista: el documento previo y su versión se leen de Firestore al encolar.
+    """
+
+    # Cada operación ocupa dos escrituras (documento y evento) de las 500 de un lote
+    MAX_GRUPO = 200
+
+    def __init__(self, db, almacen, diario, politica, tam_lote=20, espera_lote=0.2, max_intentos=5, registro=None):
+        self._db = db
+        self._registro = registro
+        self._politica = politica
+        self._almacen = almacen
+        self._diario = diario
+        self._tam_lote = tam_lote
+        self._espera_lote = espera_lote
+        self._max_intentos = max_intentos
+        self._cola = queue.Queue()
+        self._lock = threading.Lock()
+        self._pendientes = {}
+        self._fallidas = {}
+        self._hilo = None
+        self.confirmadas = 0
+        self.sin_conexion = False
+
+    def iniciar(self):
+        """Recupera del diario lo que quedó sin confirmar y arranca el hilo de envío"""
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        for entrada in self._diario.operaciones():
+            with self._lock:
+                if entrada['estado'] == 'pendiente':
+                    self._pendientes[entrada['clave']] = entrada
+                else:
+                    self._fallidas[entrada['clave']] = entrada
+            self._aplicar_local(entrada['coleccion'], entrada['id'], self._datos_resultantes(entrada))
+            if entrada['estado'] == 'pendiente':
+                # La ejecución anterior pudo cortarse después de confirmarla y antes de anotarlo
+                entrada['dudosa'] = True
+                self._cola.put(entrada)
+        self._hilo = threading.Thread(target=self._trabajar, name="cola-escritura", daemon=True)
+        self._hilo.start()
+
+    def encolar(self, coleccion, datos):
+        """Registra un alta y devuelve el ID que tendrá en Firestore"""
+        doc_id = self._db.collection(coleccion).document().id
+        self._registrar('crear', coleccion, doc_id, datos)
+        return doc_id
+
+    def encolar_actualizacion(self, coleccion, doc_id, cambios):
+        self._registrar('actualizar', coleccion, str(doc_id), cambios)
+
+    def encolar_actualizaciones(self, coleccion, cambios):
+        """Ediciones en bloque, {doc_id: campos que cambian}: se confirman juntas, de a MAX_GRUPO por lote"""
+        entradas = [self._registrar('actualizar', coleccion, str(doc_id), campos, encolar=False)
+                    for doc_id, campos in cambios.items() if campos]
+        for inicio in range(0, len(entradas), self.MAX_GRUPO):
+            self._cola.put(entradas[inicio:inicio + self.MAX_GRUPO])
+        return len(entradas)
+
+    def encolar_eliminacion(self, coleccion, doc_id):
+        self._registrar('eliminar', coleccion, str(doc_id), None)
+
+    def _documento_actual(self, operacion, coleccion, doc_id):
+        """(datos, update_time) del documento antes de la operación, del almacén o de Firestore"""
+        if self._almacen is not None:
+            return self._almacen.documento(coleccion, doc_id), self._almacen.tiempo_actualizacion(coleccion, doc_id)
+        if operacion == 'crear':
+            return None, None
+        ref = self._db.collection(coleccion).document(doc_id)
+        doc = self._politica.ejecutar('cola.leer_anterior', lambda plazo: ref.get(retry=None, timeout=plazo))
+        if not doc.exists:
+            return None, None
+        return {**doc.to_dict(), 'id': doc.id}, doc.update_time
+
+    def _aplicar_local(self, coleccion, doc_id, datos):
+        if self._almacen is not None:
+            self._almacen.aplicar_local(coleccion, doc_id, datos)
+
+    def _registrar(self, operacion, coleccion, doc_id, datos, encolar=True):
+        anterior, tiempo = self._documento_actual(operacion, coleccion, doc_id)
+        entrada = {
+            'clave': uuid.uuid4().hex,
+            'operacion': operacion,
+            'coleccion': coleccion,
+            'id': doc_id,
+            'datos': datos,
+            'anterior': anterior,
+            'version_base': tiempo.rfc3339() if tiempo is not None and operacion != 'crear' else None,
+            'intentos': 0,
+            'dudosa': False,
+            'error': None,
+            'estado': 'pendiente',
+            'encolado': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self._diario.registrar(entrada)
+        with self._lock:
+            self._pendientes[entrada['clave']] = entrada
+        self._aplicar_local(coleccion, doc_id, self._datos_resultantes(entrada))
+        if encolar:
+            self._cola.put(entrada)
+        return entrada
+
+    @staticmethod
+    def _datos_resultantes(entrada):
+        """Cómo queda el documento tras la operación (None si se elimina)"""
+        if entrada['operacion'] == 'eliminar':
+            return None
+        if entrada['operacion'] == 'actualizar':
+            datos = dict(entrada['anterior'] or {})
+            datos.update(entrada['datos'])
+            return datos
+        return entrada['datos']
+
+    def pendientes(self):
+        with self._lock:
+            return list(self._pendientes.values())
+
+    def incrementos_pendientes(self):
+        """Lo que las escrituras todavía sin confirmar sumarán a los totales globales (cueros.kpi)"""
+        incrementos = IncrementosKpi()
+        for entrada in self.pendientes():
+            incrementos.sumar(entrada['coleccion'], entrada['anterior'], self._datos_resultantes(entrada))
+        return incrementos.totales
+
+    def fallidas(self):
+        """Operaciones que agotaron los reintentos o que chocan con un cambio remoto (conflicto)"""
+        with self._lock:
+            return list(self._fallidas.values())
+
+    def reintentar_fallidas(self, forzar=False):
+        """Vuelve a encolar las fallidas; con forzar=True los conflictos pisan la versión remota"""
+        with self._lock:
+            entradas = list(self._fallidas.values())
+            self._fallidas.clear()
+            for entrada in entradas:
+                entrada['intentos'] = 0
+                entrada['estado'] = 'pendiente'
+                entrada['dudosa'] = True
+                if forzar:
+                    entrada['version_base'] = None
+                self._pendientes[entrada['clave']] = entrada
+        for entrada in entradas:
+            self._diario.actualizar(entrada)
+            self._aplicar_local(entrada['coleccion'], entrada['id'], self._datos_resultantes(entrada))
+            self._cola.put(entrada)
+
+    def descartar_fallida(self, clave):
+        with self._lock:
+            entrada = self._fallidas.pop(clave, None)
+        if entrada is not None:
+            self._diario.confirmar([clave])
+            if self._almacen is not None:
+                self._almacen.restaurar_local(entrada['coleccion'], entrada['id'], entrada['anterior'])
+
+    @staticmethod
+    def _entradas(elemento):
+        # Un grupo de encolar_actualizaciones llega como lista y va entero al mismo lote
+        return list(elemento) if isinstance(elemento, list) else [elemento]
+
+    def _trabajar(self):
+        while True:
+            lote = self._entradas(self._cola.get())
+            limite = time.monotonic() + self._espera_lote
+            while len(lote) < self._tam_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.extend(self._entradas(self._cola.get(timeout=restante)))
+                except queue.Empty:
+                    break
+            self._confirmar(lote)
+
+    def _armar_lote(self, entradas):
+        batch = self._db.batch()
+        incrementos = IncrementosKpi()
+        for entrada in entradas:
+            self._agregar_a_lote(batch, entrada)
+            # Sin registro de cambios no hay cómo saber si una dudosa ya sumó: su diferencia
+            # se omite y la corrige el verificador de kpis/global, en vez de contarla dos veces
+            if self._registro is not None or not entrada.get('dudosa'):
+                incrementos.sumar(entrada['coleccion'], entrada['anterior'], self._datos_resultantes(entrada))
+        incrementos.agregar(self._db, batch)
+        return batch
+
+    def _aplicada(self, entrada):
+        """Si la operación ya está en Firestore: su evento existe (solo se sabe con registro de cambios)"""
+        return self._registro is not None and self._registro.registrado(entrada['clave'])
+
+    def _agregar_a_lote(self, batch, entrada):
+        ref = self._db.collection(entrada['coleccion']).document(entrada['id'])
+        opcion = None
+        if entrada['version_base']:
+            opcion = self._db.write_option(
+                last_update_time=DatetimeWithNanoseconds.from_rfc3339(entrada['version_base'])
+            )
+        if entrada['operacion'] == 'crear':
+            batch.create(ref, entrada['datos'])
+        elif entrada['operacion'] == 'actualizar':
+            batch.update(ref, entrada['datos'], option=opcion)
+        else:
+            batch.delete(ref, option=opcion)
+        if self._registro is not None:
+            # El evento va en el mismo lote: queda registrado si y solo si se aplica la escritura
+            self._registro.agregar(batch, entrada['operacion'], entrada['coleccion'], entrada['id'],
+                                   entrada['anterior'], self._datos_resultantes(entrada), clave=entrada['clave'])
+
+    def _confirmar(self, lote):
+        try:
+            dudosas = [entrada for entrada in lote if entrada.get('dudosa')]
+            aplicadas = [entrada for entrada in dudosas if self._aplicada(entrada)]
+        except ERRORES_DE_CONEXION as e:
+            self.sin_conexion = True
+            for entrada in lote:
+                self._programar_reintento(entrada, e, contar_intento=False)
+            return
+        if aplicadas:
+            self._marcar_confirmadas(aplicadas)
+            confirmadas = {entrada['clave'] for entrada in aplicadas}
+            lote = [entrada for entrada in lote if entrada['clave'] not in confirmadas]
+            if not lote:
+                return
+        try:
+            batch = self._armar_lote(lote)
+            self._politica.ejecutar('cola.commit_lote', lambda plazo: batch.commit(retry=None, timeout=plazo))
+        except ERRORES_DE_CONEXION as e:
+            self.sin_conexion = True
+            for entrada in lote:
+                self._programar_reintento(entrada, e, contar_intento=False)
+            return
+        except Exception:
+            # Un lote es atómico: se confirma cada operación por separado para aislar la que falla
+            for entrada in lote:
+                self._confirmar_individual(entrada)
+            return
+        self.sin_conexion = False
+        self._marcar_confirmadas(lote)
+
+    def _confirmar_individual(self, entrada):
+        try:
+            batch = self._armar_lote([entrada])
+            self._politica.ejecutar('cola.commit_individual', lambda plazo: batch.commit(retry=None, timeout=plazo))
+        except (google_exceptions.AlreadyExists, google_exceptions.FailedPrecondition, google_exceptions.NotFound) as e:
+            # Si la operación ya se había aplicado (se perdió la respuesta), su evento existe
+            # y el alta o la precondición chocan con ella misma: no es un conflicto
+            try:
+                aplicada = self._aplicada(entrada)
+            except ERRORES_DE_CONEXION as error_conexion:
+                self.sin_conexion = True
+                self._programar_reintento(entrada, error_conexion, contar_intento=False)
+                return
+            if not aplicada and not (isinstance(e, google_exceptions.AlreadyExists) and entrada['operacion'] == 'crear'):
+                self._marcar_fallida(entrada, 'conflicto', f"El documento cambió en Firebase desde que se editó: {str(e)}")
+                return
+        except ERRORES_DE_CONEXION as e:
+            self.sin_conexion = True
+            self._programar_reintento(entrada, e, contar_intento=False)
+            return
+        except Exception as e:
+            self._programar_reintento(entrada, e)
+            return
+        self._marcar_confirmadas([entrada])
+
+    def _marcar_confirmadas(self, lote):
+        self._diario.confirmar([entrada['clave'] for entrada in lote])
+        with self._lock:
+            for entrada in lote:
+                self._pendientes.pop(entrada['clave'], None)
+            self.confirmadas += len(lote)
+
+    def _marcar_fallida(self, entrada, estado, error):
+        entrada['estado'] = estado
+        entrada['error'] = error
+        with self._lock:
+            self._pendientes.pop(entrada['clave'], None)
+            self._fallidas[entrada['clave']] = entrada
+        self._diario.actualizar(entrada)
+
+    def _programar_reintento(self, entrada, error, contar_intento=True):
+        if contar_intento:
+            entrada['intentos'] += 1
+        # Rechazada por el cortacircuitos no llegó a enviarse; cualquier otro error pudo llegar después de aplicarla
+        if not isinstance(error, CircuitoAbierto):
+            entrada['dudosa'] = True
+        entrada['error'] = str(error)
+        if entrada['intentos'] >= self._max_intentos:
+            self._marcar_fallida(entrada, 'fallida', str(error))
+            return
+        self._diario.actualizar(entrada)
+        espera = min(30.0, 2 ** max(1, entrada['intentos'])) * random.uniform(0.5, 1.0)
+        temporizador = threading.Timer(espera, self._cola.put, args=(entrada,))
+        temporizador.daemon = True
+        temporizador.start()
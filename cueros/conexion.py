@@ -0,0 +1,107 @@
+"""Credenciales e inicialización perezosa de Firebase.
+
+Nada se conecta al importar el paquete: el cliente de Firestore se crea en la
+primera llamada a obtener_db() (o a inicializar(), si la app trae sus propias
+credenciales, p. ej. desde st.secrets).
+"""
+import json
+import os
+import threading
+import tomllib
+
+from . import avisos
+from .config import FIREBASE_CREDS, STREAMLIT_SECRETS
+
+class SinCredenciales(Exception):
+    """No se encontraron credenciales de Firebase en ninguna de las fuentes"""
+
+def credenciales_desde_secrets(secrets):
+    """Convierte la sección [firebase] de los secrets a un dict regular"""
+    firebase = secrets["firebase"]
+    return {
+        "type": str(firebase["type"]),
+        "project_id": str(firebase["project_id"]),
+        "private_key_id": str(firebase["private_key_id"]),
+        "private_key": str(firebase["private_key"]),
+        "client_email": str(firebase["client_email"]),
+        "client_id": str(firebase["client_id"]),
+        "auth_uri": str(firebase["auth_uri"]),
+        "token_uri": str(firebase["token_uri"]),
+        "auth_provider_x509_cert_url": str(firebase["auth_provider_x509_cert_url"]),
+        "client_x509_cert_url": str(firebase["client_x509_cert_url"]),
+        "universe_domain": str(firebase.get("universe_domain", "googleapis.com"))
+    }
+
+def cargar_credenciales(incluir_secrets=True):
+    """Obtener credenciales de Firebase sin Streamlit"""
+
+    # Opción 1: .streamlit/secrets.toml del proyecto (el mismo que lee la app)
+    if incluir_secrets and STREAMLIT_SECRETS.exists():
+        try:
+            with open(STREAMLIT_SECRETS, 'rb') as f:
+                secrets = tomllib.load(f)
+            if 'firebase' in secrets:
+                return credenciales_desde_secrets(secrets)
+        except Exception as e:
+            avisos.aviso(f"⚠️ Error al leer {STREAMLIT_SECRETS.name}: {str(e)}")
+
+    # Opción 2: Archivo firebase_config.json (recomendado para desarrollo local)
+    if FIREBASE_CREDS.exists():
+        try:
+            with open(FIREBASE_CREDS, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            avisos.aviso(f"⚠️ Error al leer firebase_config.json: {str(e)}")
+
+    # Opción 3: Variables de entorno
+    if os.getenv('FIREBASE_PROJECT_ID'):
+        try:
+            return {
+                "type": os.getenv('FIREBASE_TYPE', 'service_account'),
+                "project_id": os.getenv('FIREBASE_PROJECT_ID'),
+                "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
+                # Replace escaped newlines - env vars often store multi-line keys as single line with \n
+                "private_key": os.getenv('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n'),
+                "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
+                "client_id": os.getenv('FIREBASE_CLIENT_ID'),
+                "auth_uri": os.getenv('FIREBASE_AUTH_URI', 'https://accounts.google.com/o/oauth2/auth'),
+                "token_uri": os.getenv('FIREBASE_TOKEN_URI', 'https://oauth2.googleapis.com/token'),
+                "auth_provider_x509_cert_url": os.getenv('FIREBASE_AUTH_PROVIDER_CERT_URL', 'https://www.googleapis.com/oauth2/v1/certs'),
+                "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_CERT_URL'),
+                "universe_domain": os.getenv('FIREBASE_UNIVERSE_DOMAIN', 'googleapis.com')
+            }
+        except Exception as e:
+            avisos.aviso(f"⚠️ Error al leer variables de entorno: {str(e)}")
+
+    return None
+
+_lock = threading.Lock()
+_db = None
+
+def inicializar(credenciales=None):
+    """Inicializa Firebase una sola vez por proceso y devuelve el cliente de Firestore"""
+    global _db
+    with _lock:
+        if _db is None:
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+            if not firebase_admin._apps:
+                credenciales = credenciales or cargar_credenciales()
+                if not credenciales:
+                    raise SinCredenciales("No se encontraron credenciales de Firebase")
+                firebase_admin.initialize_app(credentials.Certificate(credenciales))
+            _db = firestore.client()
+        return _db
+
+def usar_db(db):
+    """Usa un cliente ya creado (p. ej. el Firestore local de las pruebas de carga) en lugar de conectar a Firebase"""
+    global _db
+    with _lock:
+        _db = db
+    return db
+
+def inicializada():
+    return _db is not None
+
+def obtener_db():
+    return inicializar()
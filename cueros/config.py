@@ -0,0 +1,29 @@
+"""Rutas y parámetros compartidos por la app y los scripts"""
+import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+FIREBASE_CREDS = BASE_DIR / "firebase_config.json"
+STREAMLIT_SECRETS = BASE_DIR / ".streamlit" / "secrets.toml"
+DIARIO_LOCAL = BASE_DIR / ".diario_local.sqlite"
+ARCHIVO_DIR = BASE_DIR / "archivo"
+# Antigüedad mínima (en días) para archivar; se archivan años completos
+ARCHIVO_CORTE_DIAS = int(os.getenv('ARCHIVO_CORTE_DIAS', '730'))
+COSTOS_LOCAL = BASE_DIR / ".costos.sqlite"
+# Método de costeo de las ventas: 'promedio' (promedio ponderado por kg) o 'fifo'
+COSTOS_METODO = os.getenv('COSTOS_METODO', 'promedio')
+# Con 0 no se mantienen las colecciones en memoria: las lecturas van a Firestore y las
+# métricas se calculan en flujo (útil para la API en contenedores con poca memoria)
+ALMACEN_EN_MEMORIA = os.getenv('ALMACEN_EN_MEMORIA', '1') != '0'
+# Lecturas de Firestore que puede gastar cada rerun y cada sesión de la app (0 = sin límite);
+# al pasarse, la capa de datos sirve el último resultado guardado o uno parcial
+PRESUPUESTO_LECTURAS_RERUN = int(os.getenv('PRESUPUESTO_LECTURAS_RERUN', '5000'))
+PRESUPUESTO_LECTURAS_SESION = int(os.getenv('PRESUPUESTO_LECTURAS_SESION', '50000'))
+# Cada cuántos segundos se recalculan los totales globales (kpis/global) para corregir deriva (0 = nunca)
+KPI_VERIFICAR_CADA = int(os.getenv('KPI_VERIFICAR_CADA', '900'))
+# Cada cuántos segundos el hilo de recálculo revisa si cambiaron los datos de las vistas derivadas
+# (resumen de clientes, antigüedad, costos, lotes); 0 = se calculan recién al pedirlas
+RECALCULO_CADA = int(os.getenv('RECALCULO_CADA', '10'))
+# Cada cuántos segundos el hilo de recálculo guarda instantáneas de las vistas stock y saldos, así
+# reconstruirlas solo aplica los eventos posteriores (0 = solo al reconstruirlas a mano)
+INSTANTANEA_CADA = int(os.getenv('INSTANTANEA_CADA', '3600'))
@@ -0,0 +1,338 @@
+"""Costo de lo vendido y margen por venta, con costo promedio ponderado por kg (o FIFO).
+
+El motor recorre los movimientos en orden de fecha. Cada compra suma kg y costo al
+producto; cada venta toma su costo del promedio vigente (o de los lotes más viejos
+en modo FIFO) y guarda costo y margen. Las compras y ventas se valorizan por su
+neto (sin IVA); si falta, por precio_total.
+
+El estado (kg y costo por producto, lotes, último movimiento aplicado y resultados
+de cada venta) se guarda en SQLite, así que al reiniciar solo se aplican los
+movimientos nuevos. Editar, borrar o cargar con fecha anterior a lo ya aplicado
+obliga a recalcular desde el principio. Con recálculo en segundo plano (la tarea
+'costos' de cueros.tareas), mientras tanto se sirven los últimos resultados
+consistentes; sin él, se recalcula una sola vez, al pedir los resultados.
+
+Uso:
+    python -m cueros.costos --recalcular [--metodo fifo]
+"""
+import argparse
+import json
+import sqlite3
+import threading
+from collections import deque
+
+TIPO_COMPRA = 'Ingreso (Compra)'
+TIPO_VENTA = 'Egreso (Venta)'
+METODOS = ('promedio', 'fifo')
+COLECCIONES_COSTOS = ('movimientos', 'saldos_apertura')
+
+def _numero(valor):
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if numero != numero else numero
+
+def _valor_neto(datos):
+    neto = _numero(datos.get('neto'))
+    return neto if neto else _numero(datos.get('precio_total'))
+
+def huella(datos):
+    """Campos que afectan el costo; si no cambian, editar el movimiento no obliga a recalcular"""
+    return [str(datos.get('fecha', '')), datos.get('tipo'), datos.get('producto'),
+            _numero(datos.get('peso_kg')), _valor_neto(datos)]
+
+class MotorCostos:
+    """Costo promedio ponderado (o FIFO) por producto, aplicado movimiento a movimiento en O(1).
+
+    en_segundo_plano() dice si un hilo se encarga de poner_al_dia(): mientras haya un
+    recálculo pendiente, los lectores reciben los últimos resultados consistentes en
+    vez de esperar a que termine.
+    """
+
+    def __init__(self, metodo='promedio', ruta=None, en_segundo_plano=None):
+        if metodo not in METODOS:
+            raise ValueError(f"Método de costeo desconocido: {metodo}")
+        self.metodo = metodo
+        self._en_segundo_plano = en_segundo_plano or (lambda: False)
+        self._lock = threading.RLock()
+        self._conexion = None
+        if ruta is not None:
+            self._conexion = sqlite3.connect(str(ruta), check_same_thread=False, isolation_level=None)
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            # El estado se puede reconstruir con --recalcular: no hace falta sincronizar a disco en cada cambio
+            self._conexion.execute("PRAGMA synchronous=NORMAL")
+            self._conexion.executescript("""
+                CREATE TABLE IF NOT EXISTS costos_estado (metodo TEXT PRIMARY KEY, datos TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS costos_movimientos (
+                    metodo TEXT NOT NULL, clave TEXT NOT NULL, huella TEXT NOT NULL,
+                    PRIMARY KEY (metodo, clave)
+                );
+                CREATE TABLE IF NOT EXISTS costos_ventas (
+                    metodo TEXT NOT NULL, clave TEXT NOT NULL, resultado TEXT NOT NULL,
+                    PRIMARY KEY (metodo, clave)
+                );
+            """)
+        self._sucias = set()
+        # Cambios de huellas recibidos: un recálculo hecho sobre una copia vieja se descarta
+        self.cambios = 0
+        self._reiniciar()
+        self._cargar()
+
+    def _reiniciar(self):
+        self._productos = {}
+        self._cursor = None
+        self._aplicados = set()
+        self._ventas = {}
+        self._cambios_ventas = {}
+        self.requiere_recalculo = False
+        # (ventas, productos) consistentes de antes del cambio que obligó a recalcular
+        self._publicados = None
+        self.aplicados_incrementales = 0
+        self.recalculos = 0
+        # Huellas de todos los movimientos conocidos (aplicados o no), para poder recalcular
+        self._huellas = {}
+
+    def _estado_producto(self, producto):
+        estado = self._productos.get(producto)
+        if estado is None:
+            estado = self._productos[producto] = {'kg': 0.0, 'costo': 0.0, 'costo_kg': 0.0, 'lotes': deque()}
+        return estado
+
+    def _aplicar(self, clave, datos_huella):
+        """Aplica un movimiento (en orden de fecha) al estado; O(1) salvo los lotes que consuma en FIFO"""
+        fecha, tipo, producto, kg, valor = datos_huella
+        estado = self._estado_producto(producto)
+        if tipo == TIPO_COMPRA:
+            costo_previo = estado['costo'] if estado['kg'] > 0 else 0.0
+            if kg > 0:
+                # Con stock negativo (ventas cargadas antes que la compra) el promedio arranca de esta compra
+                if estado['kg'] <= 0:
+                    estado['costo_kg'] = valor / kg
+                else:
+                    estado['costo_kg'] = (estado['costo'] + valor) / (estado['kg'] + kg)
+                if self.metodo == 'fifo':
+                    estado['lotes'].append([kg, valor / kg])
+            estado['kg'] += kg
+            if self.metodo == 'fifo':
+                estado['costo'] = costo_previo + valor if estado['kg'] > 0 else 0.0
+            else:
+                estado['costo'] = max(0.0, estado['kg']) * estado['costo_kg']
+        elif tipo == TIPO_VENTA:
+            costo, faltante = self._costo_salida(estado, kg)
+            resultado = {
+                'fecha': fecha,
+                'producto': producto,
+                'peso_kg': kg,
+                'ingreso_neto': valor,
+                'costo_venta': costo,
+                'margen': valor - costo,
+                'margen_%': (valor - costo) / valor * 100 if valor else 0.0,
+                'kg_sin_costo': faltante,
+            }
+            self._ventas[clave] = resultado
+            self._cambios_ventas[clave] = resultado
+        self._aplicados.add(clave)
+        self._cursor = (fecha, clave)
+
+    def _costo_salida(self, estado, kg):
+        """Costo de sacar kg del stock; devuelve (costo, kg sin stock que los respalde)"""
+        faltante = max(0.0, kg - estado['kg'])
+        if self.metodo == 'promedio':
+            costo = kg * estado['costo_kg']
+            estado['kg'] -= kg
+            estado['costo'] = max(0.0, estado['kg']) * estado['costo_kg']
+            return costo, faltante
+        costo_lotes = 0.0
+        restante = kg
+        lotes = estado['lotes']
+        while restante > 1e-9 and lotes:
+            lote = lotes[0]
+            tomado = min(restante, lote[0])
+            costo_lotes += tomado * lote[1]
+            estado['costo_kg'] = lote[1]
+            lote[0] -= tomado
+            restante -= tomado
+            if lote[0] <= 1e-9:
+                lotes.popleft()
+        estado['kg'] -= kg
+        estado['costo'] = max(0.0, estado['costo'] - costo_lotes) if lotes else 0.0
+        # Sin lotes suficientes: el resto se valoriza al último costo conocido
+        return costo_lotes + restante * estado['costo_kg'], faltante
+
+    def aplicar_cambios(self, coleccion, documentos, reemplazar=False):
+        """Callback para AlmacenDatos.suscribir: aplica altas en orden y marca recálculo si hace falta"""
+        with self._lock:
+            if reemplazar:
+                presentes = {f"{coleccion}/{doc_id}" for doc_id in documentos}
+                for clave in [c for c in self._huellas if c.startswith(coleccion + "/") and c not in presentes]:
+                    self._olvidar(clave)
+            # En orden de fecha, para que una entrega completa se aplique sin recalcular
+            for doc_id, datos in sorted(documentos.items(), key=lambda item: (str((item[1] or {}).get('fecha', '')), str(item[0]))):
+                clave = f"{coleccion}/{doc_id}"
+                if datos is None:
+                    self._olvidar(clave)
+                    continue
+                nueva = huella(datos)
+                previa = self._huellas.get(clave)
+                if previa == nueva:
+                    continue
+                self._huellas[clave] = nueva
+                self._sucias.add(clave)
+                self.cambios += 1
+                if previa is not None or self.requiere_recalculo:
+                    self._marcar_recalculo()
+                elif self._cursor is None or (nueva[0], clave) >= tuple(self._cursor):
+                    self._aplicar(clave, nueva)
+                    self.aplicados_incrementales += 1
+                else:
+                    # Movimiento con fecha anterior a lo ya aplicado
+                    self._marcar_recalculo()
+            self._guardar()
+
+    def _olvidar(self, clave):
+        if self._huellas.pop(clave, None) is not None:
+            self._sucias.add(clave)
+            self.cambios += 1
+            if clave in self._aplicados:
+                self._marcar_recalculo()
+            self._ventas.pop(clave, None)
+
+    def _marcar_recalculo(self):
+        if not self.requiere_recalculo:
+            self._publicados = (dict(self._ventas), self._copia_productos())
+            self.requiere_recalculo = True
+
+    def _copia_productos(self):
+        return {p: {'kg': e['kg'], 'costo': e['costo'], 'costo_kg': e['costo_kg']} for p, e in self._productos.items()}
+
+    def recalcular(self):
+        """Vuelve a aplicar todos los movimientos conocidos, en orden de fecha.
+
+        Se calcula sobre una copia, sin bloquear a los lectores. Si mientras tanto
+        llegaron cambios el resultado se descarta y devuelve False: el recálculo
+        sigue pendiente.
+        """
+        with self._lock:
+            huellas = dict(self._huellas)
+            cambios = self.cambios
+        nuevo = MotorCostos(self.metodo)
+        for clave, datos_huella in sorted(huellas.items(), key=lambda item: (item[1][0], item[0])):
+            nuevo._aplicar(clave, datos_huella)
+        with self._lock:
+            if self.cambios != cambios:
+                return False
+            anteriores = self._ventas
+            self._productos = nuevo._productos
+            self._cursor = nuevo._cursor
+            self._aplicados = nuevo._aplicados
+            self._ventas = nuevo._ventas
+            # Se guardan solo las ventas cuyo resultado cambió (None: ya no es una venta)
+            self._cambios_ventas.update((clave, r) for clave, r in self._ventas.items() if anteriores.get(clave) != r)
+            self._cambios_ventas.update((clave, None) for clave in anteriores if clave not in self._ventas)
+            self.requiere_recalculo = False
+            self._publicados = None
+            self.recalculos += 1
+            self._guardar()
+            return True
+
+    def poner_al_dia(self):
+        """Recalcula si hace falta (lo llama el hilo de recálculo); devuelve si quedó al día"""
+        return not self.requiere_recalculo or self.recalcular()
+
+    def _vigentes(self):
+        """(ventas, productos) al día o, si el recálculo corre en segundo plano, los últimos consistentes"""
+        if self.requiere_recalculo:
+            if self._publicados is not None and self._en_segundo_plano():
+                return self._publicados
+            self.recalcular()
+        return self._ventas, self._copia_productos()
+
+    def resultado_venta(self, coleccion, doc_id):
+        with self._lock:
+            return self._vigentes()[0].get(f"{coleccion}/{doc_id}")
+
+    def resultados(self):
+        """{clave 'coleccion/id': costo y margen} de todas las ventas"""
+        with self._lock:
+            return dict(self._vigentes()[0])
+
+    def costos_por_id(self, coleccion='movimientos'):
+        """{doc_id: resultado} de las ventas de una colección, para unir con su DataFrame"""
+        prefijo = coleccion + "/"
+        return {clave[len(prefijo):]: r for clave, r in self.resultados().items() if clave.startswith(prefijo)}
+
+    def estado_productos(self):
+        """Stock en kg, costo total y costo por kg vigente de cada producto"""
+        with self._lock:
+            return {p: dict(e) for p, e in self._vigentes()[1].items()}
+
+    def _guardar(self):
+        if self._conexion is None:
+            return
+        estado = {
+            'cursor': self._cursor,
+            'requiere_recalculo': self.requiere_recalculo,
+            'productos': {p: {**e, 'lotes': list(e['lotes'])} for p, e in self._productos.items()},
+        }
+        self._conexion.execute("BEGIN")
+        try:
+            self._conexion.execute("INSERT OR REPLACE INTO costos_estado (metodo, datos) VALUES (?, ?)", (self.metodo, json.dumps(estado)))
+            for clave in self._sucias:
+                datos_huella = self._huellas.get(clave)
+                if datos_huella is None:
+                    self._conexion.execute("DELETE FROM costos_movimientos WHERE metodo = ? AND clave = ?", (self.metodo, clave))
+                    self._conexion.execute("DELETE FROM costos_ventas WHERE metodo = ? AND clave = ?", (self.metodo, clave))
+                else:
+                    self._conexion.execute("INSERT OR REPLACE INTO costos_movimientos (metodo, clave, huella) VALUES (?, ?, ?)",
+                                           (self.metodo, clave, json.dumps(datos_huella)))
+            self._conexion.executemany("INSERT OR REPLACE INTO costos_ventas (metodo, clave, resultado) VALUES (?, ?, ?)",
+                                       [(self.metodo, clave, json.dumps(r)) for clave, r in self._cambios_ventas.items() if r is not None])
+            self._conexion.executemany("DELETE FROM costos_ventas WHERE metodo = ? AND clave = ?",
+                                       [(self.metodo, clave) for clave, r in self._cambios_ventas.items() if r is None])
+            self._conexion.execute("COMMIT")
+        except Exception:
+            self._conexion.execute("ROLLBACK")
+            raise
+        self._cambios_ventas = {}
+        self._sucias = set()
+
+    def _cargar(self):
+        if self._conexion is None:
+            return
+        fila = self._conexion.execute("SELECT datos FROM costos_estado WHERE metodo = ?", (self.metodo,)).fetchone()
+        if fila is None:
+            return
+        estado = json.loads(fila[0])
+        self._cursor = tuple(estado['cursor']) if estado['cursor'] else None
+        self.requiere_recalculo = estado['requiere_recalculo']
+        self._productos = {p: {**e, 'lotes': deque(e['lotes'])} for p, e in estado['productos'].items()}
+        for clave, datos_huella in self._conexion.execute(
+                "SELECT clave, huella FROM costos_movimientos WHERE metodo = ?", (self.metodo,)):
+            self._huellas[clave] = json.loads(datos_huella)
+        for clave, resultado in self._conexion.execute(
+                "SELECT clave, resultado FROM costos_ventas WHERE metodo = ?", (self.metodo,)):
+            self._ventas[clave] = json.loads(resultado)
+        self._aplicados = set(self._huellas) if not self.requiere_recalculo else set()
+        if self.requiere_recalculo:
+            # Lo último guardado es lo más cercano a un resultado consistente
+            self._publicados = (dict(self._ventas), self._copia_productos())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalcula costo de lo vendido y márgenes desde todos los movimientos")
+    parser.add_argument('--recalcular', action='store_true', help="reconstruir el estado desde cero")
+    parser.add_argument('--metodo', choices=METODOS, default=None)
+    args = parser.parse_args(argv)
+    from .datos import obtener_motor_costos
+    motor = obtener_motor_costos(args.metodo)
+    if args.recalcular:
+        motor.recalcular()
+    for producto, estado in sorted(motor.estado_productos().items()):
+        print(f"{producto}: {estado['kg']:.1f} kg en stock, costo {estado['costo_kg']:.2f}/kg")
+    resultados = motor.resultados().values()
+    ingreso = sum(r['ingreso_neto'] for r in resultados)
+    margen = sum(r['margen'] for r in resultados)
+    print(f"{len(resultados)} ventas · margen {margen:,.2f} sobre {ingreso:,.2f} neto ({motor.metodo})")
+
+if __name__ == '__main__':
+    main()
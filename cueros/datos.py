@@ -0,0 +1,1169 @@
+"""Acceso a datos de la gestión de cueros: movimientos, clientes, pagos y usuarios.
+
+Se puede importar sin Streamlit. La conexión a Firestore, el almacén en memoria y
+la cola de escritura se crean recién en el primer uso y se comparten en el proceso.
+"""
+import contextvars
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from . import avisos, presupuesto
+from .almacen import COLECCIONES_ALMACEN, AlmacenDatos
+from .busqueda import CAMPOS_BUSQUEDA, IndiceBusqueda
+from .calculos import AcumuladorMovimientos, antiguedad_deudas, resumen_clientes, saldo_pagos
+from .cambios import RegistroCambios, estado_desde_documentos
+from .cola import ColaEscritura
+from .config import (ALMACEN_EN_MEMORIA, COSTOS_LOCAL, COSTOS_METODO, DIARIO_LOCAL, INSTANTANEA_CADA, KPI_VERIFICAR_CADA,
+                     RECALCULO_CADA)
+from .conexion import obtener_db
+from .costos import COLECCIONES_COSTOS, MotorCostos
+from .diario import DiarioLocal
+from .dinero import a_centavos, a_pesos, con_centavos, sumar_centavos
+from .escaneo import EscaneoParticionado, limites_por_ids
+from .filtros import MotorFiltros
+from .lotes import IndiceLotes
+from .kpi import CAMPOS_KPI, COLECCION_KPI, COLECCIONES_KPI, DOCUMENTO_KPI, metricas_kpi, totales_desde_documentos
+from .politica import PoliticaLlamadas
+from .tareas import ProgramadorTareas
+
+_lock = threading.RLock()
+_politica = None
+_diario = None
+_almacen = None
+_cola = None
+_registro = None
+_indice = None
+_motores_costos = {}
+_indice_lotes = None
+_ejecutor = None
+_lecturas_previas = OrderedDict()
+_tamanos_lecturas = OrderedDict()
+_reporte_antiguedad = {}
+_motor_filtros = {}
+_resumen_clientes = {}
+_con_apertura = {}
+_programador = None
+_db_inicializada = False
+_almacen_activo = ALMACEN_EN_MEMORIA
+_ruta_diario = DIARIO_LOCAL
+_ruta_costos = COSTOS_LOCAL
+_acumulado = {}
+_verificador_kpi = None
+_verificacion_kpi = {}
+
+def obtener_politica():
+    """Política de llamadas única para todo el proceso (el cortacircuitos es compartido)"""
+    global _politica
+    with _lock:
+        if _politica is None:
+            _politica = PoliticaLlamadas()
+        return _politica
+
+def obtener_diario():
+    """Diario local único para todos los usuarios del proceso"""
+    global _diario
+    with _lock:
+        if _diario is None:
+            _diario = DiarioLocal(_ruta_diario)
+        return _diario
+
+def obtener_almacen():
+    """Instancia única del almacén para todos los usuarios del proceso"""
+    global _almacen
+    with _lock:
+        if _almacen is None:
+            _almacen = AlmacenDatos(obtener_db(), diario=obtener_diario())
+            try:
+                _almacen.precargar()
+                _almacen.iniciar()
+                _almacen.esperar_carga(timeout=30)
+            except Exception as e:
+                avisos.aviso(f"⚠️ No se pudo iniciar la sincronización en tiempo real: {str(e)}")
+        return _almacen
+
+def obtener_cola():
+    """Cola de escritura única para todos los usuarios del proceso (sin almacén, sin vista optimista)"""
+    global _cola
+    with _lock:
+        if _cola is None:
+            # Sin almacén no se cargan las colecciones solo para escribir
+            almacen = obtener_almacen() if _almacen_activo else None
+            _cola = ColaEscritura(obtener_db(), almacen, obtener_diario(), obtener_politica(),
+                                  registro=obtener_registro_cambios())
+            _cola.iniciar()
+        return _cola
+
+def obtener_registro_cambios():
+    """Registro de cambios (eventos e instantáneas de vistas derivadas) compartido por el proceso"""
+    global _registro
+    with _lock:
+        if _registro is None:
+            _registro = RegistroCambios(obtener_db(), obtener_politica())
+        return _registro
+
+def obtener_indice_busqueda():
+    """Índice de búsqueda único, mantenido al día con los cambios del almacén"""
+    global _indice
+    with _lock:
+        if _indice is None:
+            indice = IndiceBusqueda()
+            almacen = obtener_almacen()
+            for coleccion in CAMPOS_BUSQUEDA:
+                almacen.suscribir(coleccion, indice.aplicar_cambios)
+            _indice = indice
+        return _indice
+
+def buscar(consulta, colecciones=None, limite=20):
+    """Busca clientes y movimientos por prefijo, sin distinguir acentos ni mayúsculas"""
+    return obtener_indice_busqueda().buscar(consulta, colecciones=colecciones, limite=limite)
+
+def obtener_motor_costos(metodo=None):
+    """Motor de costos (uno por método), alimentado por los cambios del almacén.
+
+    Con el hilo de recálculo activo, los recálculos completos los hace la tarea
+    'costos' y mientras tanto se sirven los últimos resultados consistentes.
+    """
+    metodo = metodo or COSTOS_METODO
+    with _lock:
+        motor = _motores_costos.get(metodo)
+        if motor is None:
+            motor = MotorCostos(metodo, ruta=_ruta_costos, en_segundo_plano=_recalculo_activo)
+            almacen = obtener_almacen()
+            for coleccion in COLECCIONES_COSTOS:
+                almacen.suscribir(coleccion, motor.aplicar_cambios)
+            _motores_costos[metodo] = motor
+        return motor
+
+def obtener_indice_lotes():
+    """Índice de lotes de compra único, alimentado por los cambios del almacén"""
+    global _indice_lotes
+    with _lock:
+        if _indice_lotes is None:
+            indice = IndiceLotes()
+            almacen = obtener_almacen()
+            for coleccion in COLECCIONES_COSTOS:
+                almacen.suscribir(coleccion, indice.aplicar_cambios)
+            _indice_lotes = indice
+        return _indice_lotes
+
+def llamar(operacion, funcion, idempotente=True):
+    """Ejecuta funcion(plazo) con la política de llamadas del proceso (plazo, reintentos y cortacircuitos).
+
+    Las escrituras que no se pueden repetir sin duplicarse (add() con ID automático,
+    Increment sin clave de evento) pasan idempotente=False.
+    """
+    return obtener_politica().ejecutar(operacion, funcion, idempotente=idempotente)
+
+def confirmar_lote(operacion, batch, claves):
+    """Confirma un lote cuyos eventos del registro de cambios llevan las claves dadas.
+
+    Si un reintento (de llamar) choca con AlreadyExists, o con la precondición de
+    versión, porque el envío anterior sí se aplicó y se perdió la respuesta, todos
+    sus eventos existen: se da por confirmado. Si faltan eventos, el choque es con
+    otra cosa y se relanza.
+    """
+    from google.api_core import exceptions as google_exceptions
+    try:
+        llamar(operacion, lambda plazo: batch.commit(retry=None, timeout=plazo))
+    except (google_exceptions.AlreadyExists, google_exceptions.FailedPrecondition, google_exceptions.NotFound):
+        registro = obtener_registro_cambios()
+        if not all(registro.registrado(clave) for clave in claves):
+            raise
+
+def _contar(operacion, consulta):
+    """Documentos que devolvería la consulta, con una agregación count() (una lectura cada 1000)"""
+    try:
+        resultado = llamar(f"{operacion}.contar", lambda plazo: consulta.count(alias='total').get(retry=None, timeout=plazo))
+    except Exception:
+        return None
+    total = int((resultado[0][0].value if resultado and resultado[0] else 0) or 0)
+    presupuesto.registrar(1 + total // 1000)
+    return total
+
+# Lecturas de respaldo que se conservan: las operaciones por cliente generan una clave por nombre
+MAX_LECTURAS_PREVIAS = 32
+
+def _lectura_previa(operacion):
+    with _lock:
+        previo = _lecturas_previas.get(operacion)
+        if previo is not None:
+            _lecturas_previas.move_to_end(operacion)
+        return previo
+
+def _guardar_lectura(operacion, resultado, documentos=None):
+    """Guarda el último resultado correcto de una lectura (y su tamaño), descartando las menos usadas"""
+    with _lock:
+        _lecturas_previas[operacion] = resultado
+        _lecturas_previas.move_to_end(operacion)
+        if documentos is not None:
+            _tamanos_lecturas[operacion] = documentos
+            _tamanos_lecturas.move_to_end(operacion)
+        for guardadas in (_lecturas_previas, _tamanos_lecturas):
+            while len(guardadas) > MAX_LECTURAS_PREVIAS:
+                guardadas.popitem(last=False)
+
+def _leer_consulta(operacion, consulta, mensaje_error):
+    """Lee una consulta completa con la política de llamadas y la devuelve como DataFrame.
+
+    Si Firestore falla o el circuito está abierto, devuelve el último resultado
+    correcto de la misma lectura (si lo hay) y avisa que son datos guardados.
+
+    Con presupuesto de lecturas (ver cueros.presupuesto) la consulta se limita a las
+    lecturas apartadas, estimadas por el tamaño de su última lectura completa (o por
+    un count() si no la hay). Si no alcanzan, se sirve el último resultado correcto
+    o, si no lo hay, los primeros documentos que se puedan pagar.
+    """
+    previo = _lectura_previa(operacion)
+    reservadas = None
+    if presupuesto.limitado():
+        estimado = _tamanos_lecturas.get(operacion)
+        if estimado is None:
+            estimado = _contar(operacion, consulta)
+        # Margen para lo que se haya agregado desde la última lectura
+        reservadas = presupuesto.reservar(None if estimado is None else max(1, estimado) + max(20, estimado // 10))
+        if previo is not None and (reservadas == 0 or (estimado is not None and reservadas < max(1, estimado))):
+            presupuesto.registrar(0, reservadas)
+            presupuesto.degradar(operacion, "se muestran los últimos datos obtenidos")
+            return previo
+        if reservadas == 0:
+            presupuesto.registrar(0, reservadas)
+            presupuesto.degradar(operacion, "sin lecturas disponibles")
+            return pd.DataFrame()
+        consulta = consulta.limit(reservadas)
+    try:
+        documentos = llamar(operacion, lambda plazo: list(consulta.stream(retry=None, timeout=plazo)))
+    except Exception as e:
+        presupuesto.registrar(0, reservadas)
+        if previo is not None:
+            avisos.aviso(f"⚠️ {mensaje_error}: se muestran los últimos datos obtenidos ({str(e)})")
+            return previo
+        avisos.error(f"{mensaje_error}: {str(e)}")
+        return pd.DataFrame()
+    presupuesto.registrar(presupuesto.lecturas_de(documentos), reservadas)
+    data = []
+    for documento in documentos:
+        doc_dict = documento.to_dict()
+        doc_dict['id'] = documento.id
+        data.append(doc_dict)
+    df = pd.DataFrame(data) if data else pd.DataFrame()
+    if reservadas is not None and len(documentos) >= reservadas:
+        # Cortada por el límite: no es un resultado completo y la próxima vez se vuelve a contar
+        with _lock:
+            _tamanos_lecturas.pop(operacion, None)
+        presupuesto.degradar(operacion, f"resultado parcial ({len(documentos)} documentos)")
+        return df
+    _guardar_lectura(operacion, df, len(documentos))
+    return df
+
+def version_datos(coleccion=None):
+    """Contador de versión de los datos compartidos, útil como clave de caché"""
+    return obtener_almacen().version(coleccion)
+
+def usar_almacen(activo):
+    """Activa o desactiva las lecturas desde el almacén en memoria (sin él, todo se lee de Firestore)"""
+    global _almacen_activo
+    _almacen_activo = activo
+
+def almacen_activo():
+    return _almacen_activo
+
+def usar_archivos_locales(directorio):
+    """Guarda el diario y la base de costos en otro directorio (p. ej. uno temporal en las pruebas de carga).
+
+    Hay que llamarla antes del primer acceso a datos: así una base de prueba no
+    mezcla sus escrituras pendientes con el diario de la instalación.
+    """
+    global _ruta_diario, _ruta_costos
+    with _lock:
+        _ruta_diario = Path(directorio) / DIARIO_LOCAL.name
+        _ruta_costos = Path(directorio) / COSTOS_LOCAL.name
+
+def _almacen_listo(coleccion):
+    if not _almacen_activo:
+        return None
+    almacen = obtener_almacen()
+    return almacen if almacen.listo(coleccion) else None
+
+@contextmanager
+def _sincronizar(coleccion):
+    """Tras una escritura, espera a que el listener la refleje antes de refrescar la vista"""
+    almacen = _almacen_listo(coleccion)
+    version_previa = almacen.version(coleccion) if almacen is not None else None
+    yield
+    if almacen is not None:
+        almacen.esperar_cambio(coleccion, version_previa)
+
+def init_db():
+    """Inicializar colecciones de Firebase (ya se crean automáticamente); una vez por proceso"""
+    global _db_inicializada
+    if _db_inicializada:
+        return True
+    try:
+        # Verificar que exista un usuario admin
+        usuarios_ref = obtener_db().collection('usuarios')
+        admin_query = llamar('usuarios.buscar_admin', lambda plazo: usuarios_ref.where('usuario', '==', 'admin').limit(1).get(retry=None, timeout=plazo))
+        
+        if not admin_query:
+            # Crear admin por defecto
+            password_hash = hashlib.sha256('admin'.encode('utf-8')).hexdigest()
+            llamar('usuarios.crear', lambda plazo: usuarios_ref.add({
+                'usuario': 'admin',
+                'password_hash': password_hash,
+                'rol': 'admin',
+                'activo': 1,
+                'fecha_creacion': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }, retry=None, timeout=plazo), idempotente=False)
+        _db_inicializada = True
+        return True
+    except Exception as e:
+        avisos.error(f"Error al inicializar Firebase: {str(e)}")
+        return False
+
+def agregar_movimiento(tipo, producto, descripcion, cantidad, peso, precio_total, neto, iva_rate, modo_pago, detalle_pago, dinero_a_cuenta, estado, lotes=None):
+    """Alta de un movimiento; una venta puede nombrar en lotes los IDs de las compras de las que sale"""
+    try:
+        datos = con_centavos('movimientos', {
+            'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'tipo': tipo,
+            'producto': producto,
+            'descripcion': descripcion,
+            'cantidad': cantidad,
+            'peso_kg': peso,
+            'precio_total': precio_total,
+            'neto': neto,
+            'iva_rate': iva_rate,
+            'modo_pago': modo_pago,
+            'detalle_pago': detalle_pago,
+            'dinero_a_cuenta': dinero_a_cuenta,
+            'estado_pago': estado
+        })
+        if lotes:
+            datos['lotes'] = [str(lote) for lote in lotes]
+        return obtener_cola().encolar('movimientos', datos)
+    except Exception as e:
+        avisos.error(f"Error al agregar movimiento: {str(e)}")
+
+# Columnas que usan stock, deudas y saldos por cliente (sin textos libres como detalle_pago)
+CAMPOS_RESUMEN = ('fecha', 'tipo', 'producto', 'descripcion', 'cantidad', 'peso_kg', 'precio_total', 'precio_total_centavos', 'estado_pago')
+
+def _leer_proyectado(coleccion, campos, mensaje_error):
+    """Lectura ordenada por fecha; con campos, solo esas columnas (select() en Firestore)"""
+    almacen = _almacen_listo(coleccion)
+    if almacen is not None:
+        return almacen.dataframe(coleccion, campos)
+    consulta = obtener_db().collection(coleccion)
+    operacion = f"{coleccion}.listar"
+    if campos is not None:
+        consulta = consulta.select(list(campos))
+        operacion += f"[{','.join(campos)}]"
+    consulta = consulta.order_by('fecha', direction='DESCENDING')
+    return _leer_consulta(operacion, consulta, mensaje_error)
+
+def obtener_datos(campos=None):
+    return _leer_proyectado('movimientos', campos, "Error al leer movimientos")
+
+def autenticar_usuario(usuario, password):
+    try:
+        password_hash = hashlib.sha256(password.encode('utf-8')).hexdigest()
+        usuarios_ref = obtener_db().collection('usuarios')
+        consulta = usuarios_ref.where('usuario', '==', usuario).where('password_hash', '==', password_hash).limit(1)
+        query = llamar('usuarios.autenticar', lambda plazo: consulta.get(retry=None, timeout=plazo))
+        presupuesto.registrar(presupuesto.lecturas_de(query))
+        
+        for doc in query:
+            user_data = doc.to_dict()
+            if user_data.get('activo') == 1:
+                return {'usuario': user_data['usuario'], 'rol': user_data['rol']}
+        return None
+    except Exception as e:
+        # Sin conexión: se valida contra la última copia local de usuarios
+        almacen = _almacen_listo('usuarios')
+        if almacen is not None:
+            df_usuarios = almacen.dataframe('usuarios')
+            if not df_usuarios.empty and {'usuario', 'password_hash'} <= set(df_usuarios.columns):
+                coincidencias = df_usuarios[(df_usuarios['usuario'] == usuario) & (df_usuarios['password_hash'] == password_hash)]
+                for _, user_data in coincidencias.iterrows():
+                    if user_data.get('activo') == 1:
+                        return {'usuario': user_data['usuario'], 'rol': user_data['rol']}
+                return None
+        avisos.error(f"Error de autenticación: {str(e)}")
+        return None
+
+def crear_usuario(usuario, password, rol):
+    try:
+        password_hash = hashlib.sha256(password.encode('utf-8')).hexdigest()
+        with _sincronizar('usuarios'):
+            llamar('usuarios.crear', lambda plazo: obtener_db().collection('usuarios').add({
+                'usuario': usuario,
+                'password_hash': password_hash,
+                'rol': rol,
+                'activo': 1,
+                'fecha_creacion': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }, retry=None, timeout=plazo), idempotente=False)
+    except Exception as e:
+        avisos.error(f"Error al crear usuario: {str(e)}")
+        raise
+
+def obtener_usuarios():
+    almacen = _almacen_listo('usuarios')
+    if almacen is not None:
+        return almacen.dataframe('usuarios')
+    return _leer_consulta('usuarios.listar', obtener_db().collection('usuarios'), "Error al obtener usuarios")
+
+def actualizar_estado_usuario(user_id, activo):
+    try:
+        with _sincronizar('usuarios'):
+            llamar('usuarios.actualizar', lambda plazo: obtener_db().collection('usuarios').document(user_id).update({
+                'activo': 1 if activo else 0
+            }, retry=None, timeout=plazo))
+    except Exception as e:
+        avisos.error(f"Error al actualizar estado: {str(e)}")
+
+def actualizar_password(user_id, new_password):
+    try:
+        password_hash = hashlib.sha256(new_password.encode('utf-8')).hexdigest()
+        with _sincronizar('usuarios'):
+            llamar('usuarios.actualizar', lambda plazo: obtener_db().collection('usuarios').document(user_id).update({
+                'password_hash': password_hash
+            }, retry=None, timeout=plazo))
+    except Exception as e:
+        avisos.error(f"Error al actualizar contraseña: {str(e)}")
+
+def actualizar_rol_usuario(user_id, rol):
+    try:
+        doc = llamar('usuarios.obtener', lambda plazo: obtener_db().collection('usuarios').document(user_id).get(retry=None, timeout=plazo))
+        presupuesto.registrar(1)
+        if doc.exists and doc.to_dict().get('usuario') != 'admin':
+            with _sincronizar('usuarios'):
+                llamar('usuarios.actualizar', lambda plazo: obtener_db().collection('usuarios').document(user_id).update({'rol': rol}, retry=None, timeout=plazo))
+    except Exception as e:
+        avisos.error(f"Error al actualizar rol: {str(e)}")
+
+def eliminar_usuario(user_id):
+    try:
+        doc = llamar('usuarios.obtener', lambda plazo: obtener_db().collection('usuarios').document(user_id).get(retry=None, timeout=plazo))
+        presupuesto.registrar(1)
+        if doc.exists and doc.to_dict().get('usuario') != 'admin':
+            with _sincronizar('usuarios'):
+                llamar('usuarios.eliminar', lambda plazo: obtener_db().collection('usuarios').document(user_id).delete(retry=None, timeout=plazo))
+    except Exception as e:
+        avisos.error(f"Error al eliminar usuario: {str(e)}")
+
+def actualizar_movimiento(mov_id, tipo, producto, descripcion, cantidad, peso_kg, precio_total, neto, iva_rate, modo_pago, detalle_pago, dinero_a_cuenta, estado_pago):
+    try:
+        obtener_cola().encolar_actualizacion('movimientos', mov_id, con_centavos('movimientos', {
+            'tipo': tipo,
+            'producto': producto,
+            'descripcion': descripcion,
+            'cantidad': cantidad,
+            'peso_kg': peso_kg,
+            'precio_total': precio_total,
+            'neto': neto,
+            'iva_rate': iva_rate,
+            'modo_pago': modo_pago,
+            'detalle_pago': detalle_pago,
+            'dinero_a_cuenta': dinero_a_cuenta,
+            'estado_pago': estado_pago
+        }))
+    except Exception as e:
+        avisos.error(f"Error al actualizar movimiento: {str(e)}")
+
+def actualizar_en_bloque(coleccion, cambios):
+    """Ediciones de varios documentos, {doc_id: campos que cambian}, confirmadas en un solo lote.
+
+    Los campos van tal como se guardan (ver edicion.cambios_tabla). Devuelve los
+    documentos encolados.
+    """
+    try:
+        return obtener_cola().encolar_actualizaciones(coleccion, cambios)
+    except Exception as e:
+        avisos.error(f"Error al actualizar {coleccion}: {str(e)}")
+        return 0
+
+def eliminar_movimiento(mov_id):
+    try:
+        obtener_cola().encolar_eliminacion('movimientos', mov_id)
+    except Exception as e:
+        avisos.error(f"Error al eliminar movimiento: {str(e)}")
+
+def eliminar_movimientos_cliente(cliente):
+    try:
+        df_movimientos = obtener_datos()
+        if df_movimientos.empty or 'descripcion' not in df_movimientos.columns:
+            return
+        cola = obtener_cola()
+        for mov_id in df_movimientos.loc[df_movimientos['descripcion'] == cliente, 'id']:
+            cola.encolar_eliminacion('movimientos', mov_id)
+    except Exception as e:
+        avisos.error(f"Error al eliminar movimientos: {str(e)}")
+
+def crear_cliente(nombre, tipo, contacto, telefono, email, direccion, notas):
+    try:
+        return obtener_cola().encolar('clientes', {
+            'nombre': nombre,
+            'tipo': tipo,
+            'contacto': contacto,
+            'telefono': telefono,
+            'email': email,
+            'direccion': direccion,
+            'notas': notas,
+            'activo': 1,
+            'fecha_creacion': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+    except Exception as e:
+        avisos.error(f"Error al crear cliente: {str(e)}")
+        raise
+
+def obtener_clientes():
+    almacen = _almacen_listo('clientes')
+    if almacen is not None:
+        return almacen.dataframe('clientes')
+    return _leer_consulta('clientes.listar', obtener_db().collection('clientes').order_by('nombre'), "Error al obtener clientes")
+
+def actualizar_cliente(cliente_id, nombre, tipo, contacto, telefono, email, direccion, notas, activo):
+    try:
+        obtener_cola().encolar_actualizacion('clientes', cliente_id, {
+            'nombre': nombre,
+            'tipo': tipo,
+            'contacto': contacto,
+            'telefono': telefono,
+            'email': email,
+            'direccion': direccion,
+            'notas': notas,
+            'activo': 1 if activo else 0
+        })
+    except Exception as e:
+        avisos.error(f"Error al actualizar cliente: {str(e)}")
+
+def eliminar_cliente(cliente_id):
+    try:
+        obtener_cola().encolar_eliminacion('clientes', cliente_id)
+    except Exception as e:
+        avisos.error(f"Error al eliminar cliente: {str(e)}")
+
+def obtener_cliente_por_id(cliente_id):
+    almacen = _almacen_listo('clientes')
+    if almacen is not None:
+        return almacen.documento('clientes', str(cliente_id))
+    try:
+        doc = llamar('clientes.obtener', lambda plazo: obtener_db().collection('clientes').document(str(cliente_id)).get(retry=None, timeout=plazo))
+        presupuesto.registrar(1)
+        if doc.exists:
+            data = doc.to_dict()
+            data['id'] = doc.id
+            return data
+        return None
+    except Exception as e:
+        avisos.error(f"Error al obtener cliente: {str(e)}")
+        return None
+
+def agregar_pago_cuenta(cliente_nombre, monto, concepto, tipo):
+    try:
+        return obtener_cola().encolar('pagos_cuenta', con_centavos('pagos_cuenta', {
+            'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'cliente_nombre': cliente_nombre,
+            'monto': monto,
+            'concepto': concepto,
+            'tipo': tipo
+        }))
+    except Exception as e:
+        avisos.error(f"Error al agregar pago: {str(e)}")
+
+def obtener_pagos_cuenta():
+    almacen = _almacen_listo('pagos_cuenta')
+    if almacen is not None:
+        return almacen.dataframe('pagos_cuenta')
+    consulta = obtener_db().collection('pagos_cuenta').order_by('fecha', direction='DESCENDING')
+    return _leer_consulta('pagos_cuenta.listar', consulta, "Error al obtener pagos")
+
+def obtener_pagos_cuenta_cliente(cliente_nombre):
+    almacen = _almacen_listo('pagos_cuenta')
+    if almacen is not None:
+        df_pagos = almacen.dataframe('pagos_cuenta')
+        if df_pagos.empty or 'cliente_nombre' not in df_pagos.columns:
+            return pd.DataFrame()
+        return df_pagos[df_pagos['cliente_nombre'] == cliente_nombre]
+    consulta = obtener_db().collection('pagos_cuenta').where('cliente_nombre', '==', cliente_nombre).order_by('fecha', direction='DESCENDING')
+    return _leer_consulta(f"pagos_cuenta.cliente:{cliente_nombre}", consulta, "Error al obtener pagos del cliente")
+
+def calcular_saldo_cliente(cliente_nombre):
+    try:
+        return saldo_pagos(obtener_pagos_cuenta_cliente(cliente_nombre))
+    except Exception as e:
+        avisos.error(f"Error al calcular saldo: {str(e)}")
+        return 0
+
+def eliminar_pago_cuenta(pago_id):
+    try:
+        obtener_cola().encolar_eliminacion('pagos_cuenta', pago_id)
+    except Exception as e:
+        avisos.error(f"Error al eliminar pago: {str(e)}")
+
+def obtener_saldos_apertura(campos=None):
+    return _leer_proyectado('saldos_apertura', campos, "Error al obtener saldos de apertura")
+
+def obtener_datos_con_apertura(campos=None):
+    """Movimientos activos seguidos de los saldos de apertura de los años archivados.
+
+    Los saldos tienen la misma forma que un movimiento, así que stock, deudas y
+    estados de cuenta parten de ellos sin cambiar los cálculos. Las vistas que
+    solo necesitan algunas columnas pasan campos (p. ej. CAMPOS_RESUMEN). Si los
+    datos salen del almacén, attrs['versiones'] tiene las versiones de ambas
+    colecciones, útiles como clave de caché de lo que se calcule sobre ellos, y
+    la unión se guarda por versiones y campos.
+    """
+    df_movimientos = obtener_datos(campos)
+    df_apertura = obtener_saldos_apertura(campos)
+    versiones = (df_movimientos.attrs.get('version'), df_apertura.attrs.get('version'))
+    clave_campos = tuple(campos) if campos is not None else None
+    if None not in versiones:
+        with _lock:
+            guardado = _con_apertura.get(clave_campos)
+        if guardado is not None and guardado[0] == versiones:
+            return guardado[1].copy(deep=False)
+    if df_apertura.empty:
+        df = df_movimientos
+    elif df_movimientos.empty:
+        df = df_apertura.assign(es_apertura=True)
+    else:
+        df = pd.concat([df_movimientos, df_apertura.assign(es_apertura=True)], ignore_index=True)
+    if None not in versiones:
+        df.attrs['versiones'] = versiones
+        with _lock:
+            _con_apertura[clave_campos] = (versiones, df)
+        return df.copy(deep=False)
+    return df
+
+# --- TOTALES POR CLIENTE CON AGREGACIONES EN FIRESTORE ---
+TIPO_COMPRA = 'Ingreso (Compra)'
+TIPO_VENTA = 'Egreso (Venta)'
+
+# (clave del resultado, tipo, estado_pago o None para todos)
+TOTALES_CLIENTE = (
+    ('total_comprado', TIPO_COMPRA, None),
+    ('total_vendido', TIPO_VENTA, None),
+    ('deuda_compras', TIPO_COMPRA, 'Impago'),
+    ('deuda_ventas', TIPO_VENTA, 'Impago'),
+)
+
+def _sumar_precio_cliente(cliente_nombre, tipo, estado_pago):
+    """sum(precio_total) de los movimientos del cliente, calculada en el servidor, en centavos"""
+    consulta = obtener_db().collection('movimientos').where('descripcion', '==', cliente_nombre).where('tipo', '==', tipo)
+    if estado_pago is not None:
+        consulta = consulta.where('estado_pago', '==', estado_pago)
+    agregacion = consulta.sum('precio_total', alias='total')
+    resultado = llamar('movimientos.sumar_cliente', lambda plazo: agregacion.get(retry=None, timeout=plazo))
+    # La suma se pide sobre los pesos (los documentos sin migrar no tienen centavos) y se redondea al centavo
+    return a_centavos((resultado[0][0].value if resultado and resultado[0] else 0) or 0)
+
+def totales_cliente(cliente_nombre):
+    """Comprado, vendido y deudas (impagas) de un cliente, incluidos sus saldos de apertura.
+
+    Con el almacén listo se calculan en memoria. Si no, se piden a Firestore como
+    agregaciones sum() filtradas por descripcion (en paralelo), más la consulta de
+    los pocos saldos de apertura del cliente: unas pocas lecturas en lugar de
+    descargar toda la colección de movimientos.
+    """
+    totales = {clave: 0 for clave, _tipo, _estado in TOTALES_CLIENTE}
+    if _almacen_listo('movimientos') is not None and _almacen_listo('saldos_apertura') is not None:
+        df_cliente = obtener_datos_con_apertura(CAMPOS_RESUMEN)
+        if df_cliente.empty or 'descripcion' not in df_cliente.columns:
+            return totales
+        df_cliente = df_cliente[df_cliente['descripcion'] == cliente_nombre]
+        for clave, tipo, estado_pago in TOTALES_CLIENTE:
+            filtro = df_cliente['tipo'] == tipo
+            if estado_pago is not None:
+                filtro &= df_cliente['estado_pago'] == estado_pago
+            totales[clave] = a_pesos(sumar_centavos(df_cliente, 'precio_total', filtro))
+        return totales
+    operacion = f"movimientos.totales_cliente:{cliente_nombre}"
+    # Cada agregación sum() cuesta una lectura (por cada 1000 entradas de índice)
+    reservadas = presupuesto.reservar(len(TOTALES_CLIENTE))
+    if reservadas is not None and reservadas < len(TOTALES_CLIENTE):
+        presupuesto.registrar(0, reservadas)
+        previos = _lectura_previa(operacion)
+        presupuesto.degradar(operacion, "se muestran los últimos totales obtenidos" if previos is not None else "sin lecturas disponibles")
+        return dict(previos) if previos is not None else totales
+    try:
+        ejecutor = _obtener_ejecutor()
+        futuros = {clave: ejecutor.submit(_sumar_precio_cliente, cliente_nombre, tipo, estado_pago)
+                   for clave, tipo, estado_pago in TOTALES_CLIENTE}
+        consulta = obtener_db().collection('saldos_apertura').where('descripcion', '==', cliente_nombre).select(list(CAMPOS_RESUMEN))
+        df_apertura = _leer_consulta(f"saldos_apertura.cliente:{cliente_nombre}", consulta, "Error al obtener saldos de apertura del cliente")
+        for clave, tipo, estado_pago in TOTALES_CLIENTE:
+            centavos = futuros[clave].result()
+            if not df_apertura.empty:
+                filtro = df_apertura['tipo'] == tipo
+                if estado_pago is not None:
+                    filtro &= df_apertura['estado_pago'] == estado_pago
+                centavos += sumar_centavos(df_apertura, 'precio_total', filtro)
+            totales[clave] = a_pesos(centavos)
+        presupuesto.registrar(len(TOTALES_CLIENTE), reservadas)
+        _guardar_lectura(operacion, dict(totales))
+    except Exception as e:
+        presupuesto.registrar(0, reservadas)
+        avisos.error(f"Error al calcular totales del cliente: {str(e)}")
+    return totales
+
+# --- ANTIGÜEDAD DE DEUDAS ---
+CAMPOS_ANTIGUEDAD = ('fecha', 'tipo', 'descripcion', 'precio_total', 'precio_total_centavos', 'estado_pago')
+
+def _leer_impagos(coleccion):
+    consulta = obtener_db().collection(coleccion).where('estado_pago', '==', 'Impago').select(list(CAMPOS_ANTIGUEDAD))
+    return _leer_consulta(f"{coleccion}.impagos", consulta, "Error al obtener deudas impagas")
+
+def reporte_antiguedad(hoy=None):
+    """Deudas impagas por cliente y tramo de antigüedad (ver calculos.antiguedad_deudas).
+
+    Con el almacén listo el reporte se guarda por versión de movimientos y saldos
+    de apertura (y por día), así que solo se recalcula cuando cambian los datos.
+    Sin almacén se leen solo los movimientos impagos, proyectados a los campos que usa.
+    """
+    hoy = pd.Timestamp(hoy).normalize() if hoy is not None else pd.Timestamp.now().normalize()
+    almacen = _almacen_listo('movimientos')
+    if almacen is not None and almacen.listo('saldos_apertura'):
+        clave = (almacen.version('movimientos'), almacen.version('saldos_apertura'), hoy)
+        with _lock:
+            if _reporte_antiguedad.get('clave') == clave:
+                return _reporte_antiguedad['reporte']
+        reporte = antiguedad_deudas(obtener_datos_con_apertura(CAMPOS_ANTIGUEDAD), hoy)
+        with _lock:
+            _reporte_antiguedad.update(clave=clave, reporte=reporte)
+        return reporte
+    try:
+        partes = [df for df in (_leer_impagos('movimientos'), _leer_impagos('saldos_apertura')) if not df.empty]
+    except Exception as e:
+        avisos.error(f"Error al calcular la antigüedad de deudas: {str(e)}")
+        partes = []
+    return antiguedad_deudas(pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(), hoy)
+
+def obtener_motor_filtros(df):
+    """Motor de filtros (cueros.filtros) para el DataFrame de obtener_datos_con_apertura.
+
+    Si el DataFrame salió del almacén, el motor se guarda por versión de movimientos
+    y saldos de apertura: cambiar un filtro en un rerun no vuelve a recorrer los datos.
+    """
+    versiones = df.attrs.get('versiones')
+    if versiones is None:
+        return MotorFiltros(df)
+    clave = (versiones, tuple(df.columns), len(df))
+    with _lock:
+        if _motor_filtros.get('clave') == clave:
+            return _motor_filtros['motor']
+    motor = MotorFiltros(df)
+    with _lock:
+        _motor_filtros.update(clave=clave, motor=motor)
+    return motor
+
+def obtener_resumen_clientes(df, df_pagos):
+    """Resumen de todos los clientes (calculos.resumen_clientes) para los DataFrames de
+    obtener_datos_con_apertura y obtener_pagos_cuenta.
+
+    Si ambos salieron del almacén, el resumen se guarda por sus versiones.
+    """
+    versiones = df.attrs.get('versiones')
+    version_pagos = df_pagos.attrs.get('version')
+    if versiones is None or version_pagos is None:
+        return resumen_clientes(df, df_pagos)
+    clave = (versiones, version_pagos, tuple(df.columns), len(df), len(df_pagos))
+    with _lock:
+        if _resumen_clientes.get('clave') == clave:
+            return _resumen_clientes['resumen']
+    resumen = resumen_clientes(df, df_pagos)
+    with _lock:
+        _resumen_clientes.update(clave=clave, resumen=resumen)
+    return resumen
+
+# --- ESCANEO COMPLETO EN PARALELO ---
+def escanear_coleccion(coleccion, particiones=8, trabajadores=8, tam_pagina=500, campos=None, reanudar=None, con_version=False):
+    """Escaneo de toda la colección en Firestore por rangos de ID en paralelo (ver cueros.escaneo).
+
+    Con el almacén listo, los cortes salen de los IDs que ya conoce (rangos del
+    mismo tamaño sin pedir una partition query). Se itera por páginas.
+    """
+    limites = None
+    almacen = _almacen_listo(coleccion) if coleccion in COLECCIONES_ALMACEN else None
+    if almacen is not None and reanudar is None:
+        df_ids = almacen.dataframe(coleccion, ())
+        limites = limites_por_ids(df_ids['id'] if not df_ids.empty else [], particiones)
+    return EscaneoParticionado(obtener_db(), obtener_politica(), coleccion, particiones=particiones, trabajadores=trabajadores,
+                               tam_pagina=tam_pagina, campos=campos, limites=limites, reanudar=reanudar,
+                               con_version=con_version)
+
+# --- MÉTRICAS EN FLUJO (SIN DATAFRAME) ---
+CAMPOS_ACUMULADOS = ('tipo', 'producto', 'descripcion', 'cantidad', 'peso_kg', 'precio_total', 'precio_total_centavos', 'estado_pago')
+# Segundos durante los que se reutiliza el último acumulado leído de Firestore
+VIGENCIA_ACUMULADO = 30
+
+def acumular_movimientos():
+    """Movimientos, saldos de apertura y pagos a cuenta sumados por grupo mientras se leen.
+
+    Recorre las colecciones con el escaneo paralelo y va sumando cada página en un
+    AcumuladorMovimientos, así la memoria depende de la cantidad de grupos (tipo,
+    producto, estado, cliente) y no de los años de historia. El resultado se
+    reutiliza durante VIGENCIA_ACUMULADO segundos.
+    """
+    with _lock:
+        if _acumulado and time.monotonic() - _acumulado['momento'] < VIGENCIA_ACUMULADO:
+            return _acumulado['acumulador']
+    acumulador = AcumuladorMovimientos()
+    for coleccion in ('movimientos', 'saldos_apertura'):
+        for pagina in escanear_coleccion(coleccion, campos=CAMPOS_ACUMULADOS):
+            acumulador.consumir(pagina)
+    for pagina in escanear_coleccion('pagos_cuenta', campos=('cliente_nombre', 'monto', 'monto_centavos', 'tipo')):
+        for datos in pagina:
+            acumulador.agregar_pago(datos)
+    with _lock:
+        _acumulado.update(momento=time.monotonic(), acumulador=acumulador)
+    return acumulador
+
+def metricas_en_flujo(cliente=None, producto=None, estado_pago=None):
+    """Las métricas de stock y finanzas sin armar el DataFrame de movimientos (ver acumular_movimientos)"""
+    return acumular_movimientos().metricas(cliente=cliente, producto=producto, estado_pago=estado_pago)
+
+# --- VISTAS DERIVADAS DESDE EL REGISTRO DE CAMBIOS ---
+# Eventos a partir de los cuales una reconstrucción guarda una instantánea nueva
+EVENTOS_POR_INSTANTANEA = 500
+
+def _documentos_actuales(desde_firestore=False, colecciones=('movimientos', 'saldos_apertura', 'pagos_cuenta')):
+    """Documentos de las colecciones que alimentan las vistas; desde_firestore lee el servidor con escaneo paralelo"""
+    if desde_firestore:
+        return {coleccion: (datos for pagina in escanear_coleccion(coleccion) for datos in pagina)
+                for coleccion in colecciones}
+    lecturas = {'movimientos': obtener_datos, 'saldos_apertura': obtener_saldos_apertura, 'pagos_cuenta': obtener_pagos_cuenta}
+    documentos = {}
+    for coleccion in colecciones:
+        df = lecturas[coleccion]()
+        documentos[coleccion] = df.to_dict('records') if not df.empty else []
+    return documentos
+
+def reconstruir_vista(vista, guardar=False):
+    """Estado de una vista derivada ('stock' o 'saldos') desde la última instantánea y los eventos posteriores.
+
+    Sin instantánea se crea la primera desde los datos actuales. Si hubo que aplicar
+    EVENTOS_POR_INSTANTANEA eventos o más (o con guardar=True) se guarda una nueva,
+    así la próxima reconstrucción arranca de ahí. Devuelve (estado, informe).
+    """
+    registro = obtener_registro_cambios()
+    if registro.instantanea(vista) is None:
+        estado = registro.instantanea_inicial(vista, _documentos_actuales())
+        return estado, {'vista': vista, 'instantanea': True, 'desde': None, 'eventos': 0, 'hasta': None, 'inicial': True}
+    estado, informe = registro.reconstruir(vista)
+    if informe['eventos'] and (guardar or informe['eventos'] >= EVENTOS_POR_INSTANTANEA):
+        registro.guardar_instantanea(vista, estado, informe['hasta'])
+    return estado, informe
+
+def verificar_vista(vista, desde_firestore=False):
+    """Compara la vista reconstruida con la calculada desde los datos actuales; devuelve (informe, diferencias).
+
+    Con desde_firestore=True los datos actuales se leen del servidor (escaneo
+    paralelo) en vez del almacén: sirve para conciliar los saldos con Firebase.
+    """
+    estado, informe = reconstruir_vista(vista)
+    esperado = estado_desde_documentos(vista, _documentos_actuales(desde_firestore))
+    diferencias = []
+    for clave in sorted(set(estado) | set(esperado)):
+        for campo in sorted(set(estado.get(clave, {})) | set(esperado.get(clave, {}))):
+            reconstruido = estado.get(clave, {}).get(campo, 0.0)
+            actual = esperado.get(clave, {}).get(campo, 0.0)
+            if abs(reconstruido - actual) > 0.005:
+                diferencias.append({'clave': clave, 'campo': campo, 'reconstruido': reconstruido, 'actual': actual})
+    return informe, diferencias
+
+# --- RECÁLCULO EN SEGUNDO PLANO DE LAS VISTAS DERIVADAS ---
+COLECCIONES_VISTAS = ('movimientos', 'saldos_apertura', 'pagos_cuenta')
+
+def _vistas_listas(colecciones):
+    return lambda: _almacen_activo and all(obtener_almacen().listo(coleccion) for coleccion in colecciones)
+
+def _versiones(colecciones, por_dia=False):
+    def clave():
+        almacen = obtener_almacen()
+        versiones = tuple(almacen.version(coleccion) for coleccion in colecciones)
+        # La antigüedad cambia de tramo con el día aunque los datos no cambien
+        return (versiones, datetime.now().date()) if por_dia else versiones
+    return clave
+
+def _periodo(segundos):
+    return lambda: int(time.time() // segundos)
+
+def _instantanea_lista():
+    # La instantánea inicial toma los documentos como están: sin escrituras en curso
+    return _vistas_listas(COLECCIONES_VISTAS)() and not obtener_cola().pendientes()
+
+def _recalculo_activo():
+    return _programador is not None and _programador.activo()
+
+def _costos_al_dia():
+    obtener_motor_costos()
+    for motor in list(_motores_costos.values()):
+        motor.poner_al_dia()
+
+def _cambios_costos():
+    # Cambia con cada movimiento que recibe un motor, también si llegó durante un recálculo descartado
+    return tuple((motor.metodo, motor.cambios) for motor in list(_motores_costos.values()))
+
+def obtener_programador():
+    """Programador único de las tareas que recalculan las vistas derivadas (ver cueros.tareas).
+
+    Las tareas solo corren con el almacén cargado (sin él, recalcular en segundo
+    plano gastaría lecturas de Firestore) y dejan sus resultados en las mismas
+    cachés por versión que leen las páginas. Además, cada INSTANTANEA_CADA
+    segundos se guarda una instantánea de stock y saldos con los eventos nuevos.
+    """
+    global _programador
+    with _lock:
+        if _programador is not None:
+            return _programador
+        programador = ProgramadorTareas(cada=RECALCULO_CADA)
+        apertura = ('movimientos', 'saldos_apertura')
+        programador.registrar('movimientos', obtener_datos_con_apertura, _versiones(apertura), _vistas_listas(apertura))
+        programador.registrar('filtros', lambda: obtener_motor_filtros(obtener_datos_con_apertura()),
+                              _versiones(apertura), _vistas_listas(apertura))
+        programador.registrar('resumen_clientes', lambda: obtener_resumen_clientes(obtener_datos_con_apertura(), obtener_pagos_cuenta()),
+                              _versiones(COLECCIONES_VISTAS), _vistas_listas(COLECCIONES_VISTAS))
+        programador.registrar('antiguedad', reporte_antiguedad, _versiones(apertura, por_dia=True), _vistas_listas(apertura))
+        programador.registrar('costos', _costos_al_dia, _cambios_costos, _vistas_listas(COLECCIONES_COSTOS))
+        programador.registrar('lotes', lambda: obtener_indice_lotes().lotes_abiertos(),
+                              _versiones(COLECCIONES_COSTOS), _vistas_listas(COLECCIONES_COSTOS))
+        if INSTANTANEA_CADA:
+            for vista in ('stock', 'saldos'):
+                programador.registrar(f"instantanea_{vista}", lambda vista=vista: reconstruir_vista(vista, guardar=True),
+                                      _periodo(INSTANTANEA_CADA), _instantanea_lista)
+        almacen = obtener_almacen()
+        for coleccion in COLECCIONES_VISTAS:
+            almacen.suscribir(coleccion, programador.avisar)
+        _programador = programador
+        return _programador
+
+def iniciar_recalculo():
+    """Arranca (una vez por proceso) el hilo de recálculo de vistas derivadas, si RECALCULO_CADA no es 0"""
+    if _almacen_activo:
+        obtener_programador().iniciar()
+
+def estado_recalculo():
+    """Informe de las tareas de recálculo (ProgramadorTareas.informe) y si el hilo está activo"""
+    programador = obtener_programador()
+    return {'activo': programador.activo(), 'cada': programador.cada, 'tareas': programador.informe()}
+
+# --- TOTALES GLOBALES MANTENIDOS (KPI) ---
+def _referencia_kpi():
+    return obtener_db().collection(COLECCION_KPI).document(DOCUMENTO_KPI)
+
+def _leer_kpi():
+    ref = _referencia_kpi()
+    doc = llamar('kpis.leer', lambda plazo: ref.get(retry=None, timeout=plazo))
+    presupuesto.registrar(1)
+    return doc.to_dict() if doc.exists else None
+
+def metricas_globales():
+    """Métricas del tablero sin filtros desde kpis/global (una lectura) más las escrituras aún en la cola.
+
+    Devuelve None si el documento todavía no fue inicializado por el verificador o
+    no se puede leer: entonces hay que calcularlas desde los movimientos.
+    """
+    iniciar_verificador_kpi()
+    try:
+        guardado = _leer_kpi()
+    except Exception as e:
+        avisos.aviso(f"⚠️ No se pudieron leer los totales globales, se calculan desde los movimientos ({str(e)})")
+        return None
+    if not guardado or not guardado.get('inicializado'):
+        return None
+    totales = {campo: guardado.get(campo) or 0 for campo in CAMPOS_KPI}
+    for campo, valor in obtener_cola().incrementos_pendientes().items():
+        totales[campo] += valor
+    return metricas_kpi(totales)
+
+def _sin_escrituras_fallidas(documentos):
+    """Los documentos con una escritura fallida o en conflicto como están en Firestore.
+
+    El almacén los sigue mostrando con la escritura aplicada, pero kpis/global no la
+    sumó: contarlos así daría una deriva falsa. Se lee uno por documento afectado.
+    """
+    afectados = {(entrada['coleccion'], entrada['id']) for entrada in obtener_cola().fallidas() if entrada['coleccion'] in documentos}
+    if not afectados:
+        return documentos
+    resultado = {coleccion: [datos for datos in docs if (coleccion, str(datos.get('id'))) not in afectados]
+                 for coleccion, docs in documentos.items()}
+    for coleccion, doc_id in sorted(afectados):
+        ref = obtener_db().collection(coleccion).document(doc_id)
+        doc = llamar('kpis.leer_fallida', lambda plazo: ref.get(retry=None, timeout=plazo))
+        presupuesto.registrar(1)
+        if doc.exists:
+            resultado[coleccion].append({**doc.to_dict(), 'id': doc_id})
+    return resultado
+
+def verificar_kpi(corregir=False, desde_firestore=False):
+    """Recalcula los totales desde los documentos y los compara con kpis/global.
+
+    Con el almacén, los documentos ya incluyen las escrituras en cola, así que se
+    comparan con el documento más lo pendiente (los de escrituras fallidas se leen
+    de Firestore); desde_firestore escanea el servidor.
+    Con corregir, si hay diferencias o el documento no está inicializado, suma la
+    diferencia con Increment, sin pisar lo que se confirme mientras tanto.
+    Devuelve {'guardado', 'recalculado', 'diferencias', 'corregido', 'momento'}.
+    """
+    documentos = _documentos_actuales(desde_firestore, COLECCIONES_KPI)
+    if not desde_firestore:
+        documentos = _sin_escrituras_fallidas(documentos)
+    recalculado = totales_desde_documentos(documentos)
+    guardado = _leer_kpi() or {}
+    comparado = {campo: guardado.get(campo) or 0 for campo in CAMPOS_KPI}
+    if not desde_firestore:
+        for campo, valor in obtener_cola().incrementos_pendientes().items():
+            comparado[campo] += valor
+    diferencias = {campo: recalculado[campo] - comparado[campo] for campo in CAMPOS_KPI if recalculado[campo] != comparado[campo]}
+    informe = {
+        'guardado': {campo: guardado.get(campo) or 0 for campo in CAMPOS_KPI},
+        'recalculado': recalculado,
+        'diferencias': diferencias,
+        'inicializado': bool(guardado.get('inicializado')),
+        'corregido': False,
+        'momento': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    if corregir and (diferencias or not informe['inicializado']):
+        corregir_kpi(diferencias)
+        informe['corregido'] = True
+    return informe
+
+def corregir_kpi(diferencias):
+    """Suma a kpis/global las diferencias encontradas por verificar_kpi y lo marca como inicializado"""
+    from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+    from google.cloud.firestore_v1.transforms import Increment
+    cambios = {campo: Increment(valor) for campo, valor in diferencias.items() if valor}
+    cambios.update(inicializado=True, verificado=SERVER_TIMESTAMP)
+    ref = _referencia_kpi()
+    llamar('kpis.corregir', lambda plazo: ref.set(cambios, merge=True, retry=None, timeout=plazo), idempotente=False)
+
+# Una deriva se vuelve a verificar a los pocos segundos, no un intervalo entero después
+KPI_RECONFIRMAR = 60
+
+def _verificar_kpi_periodicamente(intervalo):
+    previas = None
+    while True:
+        if _almacen_activo and not all(obtener_almacen().en_vivo(coleccion) for coleccion in COLECCIONES_KPI):
+            # Se verifica contra datos en vivo: una copia local vieja daría una deriva falsa
+            time.sleep(min(intervalo, 5))
+            continue
+        try:
+            with avisos.capturar():
+                informe = verificar_kpi()
+                diferencias = informe['diferencias']
+                # Sin inicializar se corrige enseguida; una deriva, solo si se repite igual en la
+                # verificación siguiente (una escritura en curso no llega a dos seguidas)
+                if not informe['inicializado'] or (diferencias and diferencias == previas):
+                    corregir_kpi(diferencias)
+                    informe['corregido'] = True
+                    diferencias = None
+            previas = diferencias or None
+            _verificacion_kpi.clear()
+            _verificacion_kpi.update(informe)
+        except Exception as e:
+            _verificacion_kpi.update(error=str(e), momento=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        time.sleep(min(intervalo, KPI_RECONFIRMAR) if previas else intervalo)
+
+def iniciar_verificador_kpi(intervalo=KPI_VERIFICAR_CADA):
+    """Arranca (una vez por proceso) el hilo que verifica y corrige kpis/global cada intervalo segundos"""
+    global _verificador_kpi
+    if not intervalo:
+        return
+    with _lock:
+        if _verificador_kpi is None:
+            _verificador_kpi = threading.Thread(target=_verificar_kpi_periodicamente, args=(intervalo,),
+                                                name="verificador-kpi", daemon=True)
+            _verificador_kpi.start()
+
+def ultima_verificacion_kpi():
+    """Informe de la última verificación periódica de kpis/global ({} si todavía no corrió)"""
+    return dict(_verificacion_kpi)
+
+# --- PRECARGA CONCURRENTE DE LAS LECTURAS DE UNA PÁGINA ---
+LECTURAS_PAGINA = {
+    'clientes': obtener_clientes,
+    'movimientos': obtener_datos_con_apertura,
+    'pagos_cuenta': obtener_pagos_cuenta,
+    'usuarios': obtener_usuarios,
+}
+
+def _obtener_ejecutor():
+    global _ejecutor
+    with _lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="precarga")
+        return _ejecutor
+
+class Precarga:
+    """Lecturas de una página lanzadas a la vez en un pool de hilos.
+
+    Cada sección pide con resultado() la lectura que necesita; si todavía no terminó,
+    espera solo por esa. Los avisos de error de cada lectura se capturan en el hilo
+    auxiliar y se muestran en el hilo que pide el resultado. informe() mide cuánto
+    se solaparon las lecturas.
+    """
+
+    def __init__(self, lecturas, ejecutor):
+        self._inicio = time.perf_counter()
+        self._tiempos = {}
+        self._avisos = {}
+        self._entregados = set()
+        # Cada lectura corre con una copia del contexto, así anota en la cuenta de la sesión
+        self._futuros = {nombre: ejecutor.submit(contextvars.copy_context().run, self._leer, nombre, funcion)
+                         for nombre, funcion in lecturas.items()}
+
+    def _leer(self, nombre, funcion):
+        inicio = time.perf_counter()
+        presupuesto.entrar_seccion(f"precarga.{nombre}")
+        try:
+            with avisos.capturar() as mensajes:
+                return funcion()
+        finally:
+            self._avisos[nombre] = mensajes
+            self._tiempos[nombre] = (inicio - self._inicio, time.perf_counter() - self._inicio)
+
+    def futuro(self, nombre):
+        return self._futuros[nombre]
+
+    def resultado(self, nombre, timeout=None):
+        resultado = self._futuros[nombre].result(timeout)
+        if nombre not in self._entregados:
+            self._entregados.add(nombre)
+            avisos.reemitir(self._avisos.get(nombre, []))
+        # Copia superficial: una sección puede agregar columnas sin afectar a las demás
+        return resultado.copy(deep=False) if isinstance(resultado, pd.DataFrame) else resultado
+
+    def esperar(self, timeout=None):
+        wait(self._futuros.values(), timeout)
+
+    def informe(self):
+        """Tiempos de cada lectura (ms desde el inicio de la precarga) y solapamiento logrado"""
+        lecturas = [
+            {'lectura': nombre, 'inicio_ms': inicio * 1000, 'fin_ms': fin * 1000, 'duracion_ms': (fin - inicio) * 1000}
+            for nombre, (inicio, fin) in sorted(self._tiempos.items(), key=lambda item: item[1][0])
+        ]
+        suma = sum(l['duracion_ms'] for l in lecturas)
+        total = max((l['fin_ms'] for l in lecturas), default=0)
+        return {
+            'lecturas': lecturas,
+            'suma_ms': suma,
+            'total_ms': total,
+            'mas_lenta_ms': max((l['duracion_ms'] for l in lecturas), default=0),
+            # 1.0 = secuencial; N = N lecturas completamente superpuestas
+            'solapamiento': suma / total if total else 1.0,
+        }
+
+def precargar_pagina(lecturas=None):
+    """Lanza en paralelo las lecturas de la página (por defecto LECTURAS_PAGINA)"""
+    if lecturas is None:
+        lecturas = LECTURAS_PAGINA
+    elif not isinstance(lecturas, dict):
+        lecturas = {nombre: LECTURAS_PAGINA[nombre] for nombre in lecturas}
+    return Precarga(lecturas, _obtener_ejecutor())
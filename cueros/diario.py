@@ -0,0 +1,98 @@
+"""Diario local durable (SQLite) para escrituras pendientes e instantáneas"""
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+class DiarioLocal:
+    """Diario durable en SQLite: escrituras aún no confirmadas y última instantánea de las colecciones.
+
+    Permite seguir trabajando sin conexión: las escrituras sobreviven a un reinicio
+    y las lecturas se sirven desde la última copia conocida de cada colección.
+    """
+
+    def __init__(self, ruta):
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(str(ruta), check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.executescript("""
+                CREATE TABLE IF NOT EXISTS operaciones (
+                    orden INTEGER PRIMARY KEY AUTOINCREMENT,
+                    clave TEXT UNIQUE NOT NULL,
+                    entrada TEXT NOT NULL,
+                    estado TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS instantanea (
+                    coleccion TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    datos TEXT NOT NULL,
+                    PRIMARY KEY (coleccion, doc_id)
+                );
+                CREATE TABLE IF NOT EXISTS colecciones_guardadas (
+                    coleccion TEXT PRIMARY KEY,
+                    guardado TEXT NOT NULL
+                );
+            """)
+
+    def registrar(self, entrada):
+        """Agrega la operación al diario; la clave de idempotencia evita duplicarla"""
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR IGNORE INTO operaciones (clave, entrada, estado) VALUES (?, ?, ?)",
+                (entrada['clave'], json.dumps(entrada, default=str), entrada['estado'])
+            )
+
+    def actualizar(self, entrada):
+        with self._lock:
+            self._conexion.execute(
+                "UPDATE operaciones SET entrada = ?, estado = ? WHERE clave = ?",
+                (json.dumps(entrada, default=str), entrada['estado'], entrada['clave'])
+            )
+
+    def confirmar(self, claves):
+        with self._lock:
+            self._conexion.executemany("DELETE FROM operaciones WHERE clave = ?", [(c,) for c in claves])
+
+    def operaciones(self):
+        """Operaciones sin confirmar, en el orden en que se registraron"""
+        with self._lock:
+            filas = self._conexion.execute("SELECT entrada FROM operaciones ORDER BY orden").fetchall()
+        return [json.loads(fila[0]) for fila in filas]
+
+    def guardar_instantanea(self, coleccion, documentos, reemplazar=False):
+        """Guarda documentos {doc_id: datos o None (borrado)} de una colección"""
+        with self._lock:
+            self._conexion.execute("BEGIN")
+            try:
+                if reemplazar:
+                    self._conexion.execute("DELETE FROM instantanea WHERE coleccion = ?", (coleccion,))
+                for doc_id, datos in documentos.items():
+                    if datos is None:
+                        self._conexion.execute("DELETE FROM instantanea WHERE coleccion = ? AND doc_id = ?", (coleccion, doc_id))
+                    else:
+                        self._conexion.execute(
+                            "INSERT OR REPLACE INTO instantanea (coleccion, doc_id, datos) VALUES (?, ?, ?)",
+                            (coleccion, doc_id, json.dumps(datos, default=str))
+                        )
+                self._conexion.execute(
+                    "INSERT OR REPLACE INTO colecciones_guardadas (coleccion, guardado) VALUES (?, ?)",
+                    (coleccion, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+                )
+                self._conexion.execute("COMMIT")
+            except Exception:
+                self._conexion.execute("ROLLBACK")
+                raise
+
+    def cargar_instantanea(self, coleccion):
+        """Documentos guardados de la colección, o None si nunca se guardó"""
+        with self._lock:
+            guardada = self._conexion.execute(
+                "SELECT guardado FROM colecciones_guardadas WHERE coleccion = ?", (coleccion,)
+            ).fetchone()
+            if guardada is None:
+                return None
+            filas = self._conexion.execute(
+                "SELECT doc_id, datos FROM instantanea WHERE coleccion = ?", (coleccion,)
+            ).fetchall()
+        return {doc_id: json.loads(datos) for doc_id, datos in filas}
@@ -0,0 +1,246 @@
+"""Montos en centavos enteros: conversión, IVA con redondeo explícito y sumas exactas.
+
+Cada importe se guarda en Firestore como entero en centavos (campo <nombre>_centavos)
+y, al lado, en pesos como siempre (centavos / 100) para mostrar y para quien lea
+los documentos sin conocer los centavos. Las sumas y saldos se hacen sobre int64,
+así un estado de cuenta largo no acumula error y un saldo en cero es cero.
+
+Reglas de redondeo (la mitad se redondea lejos de cero, ROUND_HALF_UP):
+    neto  = precio por kg × kg, redondeado al centavo
+    IVA   = neto × alícuota, redondeado al centavo (una vez por movimiento)
+    total = neto + IVA
+
+Uso (agrega los centavos a los documentos existentes; se puede reanudar):
+    python -m cueros.dinero --migrar [--coleccion movimientos] [--token migracion.json]
+"""
+import argparse
+import hashlib
+import json
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+import numpy as np
+import pandas as pd
+
+from . import avisos
+
+CAMPOS_DINERO = {
+    'movimientos': ('precio_total', 'neto', 'dinero_a_cuenta'),
+    'saldos_apertura': ('precio_total', 'neto'),
+    'pagos_cuenta': ('monto',),
+}
+_UNIDAD = Decimal('1')
+
+def campo_centavos(campo):
+    return f"{campo}_centavos"
+
+def _redondear(decimal):
+    return int(decimal.quantize(_UNIDAD, rounding=ROUND_HALF_UP))
+
+def a_centavos(valor):
+    """Pesos (número o texto) a centavos enteros; lo que no es un número vale 0"""
+    if valor is None or isinstance(valor, bool):
+        return 0
+    try:
+        decimal = Decimal(str(valor))
+    except InvalidOperation:
+        return 0
+    if not decimal.is_finite():
+        return 0
+    return _redondear(decimal * 100)
+
+def _es_importe(valor):
+    if valor is None or isinstance(valor, bool):
+        return False
+    try:
+        return Decimal(str(valor)).is_finite()
+    except InvalidOperation:
+        return False
+
+def a_pesos(centavos):
+    return centavos / 100
+
+def calcular_iva(neto_centavos, iva_rate):
+    """IVA de un neto en centavos, redondeado al centavo"""
+    return _redondear(Decimal(int(neto_centavos)) * Decimal(str(iva_rate)))
+
+def importes(precio_kg, peso_kg, iva_rate):
+    """Neto, IVA y total (en centavos) de un movimiento a partir del precio por kg y los kg"""
+    neto = _redondear(Decimal(str(precio_kg)) * Decimal(str(peso_kg)) * 100)
+    iva = calcular_iva(neto, iva_rate)
+    return {'neto': neto, 'iva': iva, 'total': neto + iva}
+
+def _numeros(serie):
+    return pd.to_numeric(serie, errors='coerce').fillna(0).to_numpy(dtype=float)
+
+def iva_columnas(neto_centavos, iva_rate):
+    """calcular_iva() para varias filas: IVA en centavos (int64) de cada neto, redondeado al centavo"""
+    return pd.Series(_pesos_a_centavos(_numeros(neto_centavos) * _numeros(iva_rate) / 100),
+                     index=neto_centavos.index).astype('int64')
+
+def importes_columnas(precio_kg, peso_kg, iva_rate):
+    """importes() para varias filas a la vez: DataFrame de neto, IVA y total en centavos (int64).
+
+    Recibe Series con el mismo índice, que se conserva en el resultado.
+    """
+    neto = pd.Series(_pesos_a_centavos(_numeros(precio_kg) * _numeros(peso_kg)), index=precio_kg.index).astype('int64')
+    iva = iva_columnas(neto, iva_rate)
+    return pd.DataFrame({'neto': neto, 'iva': iva, 'total': neto + iva})
+
+def con_centavos(coleccion, datos):
+    """Agrega a los datos de un documento los importes en centavos y deja los pesos en centavos / 100"""
+    for campo in CAMPOS_DINERO.get(coleccion, ()):
+        if campo in datos:
+            centavos = a_centavos(datos[campo])
+            datos[campo_centavos(campo)] = centavos
+            datos[campo] = a_pesos(centavos)
+    return datos
+
+def centavos_documento(datos, campo):
+    """Importe en centavos de un documento: el campo en centavos si coincide con los pesos.
+
+    Sin migrar, o si los pesos se editaron sin actualizar los centavos (p. ej. a mano
+    en la consola de Firebase), valen los pesos redondeados al centavo.
+    """
+    centavos = datos.get(campo_centavos(campo))
+    pesos = datos.get(campo)
+    if isinstance(centavos, int) and not isinstance(centavos, bool):
+        if not _es_importe(pesos) or a_centavos(pesos) == centavos:
+            return centavos
+    return a_centavos(pesos)
+
+def _pesos_a_centavos(pesos):
+    # Redondeo previo a 6 decimales para que 0.145 * 100 (14.4999...) se tome como 14.5
+    escalado = np.round(np.abs(pesos) * 100, 6)
+    return np.sign(pesos) * np.floor(escalado + 0.5)
+
+def columna_centavos(df, campo):
+    """Serie int64 con el importe en centavos de cada fila (ver centavos_documento)"""
+    if df.empty:
+        return pd.Series(dtype='int64', index=df.index)
+    if campo_centavos(campo) in df.columns:
+        guardados = pd.to_numeric(df[campo_centavos(campo)], errors='coerce').astype('float64')
+    else:
+        guardados = pd.Series(np.nan, index=df.index)
+    if campo not in df.columns:
+        return guardados.fillna(0).astype('int64')
+    pesos = pd.to_numeric(df[campo], errors='coerce')
+    redondeados = pd.Series(_pesos_a_centavos(pesos.to_numpy(dtype='float64')), index=df.index)
+    # Centavos guardados solo si coinciden con los pesos; si no (o sin migrar), los pesos redondeados
+    validos = guardados.notna() & (pesos.isna() | (redondeados == guardados))
+    return guardados.where(validos, redondeados).fillna(0).astype('int64')
+
+def sumar_centavos(df, campo, filtro=None):
+    """Suma exacta (int) en centavos de una columna de importes, opcionalmente solo las filas del filtro"""
+    if df.empty:
+        return 0
+    columna = columna_centavos(df, campo)
+    if filtro is not None:
+        columna = columna[filtro]
+    return int(columna.sum())
+
+def _cambios_migracion(coleccion, datos):
+    cambios = {}
+    for campo in CAMPOS_DINERO[coleccion]:
+        if campo not in datos:
+            continue
+        centavos = a_centavos(datos[campo])
+        if datos.get(campo_centavos(campo)) != centavos or datos[campo] != a_pesos(centavos):
+            cambios[campo_centavos(campo)] = centavos
+            cambios[campo] = a_pesos(centavos)
+    return cambios
+
+def _clave_migracion(coleccion, doc_id, version):
+    # La versión leída entra en la clave: un reintento repite la clave y una nueva
+    # migración del documento, ya editado, lleva otra
+    marca = hashlib.sha1(str(version).encode('utf-8')).hexdigest()[:12]
+    return f"migracion-{coleccion}-{doc_id}-{marca}"
+
+def migrar_a_centavos(coleccion, reanudar=None, al_avanzar=None):
+    """Agrega los importes en centavos a los documentos existentes de una colección.
+
+    Lee con el escaneo paralelo y escribe en lotes, cada actualización con su evento
+    en el registro de cambios (con clave, así un reintento no lo duplica) y con
+    precondición sobre la versión leída. Si un documento cambió desde el escaneo, su
+    lote se confirma documento por documento y el que cambió se saltea (una nueva
+    corrida lo migra). al_avanzar(token) se llama tras cada página confirmada, para
+    poder reanudar. Devuelve los documentos actualizados.
+    """
+    from google.api_core import exceptions as google_exceptions
+
+    from .conexion import obtener_db
+    from .datos import confirmar_lote, escanear_coleccion, obtener_registro_cambios
+    from .kpi import IncrementosKpi
+    db = obtener_db()
+    registro = obtener_registro_cambios()
+    escaneo = escanear_coleccion(coleccion, reanudar=reanudar, con_version=True)
+
+    def confirmar(grupo):
+        batch = db.batch()
+        incrementos = IncrementosKpi()
+        claves = []
+        for doc_id, version, datos, cambios in grupo:
+            claves.append(_clave_migracion(coleccion, doc_id, version))
+            batch.update(db.collection(coleccion).document(doc_id), cambios,
+                         option=db.write_option(last_update_time=version) if version is not None else None)
+            registro.agregar(batch, 'actualizar', coleccion, doc_id, datos, {**datos, **cambios}, clave=claves[-1])
+            # Redondear al centavo puede mover los totales en un centavo
+            incrementos.sumar(coleccion, datos, {**datos, **cambios})
+        incrementos.agregar(db, batch)
+        confirmar_lote('dinero.migrar', batch, claves)
+
+    actualizados = 0
+    cambiados = 0
+    for pagina in escaneo:
+        pendientes = []
+        for datos in pagina:
+            cambios = _cambios_migracion(coleccion, datos)
+            if cambios:
+                doc_id = datos.pop('id')
+                version = datos.pop('_version', None)
+                pendientes.append((doc_id, version, datos, cambios))
+        for inicio in range(0, len(pendientes), 200):
+            grupo = pendientes[inicio:inicio + 200]
+            try:
+                confirmar(grupo)
+                actualizados += len(grupo)
+            except (google_exceptions.FailedPrecondition, google_exceptions.NotFound):
+                for pendiente in grupo:
+                    try:
+                        confirmar([pendiente])
+                        actualizados += 1
+                    except (google_exceptions.FailedPrecondition, google_exceptions.NotFound):
+                        cambiados += 1
+        if al_avanzar is not None:
+            al_avanzar(escaneo.token())
+    if cambiados:
+        avisos.aviso(f"{coleccion}: {cambiados} documentos cambiaron durante la migración y no se migraron; "
+                     "vuelve a correrla para completarlos")
+    return actualizados
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agrega los importes en centavos enteros a los documentos existentes")
+    parser.add_argument('--migrar', action='store_true', help="migrar los documentos existentes")
+    parser.add_argument('--coleccion', choices=sorted(CAMPOS_DINERO), help="solo esta colección (por defecto, todas)")
+    parser.add_argument('--token', help="archivo de progreso; si existe, se reanuda desde ahí")
+    args = parser.parse_args(argv)
+    if not args.migrar:
+        parser.print_help()
+        return
+    progreso = {}
+    if args.token:
+        try:
+            with open(args.token, encoding='utf-8') as archivo:
+                progreso = json.load(archivo)
+        except FileNotFoundError:
+            pass
+    for coleccion in ([args.coleccion] if args.coleccion else sorted(CAMPOS_DINERO)):
+        def guardar(token, coleccion=coleccion):
+            progreso[coleccion] = token
+            if args.token:
+                with open(args.token, 'w', encoding='utf-8') as archivo:
+                    json.dump(progreso, archivo)
+        actualizados = migrar_a_centavos(coleccion, reanudar=progreso.get(coleccion), al_avanzar=guardar)
+        print(f"{coleccion}: {actualizados} documentos actualizados")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""Nombres de clientes casi duplicados y su fusión.
+
+La descripción de los movimientos se escribe a mano, así que un mismo cliente
+aparece con varias grafías ("Curtiembre Peñón", "curtiembre penon ", "Curtiembre
+Penon SRL"). Para no comparar todos los nombres contra todos, cada nombre se
+reduce a una clave fonética (sin acentos ni signos, b/v, c/k/q/s/z, ll/y y h
+mudas unificadas) y se indexa por sus trigramas: solo se comparan los pares que
+comparten buena parte de ellos (bloqueo), y los trigramas demasiado comunes no
+generan candidatos. Los pares que superan el umbral de similitud se agrupan y
+cada grupo propone un nombre canónico: el del maestro de clientes si lo hay,
+si no el más usado.
+
+Aplicar una fusión reescribe en lotes la descripción de movimientos y saldos de
+apertura, el cliente de los pagos a cuenta y el maestro de clientes, cada
+escritura con su evento en el registro de cambios y, con el almacén cargado,
+con precondición sobre la versión leída: un documento editado mientras tanto no
+se pisa (se saltea y se avisa). Los archivos anuales conservan la grafía original.
+
+Uso:
+    python -m cueros.duplicados [--umbral 0.85] [--aplicar [--si]]
+"""
+import argparse
+import hashlib
+import json
+import re
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+from . import avisos
+from .busqueda import normalizar
+
+# Colección -> campo con el nombre del cliente
+CAMPOS_NOMBRE = {
+    'movimientos': 'descripcion',
+    'saldos_apertura': 'descripcion',
+    'pagos_cuenta': 'cliente_nombre',
+    'clientes': 'nombre',
+}
+UMBRAL_SIMILITUD = 0.85
+# Fracción mínima de trigramas compartidos (Dice) para comparar un par
+UMBRAL_BLOQUEO = 0.5
+# Un trigrama presente en más nombres que esto no genera candidatos
+MAX_BLOQUE = 200
+
+# Formas societarias que no distinguen a un cliente de otro
+_SOCIETARIOS = {'sa', 'srl', 'sas', 'sh', 'sca', 'scs', 'saic', 'saci'}
+_NO_LETRA = re.compile(r"[^a-z0-9ñ ]+")
+_NUMERO = re.compile(r"\d+")
+_FONETICA = (
+    (re.compile(r"ch"), "x"),
+    (re.compile(r"h"), ""),
+    (re.compile(r"ll"), "y"),
+    (re.compile(r"v"), "b"),
+    (re.compile(r"qu(?=[ei])"), "k"),
+    (re.compile(r"gu(?=[ei])"), "g"),
+    (re.compile(r"c(?=[ei])"), "s"),
+    (re.compile(r"[cq]"), "k"),
+    (re.compile(r"z"), "s"),
+    (re.compile(r"w"), "u"),
+    (re.compile(r"(.)\1+"), r"\1"),
+)
+
+def clave_nombre(nombre):
+    """Nombre comparable: minúsculas, sin acentos, signos ni forma societaria y con espacios simples"""
+    if nombre is None or nombre != nombre:
+        return ''
+    texto = str(nombre).lower().replace('ñ', '\0').replace('.', '')
+    palabras = _NO_LETRA.sub(' ', normalizar(texto).replace('\0', 'ñ')).split()
+    return ' '.join([palabra for palabra in palabras if palabra not in _SOCIETARIOS] or palabras)
+
+def clave_fonetica(nombre):
+    """Clave que iguala las grafías que suenan igual: 'Vázquez Hnos.' y 'basques nos' dan 'baskes nos'"""
+    texto = clave_nombre(nombre).replace('ñ', 'n')
+    for patron, reemplazo in _FONETICA:
+        texto = patron.sub(reemplazo, texto)
+    return texto
+
+def _trigramas(texto):
+    relleno = f"  {texto} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+def _similitud(clave_a, fonetica_a, clave_b, fonetica_b, umbral=0.0):
+    if clave_a == clave_b:
+        return 1.0
+    if _NUMERO.findall(clave_a) != _NUMERO.findall(clave_b):
+        return 0.0
+    comparador = SequenceMatcher(None, clave_a, clave_b, autojunk=False)
+    if fonetica_a == fonetica_b:
+        return max(0.95, comparador.ratio())
+    # Las cotas rápidas descartan la mayoría de los pares sin calcular la razón exacta
+    if comparador.real_quick_ratio() < umbral or comparador.quick_ratio() < umbral:
+        return 0.0
+    return comparador.ratio()
+
+def similitud(a, b):
+    """Similitud entre 0 y 1 de dos nombres (sobre la clave sin acentos ni signos).
+
+    Los números tienen que coincidir: "Cliente 1" y "Cliente 2" no son el mismo.
+    """
+    return _similitud(clave_nombre(a), clave_fonetica(a), clave_nombre(b), clave_fonetica(b))
+
+def pares_candidatos(nombres, umbral_bloqueo=UMBRAL_BLOQUEO, max_bloque=MAX_BLOQUE):
+    """Pares (i, j) de nombres que vale la pena comparar, sin recorrer todos los pares.
+
+    Cada nombre se indexa por los trigramas de su clave fonética; un par es
+    candidato si comparte al menos umbral_bloqueo de sus trigramas (coeficiente de
+    Dice). Los trigramas de más de max_bloque nombres no cuentan, ni para los
+    compartidos ni para el total: cada nombre se compara con pocos otros.
+    """
+    gramas = [_trigramas(clave_fonetica(nombre)) for nombre in nombres]
+    bloques = {}
+    for posicion, conjunto in enumerate(gramas):
+        for grama in conjunto:
+            bloques.setdefault(grama, []).append(posicion)
+    gramas = [{grama for grama in conjunto if len(bloques[grama]) <= max_bloque} for conjunto in gramas]
+    pares = set()
+    for posicion, conjunto in enumerate(gramas):
+        compartidos = {}
+        for grama in conjunto:
+            for otro in bloques[grama]:
+                if otro > posicion:
+                    compartidos[otro] = compartidos.get(otro, 0) + 1
+        for otro, cantidad in compartidos.items():
+            if 2 * cantidad >= umbral_bloqueo * (len(conjunto) + len(gramas[otro])):
+                pares.add((posicion, otro))
+    return pares
+
+def _raiz(padres, posicion):
+    while padres[posicion] != posicion:
+        padres[posicion] = padres[padres[posicion]]
+        posicion = padres[posicion]
+    return posicion
+
+def proponer_fusiones(usos, maestros=(), umbral=UMBRAL_SIMILITUD):
+    """Grupos de nombres casi iguales, de los más usados a los menos.
+
+    usos es {nombre: cantidad de documentos que lo usan} y maestros los nombres del
+    maestro de clientes, que se prefieren como canónicos. Cada propuesta es un dict
+    con canonico, variantes (los otros nombres), usos por nombre y la similitud
+    mínima de los pares que unieron el grupo.
+    """
+    nombres = sorted(nombre for nombre in usos if clave_nombre(nombre))
+    claves = [clave_nombre(nombre) for nombre in nombres]
+    foneticas = [clave_fonetica(nombre) for nombre in nombres]
+    padres = list(range(len(nombres)))
+    similitudes = {}
+    for i, j in pares_candidatos(nombres):
+        valor = _similitud(claves[i], foneticas[i], claves[j], foneticas[j], umbral)
+        if valor >= umbral:
+            raiz_i, raiz_j = _raiz(padres, i), _raiz(padres, j)
+            padres[raiz_j] = raiz_i
+            similitudes[(i, j)] = valor
+    grupos = {}
+    for posicion in range(len(nombres)):
+        grupos.setdefault(_raiz(padres, posicion), []).append(posicion)
+    minimas = {}
+    for (i, _j), valor in similitudes.items():
+        raiz = _raiz(padres, i)
+        minimas[raiz] = min(valor, minimas.get(raiz, 1.0))
+    maestros = set(maestros)
+    propuestas = []
+    for raiz, posiciones in grupos.items():
+        if len(posiciones) < 2:
+            continue
+        grupo = [nombres[posicion] for posicion in posiciones]
+        canonico = max(grupo, key=lambda nombre: (nombre in maestros, usos[nombre], nombre == nombre.strip(), nombre))
+        propuestas.append({
+            'canonico': canonico,
+            'variantes': [nombre for nombre in grupo if nombre != canonico],
+            'usos': {nombre: usos[nombre] for nombre in grupo},
+            'similitud': round(minimas.get(raiz, 1.0), 3),
+        })
+    return sorted(propuestas, key=lambda propuesta: (-sum(propuesta['usos'].values()), propuesta['canonico']))
+
+def _documentos(coleccion):
+    from .datos import obtener_clientes, obtener_datos, obtener_pagos_cuenta, obtener_saldos_apertura
+    lectores = {
+        'movimientos': obtener_datos,
+        'saldos_apertura': obtener_saldos_apertura,
+        'pagos_cuenta': obtener_pagos_cuenta,
+        'clientes': obtener_clientes,
+    }
+    return lectores[coleccion]()
+
+def usos_de_nombres():
+    """{nombre: documentos que lo usan} en las cuatro colecciones, y los nombres del maestro de clientes"""
+    usos = {}
+    maestros = set()
+    for coleccion, campo in CAMPOS_NOMBRE.items():
+        df = _documentos(coleccion)
+        if df.empty or campo not in df.columns:
+            continue
+        for nombre, cantidad in df[campo].dropna().astype(str).value_counts().items():
+            usos[nombre] = usos.get(nombre, 0) + int(cantidad)
+        if coleccion == 'clientes':
+            maestros.update(df[campo].dropna().astype(str))
+    return usos, maestros
+
+def buscar_duplicados(umbral=UMBRAL_SIMILITUD):
+    """Propuestas de fusión (ver proponer_fusiones) sobre los datos actuales"""
+    try:
+        usos, maestros = usos_de_nombres()
+    except Exception as e:
+        avisos.error(f"Error al buscar nombres duplicados: {str(e)}")
+        return []
+    return proponer_fusiones(usos, maestros, umbral)
+
+def _sin_nulos(registro):
+    return {k: v for k, v in registro.items() if not (pd.api.types.is_scalar(v) and pd.isna(v))}
+
+def _reescrituras(canonico, variantes):
+    """(coleccion, doc_id, anterior, cambios o None para borrar) que aplican una fusión"""
+    variantes = set(variantes) - {canonico}
+    operaciones = []
+    for coleccion, campo in CAMPOS_NOMBRE.items():
+        df = _documentos(coleccion)
+        if df.empty or campo not in df.columns:
+            continue
+        registros = [_sin_nulos(registro) for registro in df[df[campo].isin(variantes | {canonico})].to_dict('records')]
+        if coleccion != 'clientes':
+            operaciones.extend((coleccion, registro.pop('id'), registro, {campo: canonico})
+                               for registro in registros if registro[campo] in variantes)
+            continue
+        # Maestro: queda una ficha (la del canónico o la primera variante), completada con los datos de las otras
+        registros.sort(key=lambda registro: registro[campo] != canonico)
+        if not registros:
+            continue
+        conservada, *sobrantes = registros
+        cambios = {campo: canonico} if conservada[campo] != canonico else {}
+        for sobrante in sobrantes:
+            for clave, valor in sobrante.items():
+                if clave not in ('id', campo) and valor not in (None, '') and conservada.get(clave) in (None, '') and clave not in cambios:
+                    cambios[clave] = valor.item() if hasattr(valor, 'item') else valor
+            operaciones.append((coleccion, sobrante.pop('id'), sobrante, None))
+        if cambios:
+            operaciones.append((coleccion, conservada.pop('id'), conservada, cambios))
+    return operaciones
+
+def _clave_fusion(canonico, coleccion, doc_id, anterior, version):
+    # Un reintento repite la clave; fusionar otra vez el documento ya editado lleva otra
+    base = hashlib.sha1(canonico.encode('utf-8')).hexdigest()[:10]
+    marca = hashlib.sha1(json.dumps([str(version), anterior], sort_keys=True, default=str).encode('utf-8')).hexdigest()[:10]
+    return f"fusion-{base}-{coleccion}-{doc_id}-{marca}"
+
+def aplicar_fusion(canonico, variantes, tam_lote=200):
+    """Reescribe las variantes con el nombre canónico; devuelve los documentos escritos por colección"""
+    from google.api_core import exceptions as google_exceptions
+
+    from .conexion import obtener_db
+    from .datos import _almacen_listo, confirmar_lote, obtener_registro_cambios
+    escritos = {}
+    cambiados = 0
+    try:
+        db = obtener_db()
+        registro_cambios = obtener_registro_cambios()
+        operaciones = []
+        for coleccion, doc_id, anterior, cambios in _reescrituras(canonico, variantes):
+            almacen = _almacen_listo(coleccion)
+            version = almacen.tiempo_actualizacion(coleccion, str(doc_id)) if almacen is not None else None
+            operaciones.append((coleccion, str(doc_id), anterior, cambios, version))
+
+        def confirmar(grupo):
+            # Cada escritura lleva su evento en el mismo lote (dos operaciones de las 500 por lote)
+            batch = db.batch()
+            claves = []
+            for coleccion, doc_id, anterior, cambios, version in grupo:
+                ref = db.collection(coleccion).document(doc_id)
+                opcion = db.write_option(last_update_time=version) if version is not None else None
+                claves.append(_clave_fusion(canonico, coleccion, doc_id, anterior, version))
+                if cambios is None:
+                    batch.delete(ref, option=opcion)
+                    registro_cambios.agregar(batch, 'eliminar', coleccion, doc_id, anterior, None, clave=claves[-1])
+                else:
+                    batch.update(ref, cambios, option=opcion)
+                    registro_cambios.agregar(batch, 'actualizar', coleccion, doc_id, anterior, {**anterior, **cambios},
+                                             clave=claves[-1])
+            confirmar_lote('duplicados.fusionar', batch, claves)
+            for coleccion, *_resto in grupo:
+                escritos[coleccion] = escritos.get(coleccion, 0) + 1
+
+        for inicio in range(0, len(operaciones), tam_lote):
+            grupo = operaciones[inicio:inicio + tam_lote]
+            try:
+                confirmar(grupo)
+            except (google_exceptions.FailedPrecondition, google_exceptions.NotFound):
+                # Algún documento cambió desde que se leyó: se confirma uno por uno y se saltea el que cambió
+                for operacion in grupo:
+                    try:
+                        confirmar([operacion])
+                    except (google_exceptions.FailedPrecondition, google_exceptions.NotFound):
+                        cambiados += 1
+    except Exception as e:
+        avisos.error(f"Error al fusionar '{canonico}': {str(e)}")
+    if cambiados:
+        avisos.aviso(f"Fusión de '{canonico}': {cambiados} documentos cambiaron mientras tanto y no se reescribieron; "
+                     "vuelve a buscar duplicados para completarla")
+    return escritos
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Busca nombres de clientes casi duplicados y propone fusionarlos")
+    parser.add_argument('--umbral', type=float, default=UMBRAL_SIMILITUD, help="similitud mínima entre 0 y 1 (por defecto %(default)s)")
+    parser.add_argument('--aplicar', action='store_true', help="preguntar por cada grupo y fusionar los aceptados")
+    parser.add_argument('--si', action='store_true', help="con --aplicar, fusionar todos los grupos sin preguntar")
+    args = parser.parse_args(argv)
+    propuestas = buscar_duplicados(args.umbral)
+    if not propuestas:
+        print("No se encontraron nombres duplicados")
+        return
+    for numero, propuesta in enumerate(propuestas, 1):
+        print(f"{numero}. {propuesta['canonico']} ({propuesta['usos'][propuesta['canonico']]} usos, similitud {propuesta['similitud']})")
+        for variante in propuesta['variantes']:
+            print(f"     <- {variante} ({propuesta['usos'][variante]} usos)")
+        if not args.aplicar:
+            continue
+        if not args.si and input("   ¿Fusionar? [s/N] ").strip().lower() not in ('s', 'si', 'sí'):
+            continue
+        escritos = aplicar_fusion(propuesta['canonico'], propuesta['variantes'])
+        print("   Fusionado: " + (", ".join(f"{coleccion}: {cantidad}" for coleccion, cantidad in escritos.items()) or "sin cambios"))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Edición en tabla: diferencias celda por celda e importes recalculados por columnas.
+
+La página muestra los documentos en una grilla editable; al guardar se compara
+la grilla con la original y solo se envían los campos que cambiaron, agrupados
+en un lote (ver ColaEscritura.encolar_actualizaciones). En movimientos, las filas
+donde cambió el precio por kg, los kg o el IVA recalculan neto y total de una
+vez para todas, con las mismas reglas de redondeo que dinero.importes.
+"""
+import numpy as np
+import pandas as pd
+
+from .dinero import a_pesos, campo_centavos, columna_centavos, con_centavos, importes_columnas, iva_columnas
+
+# Columnas que se pueden editar en la grilla de cada colección
+COLUMNAS_EDITABLES = {
+    'movimientos': ('tipo', 'producto', 'descripcion', 'cantidad', 'peso_kg', 'precio_kg', 'iva_rate',
+                    'modo_pago', 'detalle_pago', 'dinero_a_cuenta', 'estado_pago'),
+    'clientes': ('nombre', 'tipo', 'contacto', 'telefono', 'email', 'direccion', 'notas', 'activo'),
+}
+# Columnas que no se guardan: se derivan de otras
+_DERIVADAS = {'precio_kg'}
+_IMPORTES = ('precio_kg', 'peso_kg', 'iva_rate')
+
+def tabla_edicion(coleccion, df):
+    """DataFrame para la grilla: indexado por ID, con las columnas editables (y neto y total en movimientos).
+
+    Los saldos de apertura (es_apertura) no se editan: resumen movimientos archivados.
+    """
+    if 'es_apertura' in df.columns:
+        df = df[df['es_apertura'] != True]
+    if df.empty or 'id' not in df.columns:
+        return pd.DataFrame(columns=list(COLUMNAS_EDITABLES[coleccion]))
+    tabla = df.set_index(df['id'].astype(str)).drop(columns='id')
+    tabla.index.name = 'id'
+    if coleccion == 'movimientos':
+        peso = pd.to_numeric(tabla.get('peso_kg'), errors='coerce')
+        neto = pd.to_numeric(tabla.get('neto'), errors='coerce')
+        tabla['precio_kg'] = (neto / peso.where(peso != 0)).round(2).fillna(0.0)
+        columnas = [*COLUMNAS_EDITABLES[coleccion], 'neto', 'precio_total']
+    else:
+        columnas = list(COLUMNAS_EDITABLES[coleccion])
+        if 'activo' in tabla.columns:
+            tabla['activo'] = tabla['activo'].fillna(1).astype(bool)
+    for columna in columnas:
+        if columna not in tabla.columns:
+            tabla[columna] = None
+    return tabla[columnas]
+
+def _nativo(valor):
+    if valor is None or (pd.api.types.is_scalar(valor) and pd.isna(valor)):
+        return None
+    return valor.item() if hasattr(valor, 'item') else valor
+
+def _distintas(original, editada):
+    """Máscara de celdas cambiadas; dos vacíos (None / NaN) cuentan como iguales"""
+    vacias = original.isna() & editada.isna()
+    try:
+        iguales = original.eq(editada)
+    except TypeError:
+        iguales = original.astype(object).eq(editada.astype(object))
+    return ~(iguales | vacias)
+
+def cambios_tabla(coleccion, original, editada):
+    """{doc_id: campos que cambiaron} entre la grilla original y la editada (filas por ID)"""
+    columnas = [c for c in COLUMNAS_EDITABLES[coleccion] if c in original.columns and c in editada.columns]
+    editada = editada.reindex(original.index)
+    distintas = pd.DataFrame({columna: _distintas(original[columna], editada[columna]) for columna in columnas},
+                             index=original.index)
+    filas = distintas.index[distintas.any(axis=1)]
+    cambios = {}
+    for doc_id in filas:
+        cambios[doc_id] = {columna: _nativo(editada.at[doc_id, columna])
+                           for columna in columnas if distintas.at[doc_id, columna]}
+    if coleccion == 'movimientos':
+        _recalcular_importes(original, editada, distintas, cambios)
+    for doc_id, campos in cambios.items():
+        for derivada in _DERIVADAS:
+            campos.pop(derivada, None)
+        if coleccion == 'clientes' and 'activo' in campos:
+            campos['activo'] = 1 if campos['activo'] else 0
+        con_centavos(coleccion, campos)
+    return {doc_id: campos for doc_id, campos in cambios.items() if campos}
+
+def _recalcular_importes(original, editada, distintas, cambios):
+    """Neto y total de las filas donde cambió el precio por kg, los kg o el IVA, todas a la vez.
+
+    Si solo cambió el IVA, el neto guardado se conserva y se recalculan IVA y total.
+    """
+    columnas = [c for c in _IMPORTES if c in distintas.columns]
+    if not columnas:
+        return
+    filas = distintas.index[distintas[columnas].any(axis=1)]
+    if filas.empty:
+        return
+    editadas = editada.loc[filas]
+    cambia_neto = distintas.loc[filas, [c for c in ('precio_kg', 'peso_kg') if c in columnas]].any(axis=1)
+    neto = importes_columnas(editadas['precio_kg'], editadas['peso_kg'], editadas['iva_rate'])['neto']
+    neto = neto.where(cambia_neto, columna_centavos(original.loc[filas], 'neto'))
+    total = neto + iva_columnas(neto, editadas['iva_rate'])
+    for doc_id, neto_fila, total_fila in zip(filas, neto.to_numpy(dtype=np.int64), total.to_numpy(dtype=np.int64)):
+        cambios[doc_id].update({
+            'neto': a_pesos(int(neto_fila)), campo_centavos('neto'): int(neto_fila),
+            'precio_total': a_pesos(int(total_fila)), campo_centavos('precio_total'): int(total_fila),
+        })
@@ -0,0 +1,223 @@
+"""Lectura completa de una colección en particiones paralelas, con token para reanudar.
+
+La colección se divide en rangos de ID de documento (con los cortes que sugiere
+Firestore con una partition query o, si no está disponible, repartiendo el
+alfabeto de los IDs automáticos). Cada rango se lee por páginas ordenadas por ID
+en un hilo propio y las páginas se entregan a medida que llegan, así la memoria no
+depende del tamaño de la colección. El token guarda, por rango, el último ID de
+una página ya entregada: con él un escaneo interrumpido sigue donde quedó.
+
+Uso:
+    python -m cueros.escaneo movimientos --salida movimientos.jsonl.gz [--token escaneo.json]
+"""
+import argparse
+import gzip
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Campo especial para ordenar y filtrar por ID de documento (FieldPath.document_id())
+_ID = '__name__'
+# Caracteres de los IDs automáticos de Firestore, en el orden en que se comparan
+_ALFABETO_IDS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+def limites_por_alfabeto(cantidad):
+    """Cortes de ID que reparten parejo los IDs automáticos (los IDs numéricos caen en los primeros rangos)"""
+    paso = len(_ALFABETO_IDS) / cantidad
+    return [_ALFABETO_IDS[round(paso * i)] for i in range(1, cantidad)]
+
+def limites_por_ids(ids, cantidad):
+    """Cortes de ID por cuantiles de IDs conocidos (p. ej. los del almacén), para rangos del mismo tamaño"""
+    ids = sorted(str(i) for i in ids)
+    if len(ids) < cantidad:
+        return []
+    return sorted({ids[len(ids) * i // cantidad] for i in range(1, cantidad)})
+
+def limites_por_particion(db, coleccion, cantidad, politica):
+    """Cortes que propone Firestore (partition query sobre el grupo de colecciones)"""
+    grupo = db.collection_group(coleccion)
+    particiones = politica.ejecutar('escaneo.particiones', lambda plazo: list(grupo.get_partitions(cantidad - 1, retry=None, timeout=plazo)))
+    return [p.end_at.id for p in particiones if p.end_at is not None]
+
+def token_inicial(coleccion, limites, campos=None):
+    bordes = [None, *sorted(limites), None]
+    return {
+        'coleccion': coleccion,
+        'campos': list(campos) if campos is not None else None,
+        'particiones': [{'desde': desde, 'hasta': hasta, 'ultimo': None, 'terminada': False}
+                        for desde, hasta in zip(bordes, bordes[1:])],
+    }
+
+class EscaneoParticionado:
+    """Itera las páginas (listas de dicts con 'id') de una colección leída en paralelo.
+
+    Las páginas llegan sin orden entre rangos. Una cola acotada frena a los hilos si
+    el consumidor es más lento. token() incluye todas las páginas ya entregadas: se
+    guarda después de procesar cada una y se pasa como reanudar= para continuar.
+    Con con_version, cada dict trae además '_version' (update_time del documento)
+    para escribirlo después con precondición.
+    """
+
+    def __init__(self, db, politica, coleccion, particiones=8, trabajadores=8, tam_pagina=500,
+                 campos=None, limites=None, reanudar=None, con_version=False):
+        self._db = db
+        self._politica = politica
+        self._con_version = con_version
+        self._tam_pagina = tam_pagina
+        self._trabajadores = trabajadores
+        if reanudar is not None:
+            self._token = json.loads(json.dumps(reanudar))
+        else:
+            if limites is None:
+                try:
+                    limites = limites_por_particion(db, coleccion, particiones, politica) if particiones > 1 else []
+                except Exception:
+                    limites = limites_por_alfabeto(particiones) if particiones > 1 else []
+            self._token = token_inicial(coleccion, limites, campos)
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self.documentos = 0
+        self.paginas = 0
+        self.lectura_ms = 0.0
+        self.total_ms = 0.0
+
+    def token(self):
+        with self._lock:
+            return json.loads(json.dumps(self._token))
+
+    @property
+    def terminado(self):
+        with self._lock:
+            return all(p['terminada'] for p in self._token['particiones'])
+
+    def _consulta(self, particion):
+        referencia = self._db.collection(self._token['coleccion'])
+        consulta = referencia.order_by(_ID)
+        if self._token['campos'] is not None:
+            consulta = consulta.select(self._token['campos'])
+        if particion['ultimo'] is not None:
+            consulta = consulta.where(_ID, '>', referencia.document(particion['ultimo']))
+        elif particion['desde'] is not None:
+            consulta = consulta.where(_ID, '>=', referencia.document(particion['desde']))
+        if particion['hasta'] is not None:
+            consulta = consulta.where(_ID, '<', referencia.document(particion['hasta']))
+        return consulta.limit(self._tam_pagina)
+
+    def _leer_particion(self, indice, salida):
+        particion = dict(self._token['particiones'][indice])
+        try:
+            while not self._detener.is_set():
+                consulta = self._consulta(particion)
+                inicio = time.perf_counter()
+                documentos = self._politica.ejecutar(
+                    f"{self._token['coleccion']}.escaneo",
+                    lambda plazo: list(consulta.stream(retry=None, timeout=plazo)))
+                with self._lock:
+                    self.lectura_ms += (time.perf_counter() - inicio) * 1000
+                pagina = []
+                for documento in documentos:
+                    datos = documento.to_dict()
+                    datos['id'] = documento.id
+                    if self._con_version:
+                        datos['_version'] = documento.update_time
+                    pagina.append(datos)
+                terminada = len(pagina) < self._tam_pagina
+                if pagina:
+                    particion['ultimo'] = pagina[-1]['id']
+                self._entregar(salida, (indice, pagina, particion['ultimo'], terminada))
+                if terminada:
+                    return
+        except Exception as e:
+            self._entregar(salida, (indice, e, None, True))
+
+    def _entregar(self, salida, elemento):
+        while not self._detener.is_set():
+            try:
+                salida.put(elemento, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self):
+        pendientes = [i for i, p in enumerate(self._token['particiones']) if not p['terminada']]
+        if not pendientes:
+            return
+        inicio = time.perf_counter()
+        self._detener.clear()
+        salida = queue.Queue(maxsize=2 * self._trabajadores)
+        ejecutor = ThreadPoolExecutor(max_workers=min(self._trabajadores, len(pendientes)), thread_name_prefix="escaneo")
+        for indice in pendientes:
+            ejecutor.submit(self._leer_particion, indice, salida)
+        activas = len(pendientes)
+        try:
+            while activas:
+                indice, pagina, ultimo, terminada = salida.get()
+                if isinstance(pagina, Exception):
+                    raise pagina
+                if terminada:
+                    activas -= 1
+                with self._lock:
+                    particion = self._token['particiones'][indice]
+                    particion['ultimo'] = ultimo
+                    particion['terminada'] = terminada
+                    if pagina:
+                        self.documentos += len(pagina)
+                        self.paginas += 1
+                if pagina:
+                    yield pagina
+        finally:
+            self._detener.set()
+            ejecutor.shutdown(wait=False, cancel_futures=True)
+            self.total_ms += (time.perf_counter() - inicio) * 1000
+
+    def informe(self):
+        with self._lock:
+            return {
+                'particiones': len(self._token['particiones']),
+                'documentos': self.documentos,
+                'paginas': self.paginas,
+                'suma_lecturas_ms': self.lectura_ms,
+                'total_ms': self.total_ms,
+                'paralelismo': self.lectura_ms / self.total_ms if self.total_ms else 0.0,
+            }
+
+def _valor_json(valor):
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return str(valor)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta una colección completa a JSONL (gzip) leyendo particiones en paralelo")
+    parser.add_argument('coleccion')
+    parser.add_argument('--salida', required=True, help="archivo .jsonl.gz de destino (se agrega al reanudar)")
+    parser.add_argument('--token', help="archivo donde se guarda el progreso; si existe, se reanuda desde ahí")
+    parser.add_argument('--particiones', type=int, default=8)
+    parser.add_argument('--trabajadores', type=int, default=8)
+    parser.add_argument('--pagina', type=int, default=500)
+    args = parser.parse_args(argv)
+    from .datos import escanear_coleccion
+    reanudar = None
+    if args.token:
+        try:
+            with open(args.token, encoding='utf-8') as archivo:
+                reanudar = json.load(archivo)
+        except FileNotFoundError:
+            pass
+    escaneo = escanear_coleccion(args.coleccion, particiones=args.particiones, trabajadores=args.trabajadores,
+                                 tam_pagina=args.pagina, reanudar=reanudar)
+    with gzip.open(args.salida, 'at' if reanudar else 'wt', encoding='utf-8') as salida:
+        for pagina in escaneo:
+            for datos in pagina:
+                salida.write(json.dumps(datos, ensure_ascii=False, default=_valor_json) + "\n")
+            salida.flush()
+            if args.token:
+                with open(args.token, 'w', encoding='utf-8') as archivo:
+                    json.dump(escaneo.token(), archivo)
+    informe = escaneo.informe()
+    print(f"{informe['documentos']} documentos en {informe['paginas']} páginas, {informe['particiones']} particiones, "
+          f"{informe['total_ms']:.0f} ms (paralelismo {informe['paralelismo']:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Estados de cuenta por cliente, sin dependencias de Streamlit.
+
+Se usa desde la app para el "Estado de Cuenta Detallado" y para generar en lote
+los estados de todos los clientes en un pool de procesos.
+"""
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from io import BytesIO
+import multiprocessing
+import os
+
+import pandas as pd
+
+from .dinero import columna_centavos
+
+COLUMNAS_ESTADO_CUENTA = ['Fecha', 'Tipo', 'Detalle', 'Monto', 'Estado', 'Debe', 'Haber']
+
+def construir_estado_cuenta(df_cliente, df_pagos_cliente):
+    """Tabla unificada de compras, ventas y pagos a cuenta de un cliente, con balance acumulado"""
+    movimientos_cuenta = []
+
+    if not df_cliente.empty and 'tipo' in df_cliente.columns:
+        # Agregar compras
+        for _, row in df_cliente[df_cliente['tipo'] == 'Ingreso (Compra)'].iterrows():
+            movimientos_cuenta.append({
+                'Fecha': row['fecha'],
+                'Tipo': 'Compra (Yo compré)',
+                'Detalle': f"{row['producto']} - {row['cantidad']} u. - {row['peso_kg']} kg",
+                'Monto': row['precio_total'],
+                'Estado': row['estado_pago'],
+                'Debe': 0 if row['estado_pago'] == 'Pagado' else row['precio_total'],
+                'Haber': 0
+            })
+
+        # Agregar ventas
+        for _, row in df_cliente[df_cliente['tipo'] == 'Egreso (Venta)'].iterrows():
+            movimientos_cuenta.append({
+                'Fecha': row['fecha'],
+                'Tipo': 'Venta (Yo vendí)',
+                'Detalle': f"{row['producto']} - {row['cantidad']} u. - {row['peso_kg']} kg",
+                'Monto': row['precio_total'],
+                'Estado': row['estado_pago'],
+                'Debe': 0,
+                'Haber': 0 if row['estado_pago'] == 'Pagado' else row['precio_total']
+            })
+
+    # Agregar pagos a cuenta
+    for _, row in df_pagos_cliente.iterrows():
+        movimientos_cuenta.append({
+            'Fecha': row['fecha'],
+            'Tipo': f"Pago a cuenta ({row['tipo']})",
+            'Detalle': row['concepto'],
+            'Monto': row['monto'],
+            'Estado': '-',
+            'Debe': 0 if row['tipo'] == 'ingreso' else row['monto'],
+            'Haber': row['monto'] if row['tipo'] == 'ingreso' else 0
+        })
+
+    if not movimientos_cuenta:
+        return pd.DataFrame(columns=COLUMNAS_ESTADO_CUENTA + ['Balance'])
+
+    # Crear DataFrame y ordenar por fecha
+    df_cuenta = pd.DataFrame(movimientos_cuenta)
+    df_cuenta = df_cuenta.sort_values('Fecha', ascending=False)
+
+    # Calcular balance acumulado en centavos enteros: sin arrastre de redondeo, un saldo saldado da 0
+    debe = columna_centavos(df_cuenta, 'Debe')
+    haber = columna_centavos(df_cuenta, 'Haber')
+    df_cuenta['Debe'] = debe / 100
+    df_cuenta['Haber'] = haber / 100
+    df_cuenta['Balance'] = (haber - debe).cumsum()[::-1] / 100
+    return df_cuenta
+
+def generar_excel_bytes(dataframe, nombre_hoja="Datos"):
+    """Contenido de un archivo Excel con el DataFrame en una hoja"""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        dataframe.to_excel(writer, sheet_name=nombre_hoja, index=False)
+    return output.getvalue()
+
+def nombre_archivo_estado(cliente, fecha=None):
+    fecha = fecha or datetime.now().strftime('%Y%m%d')
+    seguro = re.sub(r'[^\w\- ]+', '_', str(cliente)).strip() or 'sin_nombre'
+    return f"estado_cuenta_{seguro}_{fecha}.xlsx"
+
+# Datos compartidos por cada proceso del pool: se envían una sola vez al iniciarlo
+_grupos_movimientos = {}
+_grupos_pagos = {}
+
+def _inicializar_proceso(grupos_movimientos, grupos_pagos):
+    global _grupos_movimientos, _grupos_pagos
+    _grupos_movimientos = grupos_movimientos
+    _grupos_pagos = grupos_pagos
+
+def _generar_estado_cliente(cliente, fecha):
+    df_cliente = _grupos_movimientos.get(cliente, pd.DataFrame())
+    df_pagos_cliente = _grupos_pagos.get(cliente, pd.DataFrame())
+    df_cuenta = construir_estado_cuenta(df_cliente, df_pagos_cliente)
+    return nombre_archivo_estado(cliente, fecha), generar_excel_bytes(df_cuenta, nombre_hoja="Estado de Cuenta")
+
+def _nombre_unico(nombre, usados):
+    """Evita que dos clientes con nombres parecidos pisen el mismo archivo del ZIP"""
+    candidato = nombre
+    sufijo = 2
+    while candidato in usados:
+        candidato = nombre.replace('.xlsx', f"_{sufijo}.xlsx")
+        sufijo += 1
+    usados.add(candidato)
+    return candidato
+
+def _agrupar(df, columna):
+    if df.empty or columna not in df.columns:
+        return {}
+    return {clave: grupo for clave, grupo in df.groupby(columna, sort=False)}
+
+def generar_estados_zip(df_movimientos, df_pagos, clientes=None, max_procesos=None, destino=None):
+    """Genera el Excel del estado de cuenta de cada cliente y los escribe en un ZIP.
+
+    Parte de una única lectura de movimientos y pagos: los agrupa por cliente una vez,
+    reparte los grupos a cada proceso del pool al arrancarlo y va agregando cada
+    Excel al ZIP a medida que termina. Devuelve el contenido del ZIP, o lo escribe en
+    `destino` (ruta o archivo binario) si se indica.
+    """
+    grupos_movimientos = _agrupar(df_movimientos, 'descripcion')
+    grupos_pagos = _agrupar(df_pagos, 'cliente_nombre')
+    if clientes is None:
+        clientes = sorted(set(grupos_movimientos) | set(grupos_pagos))
+    fecha = datetime.now().strftime('%Y%m%d')
+    salida = destino if destino is not None else BytesIO()
+    procesos = max(1, min(max_procesos or os.cpu_count() or 1, len(clientes) or 1))
+    usados = set()
+
+    # Los .xlsx ya vienen comprimidos: se guardan tal cual en el ZIP
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as archivo_zip:
+        if procesos == 1:
+            _inicializar_proceso(grupos_movimientos, grupos_pagos)
+            for cliente in clientes:
+                nombre, contenido = _generar_estado_cliente(cliente, fecha)
+                archivo_zip.writestr(_nombre_unico(nombre, usados), contenido)
+        else:
+            # spawn: el proceso de la app tiene hilos (listeners, gRPC) que no sobreviven a un fork
+            contexto = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto,
+                                     initializer=_inicializar_proceso,
+                                     initargs=(grupos_movimientos, grupos_pagos)) as pool:
+                futuros = [pool.submit(_generar_estado_cliente, cliente, fecha) for cliente in clientes]
+                for futuro in as_completed(futuros):
+                    nombre, contenido = futuro.result()
+                    archivo_zip.writestr(_nombre_unico(nombre, usados), contenido)
+
+    if destino is None:
+        return salida.getvalue()
+    return None
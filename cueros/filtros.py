@@ -0,0 +1,98 @@
+"""Motor de filtros del tablero: índices y sumas parciales por celda precalculados.
+
+Una celda es una combinación (estado_pago, producto, cliente). Al armar el motor
+se guardan, una sola vez, las posiciones de las filas de cada celda y sus sumas
+de cantidad, kg y centavos por tipo (compra / venta). Cualquier combinación de
+filtros (None = todos) se resuelve juntando celdas: las métricas suman las celdas
+que coinciden y las filas se toman de sus posiciones, así que cambiar un filtro
+cuesta lo que las filas que coinciden y no lo que toda la historia.
+"""
+import numpy as np
+import pandas as pd
+
+from .costos import TIPO_COMPRA, TIPO_VENTA
+from .dinero import a_pesos, columna_centavos
+
+CLAVES_FILTRO = ('estado_pago', 'producto', 'descripcion')
+_SIN_VALOR = object()
+
+class MotorFiltros:
+    """Índices por celda y sumas parciales (cantidad, kg y centavos de compras y de ventas)
+    de un DataFrame de movimientos con saldos de apertura"""
+
+    def __init__(self, df):
+        self.df = df
+        # Como en la página, filtrar por una columna que el DataFrame no tiene no filtra
+        self._con_columna = tuple(campo in df.columns for campo in CLAVES_FILTRO)
+        self._posiciones = {}
+        self._sumas = {}
+        if df.empty:
+            return
+        # Los valores faltantes forman su propia celda (ningún filtro la elige salvo "todos")
+        claves = pd.DataFrame({campo: df[campo].astype(object).where(df[campo].notna(), _SIN_VALOR) if campo in df.columns
+                               else _SIN_VALOR for campo in CLAVES_FILTRO}, index=df.index)
+        # Posiciones (no etiquetas) de las filas de cada celda, en el orden del DataFrame
+        self._posiciones = claves.groupby(list(CLAVES_FILTRO), sort=False).indices
+        celdas = list(self._posiciones)
+        codigos = np.empty(len(df), dtype=np.intp)
+        for codigo, celda in enumerate(celdas):
+            codigos[self._posiciones[celda]] = codigo
+        tipo = df['tipo'].to_numpy() if 'tipo' in df.columns else np.full(len(df), None)
+        cantidad = pd.to_numeric(df['cantidad'], errors='coerce') if 'cantidad' in df.columns else pd.Series(0, index=df.index)
+        # Como en metricas_stock: una columna de enteros da un stock entero
+        cantidad_entera = pd.api.types.is_integer_dtype(cantidad)
+        peso = pd.to_numeric(df['peso_kg'], errors='coerce') if 'peso_kg' in df.columns else pd.Series(0.0, index=df.index)
+        valores = (cantidad.fillna(0).to_numpy(dtype=float), peso.fillna(0).to_numpy(dtype=float),
+                   columna_centavos(df, 'precio_total').to_numpy(dtype=float))
+        sumas = []
+        for tipo_movimiento in (TIPO_COMPRA, TIPO_VENTA):
+            del_tipo = tipo == tipo_movimiento
+            sumas.extend(np.bincount(codigos[del_tipo], weights=columna[del_tipo], minlength=len(celdas)) for columna in valores)
+        for codigo, celda in enumerate(celdas):
+            cantidad_compra, kg_compra, centavos_compra, cantidad_venta, kg_venta, centavos_venta = (suma[codigo] for suma in sumas)
+            if cantidad_entera:
+                cantidad_compra, cantidad_venta = int(round(cantidad_compra)), int(round(cantidad_venta))
+            # Los centavos caben exactos en un float64 (hasta 2**53)
+            self._sumas[celda] = (cantidad_compra, kg_compra, int(round(centavos_compra)),
+                                  cantidad_venta, kg_venta, int(round(centavos_venta)))
+
+    @staticmethod
+    def _coincide(celda, filtros):
+        return all(valor is None or valor == clave for clave, valor in zip(celda, filtros))
+
+    def _filtros(self, estado_pago, producto, cliente):
+        return tuple(valor if presente else None
+                     for valor, presente in zip((estado_pago, producto, cliente), self._con_columna))
+
+    def _celdas(self, filtros):
+        return [celda for celda in self._posiciones if self._coincide(celda, filtros)]
+
+    def filas(self, estado_pago=None, producto=None, cliente=None):
+        """Filas del DataFrame que pasan los filtros (None = todos), en su orden original"""
+        filtros = self._filtros(estado_pago, producto, cliente)
+        if filtros == (None, None, None):
+            return self.df
+        posiciones = [self._posiciones[celda] for celda in self._celdas(filtros)]
+        if not posiciones:
+            return self.df.iloc[:0]
+        return self.df.iloc[np.sort(np.concatenate(posiciones))]
+
+    def metricas(self, estado_pago=None, producto=None, cliente=None):
+        """Las métricas de calculos.metricas_stock para los filtros, sumando celdas precalculadas"""
+        stock_unidades = 0
+        stock_kg = 0.0
+        centavos = {'deuda_compras': 0, 'a_cobrar_ventas': 0, 'cobrado_ventas': 0, 'pagado_compras': 0}
+        for celda in self._celdas(self._filtros(estado_pago, producto, cliente)):
+            cantidad_compra, kg_compra, centavos_compra, cantidad_venta, kg_venta, centavos_venta = self._sumas[celda]
+            stock_unidades += cantidad_compra - cantidad_venta
+            stock_kg += kg_compra - kg_venta
+            if celda[0] == 'Impago':
+                centavos['deuda_compras'] += centavos_compra
+                centavos['a_cobrar_ventas'] += centavos_venta
+            elif celda[0] == 'Pagado':
+                centavos['pagado_compras'] += centavos_compra
+                centavos['cobrado_ventas'] += centavos_venta
+        metricas = {'stock_unidades': stock_unidades, 'stock_kg': stock_kg}
+        metricas.update({campo: a_pesos(valor) for campo, valor in centavos.items()})
+        metricas['dinero_esperado'] = a_pesos(centavos['cobrado_ventas'] - centavos['pagado_compras'])
+        return metricas
@@ -0,0 +1,481 @@
+"""Firestore local en memoria, para pruebas de carga y desarrollo sin conexión.
+
+Implementa la parte del cliente de Firestore que usa la app: colecciones y
+documentos, consultas (where, order_by, limit, select, '__name__'), lotes con
+precondiciones (create, update y delete con last_update_time), listeners
+on_snapshot, agregaciones sum/count y particiones para el escaneo paralelo.
+Cuenta lecturas y escrituras como las factura Firestore (cada documento devuelto
+es una lectura; una consulta vacía cuesta una) y puede simular la latencia de red.
+
+    db = FirestoreLocal(latencia=0.02)
+    conexion.usar_db(db)
+"""
+import copy
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from google.api_core import exceptions as google_exceptions
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+from google.cloud.firestore_v1.transforms import Increment
+
+_ID = '__name__'
+# Orden de Firestore entre tipos distintos: null < bool < número < fecha < texto < resto
+_RANGO_TIPOS = ((type(None), 0), (bool, 1), (int, 2), (float, 2), (datetime, 3), (str, 4), (bytes, 5))
+# Una agregación cuesta una lectura por cada (hasta) 1000 entradas de índice recorridas
+_ENTRADAS_POR_LECTURA = 1000
+
+def _clave_orden(valor):
+    for tipo, rango in _RANGO_TIPOS:
+        if isinstance(valor, tipo):
+            return (rango, valor)
+    return (9, str(valor))
+
+def _comparable(a, b):
+    return _clave_orden(a)[0] == _clave_orden(b)[0]
+
+def _valor_id(valor):
+    return valor.id if isinstance(valor, ReferenciaDocumento) else str(valor)
+
+def _cumple(valor, operador, esperado):
+    if operador == '==':
+        return valor == esperado
+    if operador == '!=':
+        return valor != esperado and valor is not None
+    if operador == 'in':
+        return valor in esperado
+    if operador == 'not-in':
+        return valor is not None and valor not in esperado
+    if operador == 'array_contains':
+        return isinstance(valor, list) and esperado in valor
+    if not _comparable(valor, esperado):
+        return False
+    if operador == '<':
+        return _clave_orden(valor) < _clave_orden(esperado)
+    if operador == '<=':
+        return _clave_orden(valor) <= _clave_orden(esperado)
+    if operador == '>':
+        return _clave_orden(valor) > _clave_orden(esperado)
+    if operador == '>=':
+        return _clave_orden(valor) >= _clave_orden(esperado)
+    raise ValueError(f"Operador no soportado: {operador}")
+
+class InstantaneaDocumento:
+    """Lo mismo que DocumentSnapshot: id, reference, exists, to_dict(), get() y update_time"""
+
+    def __init__(self, referencia, datos, update_time=None, create_time=None, campos=None):
+        self.reference = referencia
+        self.id = referencia.id
+        self.exists = datos is not None
+        self.update_time = update_time
+        self.create_time = create_time
+        if datos is not None and campos is not None:
+            datos = {campo: datos[campo] for campo in campos if campo in datos}
+        self._datos = datos
+
+    def to_dict(self):
+        return copy.deepcopy(self._datos) if self._datos is not None else None
+
+    def get(self, campo):
+        return copy.deepcopy(self._datos.get(campo)) if self._datos is not None else None
+
+class ReferenciaDocumento:
+    def __init__(self, db, coleccion, doc_id):
+        self._db = db
+        self.id = str(doc_id)
+        self.parent = ReferenciaColeccion(db, coleccion)
+        self.path = f"{coleccion}/{self.id}"
+
+    def __eq__(self, otra):
+        return isinstance(otra, ReferenciaDocumento) and otra.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, retry=None, timeout=None):
+        return self._db._leer_documento(self)
+
+    def set(self, datos, merge=False, retry=None, timeout=None):
+        lote = self._db.batch()
+        lote.set(self, datos, merge=merge)
+        lote.commit()
+
+    def create(self, datos, retry=None, timeout=None):
+        lote = self._db.batch()
+        lote.create(self, datos)
+        lote.commit()
+
+    def update(self, datos, option=None, retry=None, timeout=None):
+        lote = self._db.batch()
+        lote.update(self, datos, option=option)
+        lote.commit()
+
+    def delete(self, option=None, retry=None, timeout=None):
+        lote = self._db.batch()
+        lote.delete(self, option=option)
+        lote.commit()
+
+class Consulta:
+    def __init__(self, db, coleccion, filtros=(), ordenes=(), limite=None, campos=None):
+        self._db = db
+        self._coleccion = coleccion
+        self._filtros = tuple(filtros)
+        self._ordenes = tuple(ordenes)
+        self._limite = limite
+        self._campos = campos
+
+    def _copiar(self, **cambios):
+        actual = {'filtros': self._filtros, 'ordenes': self._ordenes, 'limite': self._limite, 'campos': self._campos}
+        actual.update(cambios)
+        return Consulta(self._db, self._coleccion, **actual)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copiar(filtros=self._filtros + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copiar(ordenes=self._ordenes + ((field_path, str(direction).upper().startswith('DESC')),))
+
+    def limit(self, cantidad):
+        return self._copiar(limite=cantidad)
+
+    def select(self, field_paths):
+        return self._copiar(campos=tuple(field_paths))
+
+    def _coincidencias(self):
+        """(referencia, datos, update_time, create_time) de los documentos que cumplen la consulta"""
+        filtros = []
+        for campo, operador, esperado in self._filtros:
+            if campo == _ID:
+                esperado = [_valor_id(e) for e in esperado] if operador in ('in', 'not-in') else _valor_id(esperado)
+            filtros.append((campo, operador, esperado))
+        filas = []
+        for doc_id, (datos, actualizado, creado) in self._db._documentos(self._coleccion).items():
+            cumple = True
+            for campo, operador, esperado in filtros:
+                if campo != _ID and campo not in datos:
+                    cumple = False
+                    break
+                if not _cumple(doc_id if campo == _ID else datos[campo], operador, esperado):
+                    cumple = False
+                    break
+            # Firestore excluye los documentos que no tienen el campo por el que se ordena
+            if cumple and all(campo == _ID or campo in datos for campo, _desc in self._ordenes):
+                filas.append((doc_id, datos, actualizado, creado))
+        ordenes = self._ordenes
+        if not any(campo == _ID for campo, _desc in ordenes):
+            ordenes = ordenes + ((_ID, ordenes[-1][1] if ordenes else False),)
+        for campo, descendente in reversed(ordenes):
+            filas.sort(key=lambda fila: _clave_orden(fila[0] if campo == _ID else fila[1][campo]), reverse=descendente)
+        if self._limite is not None:
+            filas = filas[:self._limite]
+        return [(ReferenciaDocumento(self._db, self._coleccion, doc_id), datos, actualizado, creado)
+                for doc_id, datos, actualizado, creado in filas]
+
+    def stream(self, retry=None, timeout=None, transaction=None):
+        filas = self._coincidencias()
+        self._db._esperar_red(len(filas))
+        self._db._contar_lecturas(max(1, len(filas)))
+        # Los datos guardados no se modifican en el lugar (cada escritura crea un dict nuevo) y to_dict() copia
+        for referencia, datos, actualizado, creado in filas:
+            yield InstantaneaDocumento(referencia, datos, actualizado, creado, self._campos)
+
+    def get(self, retry=None, timeout=None, transaction=None):
+        return list(self.stream())
+
+    def sum(self, field_ref, alias=None):
+        return _Agregacion(self, 'sum', field_ref, alias)
+
+    def count(self, alias=None):
+        return _Agregacion(self, 'count', None, alias)
+
+    def on_snapshot(self, callback):
+        if self._filtros or self._ordenes or self._limite is not None:
+            raise NotImplementedError("FirestoreLocal solo escucha colecciones completas")
+        return self._db._escuchar(self._coleccion, callback)
+
+class _Agregacion:
+    def __init__(self, consulta, tipo, campo, alias):
+        self._consulta = consulta
+        self._tipo = tipo
+        self._campo = campo
+        self._alias = alias or 'field_1'
+
+    def get(self, retry=None, timeout=None, transaction=None):
+        self._consulta._db._esperar_red()
+        filas = self._consulta._coincidencias()
+        self._consulta._db._contar_lecturas(max(1, -(-len(filas) // _ENTRADAS_POR_LECTURA)))
+        if self._tipo == 'count':
+            valor = len(filas)
+        else:
+            numeros = [datos.get(self._campo) for _ref, datos, _a, _c in filas]
+            valor = sum(n for n in numeros if isinstance(n, (int, float)) and not isinstance(n, bool))
+        return [[SimpleNamespace(alias=self._alias, value=valor)]]
+
+class ReferenciaColeccion(Consulta):
+    def __init__(self, db, coleccion):
+        super().__init__(db, coleccion)
+        self.id = coleccion
+
+    def document(self, document_id=None):
+        return ReferenciaDocumento(self._db, self._coleccion, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, datos, document_id=None, retry=None, timeout=None):
+        referencia = self.document(document_id)
+        referencia.create(datos)
+        return self._db._ultimo_tiempo, referencia
+
+class _GrupoColecciones:
+    def __init__(self, db, coleccion):
+        self._db = db
+        self._coleccion = coleccion
+
+    def get_partitions(self, partition_count, retry=None, timeout=None):
+        """Cortes que reparten los IDs en partition_count + 1 rangos (como la partition query)"""
+        self._db._esperar_red()
+        ids = sorted(self._db._documentos(self._coleccion))
+        partes = partition_count + 1
+        inicio = None
+        for i in range(1, partes):
+            if len(ids) < partes:
+                break
+            fin = ReferenciaDocumento(self._db, self._coleccion, ids[len(ids) * i // partes])
+            yield SimpleNamespace(start_at=inicio, end_at=fin)
+            inicio = fin
+        yield SimpleNamespace(start_at=inicio, end_at=None)
+
+class _Escucha:
+    def __init__(self, db, coleccion, callback):
+        self._db = db
+        self.coleccion = coleccion
+        self.callback = callback
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._db._dejar_de_escuchar(self)
+
+class Lote:
+    """Lote atómico: se validan todas las precondiciones antes de aplicar nada"""
+
+    def __init__(self, db):
+        self._db = db
+        self._operaciones = []
+
+    def set(self, referencia, datos, merge=False):
+        self._operaciones.append(('set', referencia, dict(datos), {'merge': merge}))
+
+    def create(self, referencia, datos):
+        self._operaciones.append(('create', referencia, dict(datos), {}))
+
+    def update(self, referencia, datos, option=None):
+        self._operaciones.append(('update', referencia, dict(datos), {'option': option}))
+
+    def delete(self, referencia, option=None):
+        self._operaciones.append(('delete', referencia, None, {'option': option}))
+
+    def commit(self, retry=None, timeout=None):
+        self._db._esperar_red()
+        return self._db._aplicar(self._operaciones)
+
+class FirestoreLocal:
+    """Cliente de Firestore en memoria, seguro entre hilos; ver el docstring del módulo"""
+
+    def __init__(self, latencia=0.0, latencia_por_documento=0.0):
+        self.latencia = latencia
+        self.latencia_por_documento = latencia_por_documento
+        self._lock = threading.RLock()
+        self._colecciones = {}
+        self._escuchas = {}
+        self._ultimo_tiempo = None
+        self._eventos = queue.Queue()
+        self._despachador = None
+        self.lecturas = 0
+        self.escrituras = 0
+        self.llamadas = 0
+
+    # --- API del cliente ---
+    def collection(self, coleccion):
+        return ReferenciaColeccion(self, coleccion)
+
+    def document(self, ruta):
+        coleccion, doc_id = ruta.split('/', 1)
+        return ReferenciaDocumento(self, coleccion, doc_id)
+
+    def collection_group(self, coleccion):
+        return _GrupoColecciones(self, coleccion)
+
+    def batch(self):
+        return Lote(self)
+
+    @staticmethod
+    def write_option(**kwargs):
+        return SimpleNamespace(**kwargs)
+
+    def close(self):
+        with self._lock:
+            self._escuchas = {}
+
+    # --- carga y contadores ---
+    def cargar(self, coleccion, documentos):
+        """Carga documentos ({doc_id: datos}) sin contar escrituras ni notificar"""
+        with self._lock:
+            destino = self._colecciones.setdefault(coleccion, {})
+            for doc_id, datos in documentos.items():
+                momento = self._nuevo_tiempo()
+                destino[str(doc_id)] = (copy.deepcopy(datos), momento, momento)
+
+    def contadores(self):
+        with self._lock:
+            return {'lecturas': self.lecturas, 'escrituras': self.escrituras, 'llamadas': self.llamadas}
+
+    def reiniciar_contadores(self):
+        with self._lock:
+            self.lecturas = self.escrituras = self.llamadas = 0
+
+    def _contar_lecturas(self, cantidad):
+        with self._lock:
+            self.lecturas += cantidad
+
+    def _esperar_red(self, documentos=0):
+        with self._lock:
+            self.llamadas += 1
+        espera = self.latencia + documentos * self.latencia_por_documento
+        if espera > 0:
+            time.sleep(espera)
+
+    def _nuevo_tiempo(self):
+        # update_time estrictamente creciente, como los de Firestore (sirve para las precondiciones)
+        ahora = datetime.now(timezone.utc)
+        if self._ultimo_tiempo is not None and ahora <= self._ultimo_tiempo:
+            ahora = self._ultimo_tiempo + timedelta(microseconds=1)
+        self._ultimo_tiempo = DatetimeWithNanoseconds(
+            ahora.year, ahora.month, ahora.day, ahora.hour, ahora.minute, ahora.second, ahora.microsecond, tzinfo=timezone.utc)
+        return self._ultimo_tiempo
+
+    def _documentos(self, coleccion):
+        with self._lock:
+            return dict(self._colecciones.get(coleccion, {}))
+
+    def _leer_documento(self, referencia):
+        self._esperar_red()
+        self._contar_lecturas(1)
+        with self._lock:
+            fila = self._colecciones.get(referencia.parent.id, {}).get(referencia.id)
+        if fila is None:
+            return InstantaneaDocumento(referencia, None)
+        datos, actualizado, creado = fila
+        return InstantaneaDocumento(referencia, datos, actualizado, creado)
+
+    # --- escrituras ---
+    @staticmethod
+    def _resolver(datos, anteriores, momento):
+        resultado = {}
+        for campo, valor in datos.items():
+            if valor is SERVER_TIMESTAMP:
+                valor = momento
+            elif isinstance(valor, Increment):
+                previo = anteriores.get(campo) if anteriores else None
+                valor = (previo if isinstance(previo, (int, float)) and not isinstance(previo, bool) else 0) + valor.value
+            resultado[campo] = copy.deepcopy(valor)
+        return resultado
+
+    @staticmethod
+    def _actualizar_ruta(destino, ruta, valor):
+        partes = ruta.split('.')
+        for parte in partes[:-1]:
+            if not isinstance(destino.get(parte), dict):
+                destino[parte] = {}
+            destino = destino[parte]
+        destino[partes[-1]] = valor
+
+    def _validar(self, operacion, referencia, opcion):
+        fila = self._colecciones.get(referencia.parent.id, {}).get(referencia.id)
+        if operacion == 'create' and fila is not None:
+            raise google_exceptions.AlreadyExists(f"Document already exists: {referencia.path}")
+        if operacion == 'update' and fila is None:
+            raise google_exceptions.NotFound(f"No document to update: {referencia.path}")
+        ultima = getattr(opcion, 'last_update_time', None) if opcion is not None else None
+        if ultima is not None and (fila is None or fila[1] != ultima):
+            raise google_exceptions.FailedPrecondition(f"The document was modified: {referencia.path}")
+
+    def _aplicar(self, operaciones):
+        cambios = {}
+        with self._lock:
+            for operacion, referencia, _datos, opciones in operaciones:
+                self._validar(operacion, referencia, opciones.get('option'))
+            momento = self._nuevo_tiempo()
+            for operacion, referencia, datos, opciones in operaciones:
+                coleccion = self._colecciones.setdefault(referencia.parent.id, {})
+                fila = coleccion.get(referencia.id)
+                anteriores = fila[0] if fila is not None else None
+                if operacion == 'delete':
+                    if fila is None:
+                        continue
+                    del coleccion[referencia.id]
+                    tipo = 'REMOVED'
+                    nueva = (anteriores, momento, fila[2])
+                else:
+                    resueltos = self._resolver(datos, anteriores, momento)
+                    if operacion == 'update':
+                        nuevos = copy.deepcopy(anteriores)
+                        for ruta, valor in resueltos.items():
+                            self._actualizar_ruta(nuevos, ruta, valor)
+                    elif operacion == 'set' and opciones.get('merge') and anteriores is not None:
+                        nuevos = {**copy.deepcopy(anteriores), **resueltos}
+                    else:
+                        nuevos = resueltos
+                    nueva = (nuevos, momento, fila[2] if fila is not None else momento)
+                    coleccion[referencia.id] = nueva
+                    tipo = 'ADDED' if fila is None else 'MODIFIED'
+                self.escrituras += 1
+                cambios.setdefault(referencia.parent.id, []).append((tipo, referencia, nueva))
+            for coleccion, lista in cambios.items():
+                for escucha in self._escuchas.get(coleccion, []):
+                    self._eventos.put((escucha, lista))
+        return [SimpleNamespace(update_time=momento) for _ in operaciones]
+
+    # --- listeners ---
+    def _escuchar(self, coleccion, callback):
+        escucha = _Escucha(self, coleccion, callback)
+        with self._lock:
+            self._escuchas.setdefault(coleccion, []).append(escucha)
+            if self._despachador is None:
+                self._despachador = threading.Thread(target=self._despachar, name="firestore-local", daemon=True)
+                self._despachador.start()
+            # La primera entrega trae la colección completa, como en Firestore
+            self._eventos.put((escucha, None))
+        return escucha
+
+    def _dejar_de_escuchar(self, escucha):
+        with self._lock:
+            lista = self._escuchas.get(escucha.coleccion, [])
+            if escucha in lista:
+                lista.remove(escucha)
+
+    def _despachar(self):
+        # Los callbacks corren en un hilo propio y en orden de confirmación, como el watch del cliente real
+        for escucha, lista in iter(self._eventos.get, None):
+            if not escucha.is_active:
+                continue
+            with self._lock:
+                filas = dict(self._colecciones.get(escucha.coleccion, {}))
+            documentos = [InstantaneaDocumento(ReferenciaDocumento(self, escucha.coleccion, doc_id), datos, actualizado, creado)
+                          for doc_id, (datos, actualizado, creado) in filas.items()]
+            if lista is None:
+                cambios = [SimpleNamespace(type=SimpleNamespace(name='ADDED'), document=documento) for documento in documentos]
+                self._esperar_red(len(documentos))
+                self._contar_lecturas(max(1, len(documentos)))
+            else:
+                cambios = [SimpleNamespace(type=SimpleNamespace(name=tipo), document=InstantaneaDocumento(referencia, fila[0], fila[1], fila[2]))
+                           for tipo, referencia, fila in lista]
+                self._contar_lecturas(len(cambios))
+            try:
+                escucha.callback(documentos, cambios, self._ultimo_tiempo)
+            except Exception:
+                pass
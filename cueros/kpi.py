@@ -0,0 +1,118 @@
+"""Documento de totales globales (KPI) mantenido con incrementos atómicos.
+
+Las tarjetas del tablero sin filtros (stock en unidades y kg, por cobrar, por
+pagar, dinero esperado) salen de un único documento, kpis/global. Cada escritura
+de movimientos o saldos de apertura suma en el mismo lote un Increment con la
+diferencia entre el aporte del documento nuevo y el del anterior: el total queda
+al día si y solo si se confirma la escritura. Los montos van en centavos y los kg
+en gramos, enteros, así los incrementos no acumulan error.
+
+El verificador recalcula los totales desde los documentos y corrige la deriva
+sumando la diferencia (también con Increment, para no pisar escrituras en curso).
+
+Uso:
+    python -m cueros.kpi [--corregir]
+"""
+import argparse
+
+from .costos import TIPO_COMPRA, TIPO_VENTA, _numero
+from .dinero import a_pesos, centavos_documento
+
+COLECCION_KPI = 'kpis'
+DOCUMENTO_KPI = 'global'
+COLECCIONES_KPI = ('movimientos', 'saldos_apertura')
+CAMPOS_KPI = ('stock_unidades', 'stock_gramos', 'deuda_compras_centavos', 'a_cobrar_ventas_centavos',
+              'cobrado_ventas_centavos', 'pagado_compras_centavos')
+
+def _unidades(valor):
+    # Los enteros siguen enteros; una cantidad con decimales se suma como número
+    if isinstance(valor, int) and not isinstance(valor, bool):
+        return valor
+    numero = _numero(valor)
+    return int(numero) if numero.is_integer() else numero
+
+def aporte_kpi(coleccion, datos):
+    """Lo que un documento suma a cada total"""
+    if coleccion not in COLECCIONES_KPI or not datos:
+        return {}
+    signo = {TIPO_COMPRA: 1, TIPO_VENTA: -1}.get(datos.get('tipo'))
+    if signo is None:
+        return {}
+    aporte = {
+        'stock_unidades': signo * _unidades(datos.get('cantidad')),
+        'stock_gramos': signo * round(_numero(datos.get('peso_kg')) * 1000),
+    }
+    estado = datos.get('estado_pago')
+    if estado in ('Impago', 'Pagado'):
+        campo = {
+            (TIPO_COMPRA, 'Impago'): 'deuda_compras_centavos',
+            (TIPO_VENTA, 'Impago'): 'a_cobrar_ventas_centavos',
+            (TIPO_VENTA, 'Pagado'): 'cobrado_ventas_centavos',
+            (TIPO_COMPRA, 'Pagado'): 'pagado_compras_centavos',
+        }[(datos.get('tipo'), estado)]
+        aporte[campo] = centavos_documento(datos, 'precio_total')
+    return aporte
+
+def diferencia_kpi(coleccion, anterior, datos):
+    """Incremento de cada total cuando un documento pasa de anterior a datos (None = no existe)"""
+    diferencia = dict(aporte_kpi(coleccion, datos))
+    for campo, valor in aporte_kpi(coleccion, anterior).items():
+        diferencia[campo] = diferencia.get(campo, 0) - valor
+    return {campo: valor for campo, valor in diferencia.items() if valor}
+
+class IncrementosKpi:
+    """Suma las diferencias de las escrituras de un lote y las agrega como una sola escritura del documento"""
+
+    def __init__(self):
+        self.totales = {}
+
+    def sumar(self, coleccion, anterior, datos):
+        for campo, valor in diferencia_kpi(coleccion, anterior, datos).items():
+            self.totales[campo] = self.totales.get(campo, 0) + valor
+
+    def agregar(self, db, batch):
+        from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+        from google.cloud.firestore_v1.transforms import Increment
+        incrementos = {campo: Increment(valor) for campo, valor in self.totales.items() if valor}
+        if incrementos:
+            batch.set(db.collection(COLECCION_KPI).document(DOCUMENTO_KPI),
+                      {**incrementos, 'actualizado': SERVER_TIMESTAMP}, merge=True)
+
+def totales_desde_documentos(documentos):
+    """Totales calculados desde cero: {coleccion: iterable de datos}"""
+    totales = dict.fromkeys(CAMPOS_KPI, 0)
+    for coleccion, docs in documentos.items():
+        for datos in docs:
+            for campo, valor in aporte_kpi(coleccion, datos).items():
+                totales[campo] += valor
+    return totales
+
+def metricas_kpi(totales):
+    """Los totales con la forma de calculos.metricas_stock (en pesos y kg)"""
+    centavos = {campo: totales.get(campo) or 0 for campo in CAMPOS_KPI}
+    return {
+        'stock_unidades': centavos['stock_unidades'],
+        'stock_kg': centavos['stock_gramos'] / 1000,
+        'deuda_compras': a_pesos(centavos['deuda_compras_centavos']),
+        'a_cobrar_ventas': a_pesos(centavos['a_cobrar_ventas_centavos']),
+        'cobrado_ventas': a_pesos(centavos['cobrado_ventas_centavos']),
+        'pagado_compras': a_pesos(centavos['pagado_compras_centavos']),
+        'dinero_esperado': a_pesos(centavos['cobrado_ventas_centavos'] - centavos['pagado_compras_centavos']),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalcula los totales globales desde los documentos y los compara con kpis/global")
+    parser.add_argument('--corregir', action='store_true', help="corregir la deriva encontrada")
+    parser.add_argument('--desde-firestore', action='store_true', help="recalcular con un escaneo de Firestore en lugar del almacén en memoria")
+    args = parser.parse_args(argv)
+    from .datos import verificar_kpi
+    informe = verificar_kpi(corregir=args.corregir, desde_firestore=args.desde_firestore)
+    if not informe['diferencias']:
+        print("kpis/global coincide con los documentos")
+        return
+    for campo, diferencia in sorted(informe['diferencias'].items()):
+        print(f"  {campo}: guardado {informe['guardado'].get(campo, 0)}, recalculado {informe['recalculado'][campo]} ({diferencia:+})")
+    print("Corregido" if informe['corregido'] else "Sin corregir (usar --corregir)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""Lotes de compra: cada compra abre un lote y cada venta consume de uno o varios.
+
+Un lote es una compra (movimiento o saldo de apertura de tipo compra): proveedor,
+fecha, producto, unidades y kg. Una venta consume primero los lotes que nombra en
+su campo 'lotes' (IDs de las compras, en ese orden) y el resto de los lotes
+abiertos más viejos del producto (FIFO). Se consume por unidades, llevando los kg
+en proporción a los de la venta; si la venta no tiene unidades, por kg.
+
+El índice guarda lo que queda de cada lote y, para responder sin recorrer los
+movimientos, los lotes abiertos ordenados por fecha (bisect) y por producto, los
+lotes abiertos de cada proveedor y lo que queda por proveedor y por producto.
+Como en cueros.costos, los movimientos nuevos se aplican en O(1) más los lotes que
+consuman; editar, borrar o cargar con fecha anterior obliga a reconstruir, lo que
+se hace una sola vez, en la próxima consulta.
+
+Uso:
+    python -m cueros.lotes [--antiguedad 30] [--proveedor "Nombre"] [--producto Cueros]
+"""
+import argparse
+import bisect
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from .costos import TIPO_COMPRA, TIPO_VENTA, _numero
+from .duplicados import clave_nombre
+
+_EPSILON = 1e-9
+
+def huella_lote(datos):
+    """Campos que afectan a los lotes; si no cambian, editar el movimiento no obliga a reconstruir"""
+    lotes = datos.get('lotes')
+    return (str(datos.get('fecha', '')), datos.get('tipo'), datos.get('producto'), str(datos.get('descripcion') or ''),
+            _numero(datos.get('cantidad')), _numero(datos.get('peso_kg')),
+            tuple(str(lote) for lote in lotes) if isinstance(lotes, (list, tuple)) else ())
+
+class IndiceLotes:
+    """Unidades y kg que quedan de cada lote, con índices por fecha, producto y proveedor"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._huellas = {}
+        self.recalculos = 0
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._lotes = {}
+        self._consumos = {}
+        self._abiertos = []
+        self._abiertos_producto = {}
+        self._abiertos_proveedor = {}
+        self._restante_proveedor = {}
+        self._restante_producto = {}
+        self._aplicados = set()
+        self._cursor = None
+        self.requiere_recalculo = False
+
+    # --- Mantenimiento ---
+    def aplicar_cambios(self, coleccion, documentos, reemplazar=False):
+        """Callback para AlmacenDatos.suscribir: aplica altas en orden y marca reconstrucción si hace falta"""
+        with self._lock:
+            if reemplazar:
+                for clave in [c for c in self._huellas if c[0] == coleccion and c[1] not in documentos]:
+                    self._olvidar(clave)
+            for doc_id, datos in sorted(documentos.items(), key=lambda item: (str((item[1] or {}).get('fecha', '')), str(item[0]))):
+                clave = (coleccion, str(doc_id))
+                if datos is None:
+                    self._olvidar(clave)
+                    continue
+                nueva = huella_lote(datos)
+                previa = self._huellas.get(clave)
+                if previa == nueva:
+                    continue
+                self._huellas[clave] = nueva
+                if previa is not None or self.requiere_recalculo:
+                    self.requiere_recalculo = True
+                elif self._cursor is None or (nueva[0], clave) >= self._cursor:
+                    self._aplicar(clave, nueva)
+                else:
+                    # Movimiento con fecha anterior a lo ya aplicado
+                    self.requiere_recalculo = True
+
+    def _olvidar(self, clave):
+        if self._huellas.pop(clave, None) is not None and clave in self._aplicados:
+            self.requiere_recalculo = True
+
+    def recalcular(self):
+        """Vuelve a aplicar todos los movimientos conocidos, en orden de fecha"""
+        with self._lock:
+            huellas = self._huellas
+            self._reiniciar()
+            for clave, datos_huella in sorted(huellas.items(), key=lambda item: (item[1][0], item[0])):
+                self._aplicar(clave, datos_huella)
+            self.recalculos += 1
+
+    def _al_dia(self):
+        if self.requiere_recalculo:
+            self.recalcular()
+
+    def _aplicar(self, clave, datos_huella):
+        fecha, tipo, producto, proveedor, cantidad, kg, nombrados = datos_huella
+        if tipo == TIPO_COMPRA:
+            self._abrir(clave[1], fecha, producto, proveedor, cantidad, kg)
+        elif tipo == TIPO_VENTA:
+            self._consumir(clave, producto, cantidad, kg, nombrados)
+        self._aplicados.add(clave)
+        self._cursor = (fecha, clave)
+
+    def _abrir(self, lote_id, fecha, producto, proveedor, cantidad, kg):
+        lote = {
+            'lote': lote_id, 'fecha': fecha, 'producto': producto, 'proveedor': proveedor,
+            'proveedor_clave': clave_nombre(proveedor),
+            'cantidad_inicial': cantidad, 'peso_kg_inicial': kg, 'cantidad': cantidad, 'peso_kg': kg,
+        }
+        self._lotes[lote_id] = lote
+        if not self._abierto(lote):
+            return
+        bisect.insort(self._abiertos, (fecha, lote_id))
+        bisect.insort(self._abiertos_producto.setdefault(producto, []), (fecha, lote_id))
+        self._abiertos_proveedor.setdefault(lote['proveedor_clave'], set()).add(lote_id)
+        self._sumar_restante(lote, cantidad, kg)
+        self._contar_abierto(lote, 1)
+
+    @staticmethod
+    def _abierto(lote):
+        if lote['cantidad_inicial'] > _EPSILON:
+            return lote['cantidad'] > _EPSILON
+        return lote['peso_kg'] > _EPSILON
+
+    def _sumar_restante(self, lote, cantidad, kg):
+        for totales, clave in ((self._restante_proveedor, lote['proveedor_clave']), (self._restante_producto, lote['producto'])):
+            restante = totales.setdefault(clave, {'cantidad': 0.0, 'peso_kg': 0.0, 'lotes_abiertos': 0})
+            restante['cantidad'] += cantidad
+            restante['peso_kg'] += kg
+
+    def _contar_abierto(self, lote, signo):
+        for totales, clave in ((self._restante_proveedor, lote['proveedor_clave']), (self._restante_producto, lote['producto'])):
+            totales.setdefault(clave, {'cantidad': 0.0, 'peso_kg': 0.0, 'lotes_abiertos': 0})['lotes_abiertos'] += signo
+
+    def _cerrar(self, lote):
+        entrada = (lote['fecha'], lote['lote'])
+        for ordenados in (self._abiertos, self._abiertos_producto[lote['producto']]):
+            posicion = bisect.bisect_left(ordenados, entrada)
+            if posicion < len(ordenados) and ordenados[posicion] == entrada:
+                del ordenados[posicion]
+        self._abiertos_proveedor[lote['proveedor_clave']].discard(lote['lote'])
+        # Lo que queda de un lote cerrado (kg de más o de menos) deja de contar como stock
+        self._sumar_restante(lote, -lote['cantidad'], -lote['peso_kg'])
+        self._contar_abierto(lote, -1)
+
+    def _candidatos(self, producto, nombrados):
+        """Los lotes nombrados por la venta y después los abiertos más viejos del producto"""
+        for lote_id in nombrados:
+            if lote_id in self._lotes:
+                yield lote_id
+        abiertos = self._abiertos_producto.get(producto, [])
+        posicion = 0
+        while posicion < len(abiertos):
+            entrada = abiertos[posicion]
+            yield entrada[1]
+            # Si el lote se cerró, _cerrar lo quitó y en esta posición ya está el siguiente
+            if posicion < len(abiertos) and abiertos[posicion] == entrada:
+                posicion += 1
+
+    def _consumir(self, clave, producto, cantidad, kg, nombrados):
+        por_unidades = cantidad > _EPSILON
+        pendiente = cantidad if por_unidades else kg
+        kg_por_unidad = kg / cantidad if por_unidades else 0.0
+        consumos = []
+        for lote_id in self._candidatos(producto, nombrados):
+            if pendiente <= _EPSILON:
+                break
+            lote = self._lotes[lote_id]
+            disponible = lote['cantidad'] if por_unidades else lote['peso_kg']
+            if lote['producto'] != producto or not self._abierto(lote) or disponible <= _EPSILON:
+                continue
+            tomado = min(pendiente, disponible)
+            unidades, kilos = (tomado, tomado * kg_por_unidad) if por_unidades else (0.0, tomado)
+            lote['cantidad'] -= unidades
+            lote['peso_kg'] -= kilos
+            self._sumar_restante(lote, -unidades, -kilos)
+            pendiente -= tomado
+            consumos.append({'lote': lote_id, 'cantidad': unidades, 'peso_kg': kilos})
+            if not self._abierto(lote):
+                self._cerrar(lote)
+        self._consumos[clave] = {
+            'consumos': consumos,
+            'sin_lote_cantidad': pendiente if por_unidades else 0.0,
+            'sin_lote_peso_kg': pendiente * kg_por_unidad if por_unidades else pendiente,
+        }
+
+    # --- Consultas ---
+    def lote(self, lote_id):
+        with self._lock:
+            self._al_dia()
+            lote = self._lotes.get(str(lote_id))
+            return self._publico(lote) if lote is not None else None
+
+    def _publico(self, lote):
+        datos = {campo: valor for campo, valor in lote.items() if campo != 'proveedor_clave'}
+        datos['abierto'] = self._abierto(lote)
+        return datos
+
+    def lotes_abiertos(self, anteriores_a=None, producto=None, proveedor=None):
+        """Lotes abiertos, del más viejo al más nuevo; anteriores_a es una fecha 'AAAA-MM-DD...' (excluida).
+
+        El rango de fechas sale de la lista ordenada de abiertos y el proveedor de su
+        conjunto de lotes, sin recorrer lotes cerrados ni movimientos.
+        """
+        with self._lock:
+            self._al_dia()
+            ordenados = self._abiertos if producto is None else self._abiertos_producto.get(producto, [])
+            if anteriores_a is not None:
+                ordenados = ordenados[:bisect.bisect_left(ordenados, (str(anteriores_a), ''))]
+            if proveedor is not None:
+                del_proveedor = self._abiertos_proveedor.get(clave_nombre(proveedor), set())
+                if len(del_proveedor) < len(ordenados):
+                    lotes = sorted((self._lotes[lote_id] for lote_id in del_proveedor), key=lambda lote: (lote['fecha'], lote['lote']))
+                    return [self._publico(lote) for lote in lotes
+                            if (producto is None or lote['producto'] == producto)
+                            and (anteriores_a is None or lote['fecha'] < str(anteriores_a))]
+                ordenados = [entrada for entrada in ordenados if entrada[1] in del_proveedor]
+            return [self._publico(self._lotes[lote_id]) for _fecha, lote_id in ordenados]
+
+    def lotes_con_antiguedad(self, dias, hoy=None, **filtros):
+        """Lotes abiertos comprados hace más de dias días"""
+        hoy = hoy or datetime.now()
+        return self.lotes_abiertos(anteriores_a=(hoy - timedelta(days=dias)).strftime("%Y-%m-%d %H:%M:%S"), **filtros)
+
+    def restante(self, proveedor=None, producto=None):
+        """Unidades, kg y lotes abiertos que quedan de un proveedor o de un producto (uno de los dos)"""
+        with self._lock:
+            self._al_dia()
+            if proveedor is not None:
+                totales = self._restante_proveedor.get(clave_nombre(proveedor))
+            else:
+                totales = self._restante_producto.get(producto)
+            return dict(totales) if totales else {'cantidad': 0.0, 'peso_kg': 0.0, 'lotes_abiertos': 0}
+
+    def consumos_venta(self, coleccion, doc_id):
+        """De qué lotes salió una venta (y lo que no tuvo lote que lo respalde)"""
+        with self._lock:
+            self._al_dia()
+            consumo = self._consumos.get((coleccion, str(doc_id)))
+            return None if consumo is None else {**consumo, 'consumos': [dict(c) for c in consumo['consumos']]}
+
+    def resumen(self, solo_abiertos=True):
+        """DataFrame de lotes (por defecto solo los abiertos), del más viejo al más nuevo"""
+        if solo_abiertos:
+            lotes = self.lotes_abiertos()
+        else:
+            with self._lock:
+                self._al_dia()
+                lotes = sorted((self._publico(lote) for lote in self._lotes.values()), key=lambda lote: (lote['fecha'], lote['lote']))
+        columnas = ['lote', 'fecha', 'producto', 'proveedor', 'cantidad', 'peso_kg', 'cantidad_inicial', 'peso_kg_inicial', 'abierto']
+        return pd.DataFrame(lotes, columns=columnas)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lotes abiertos y lo que queda de cada uno")
+    parser.add_argument('--antiguedad', type=int, default=None, help="solo los lotes comprados hace más de estos días")
+    parser.add_argument('--proveedor', help="solo los lotes de este proveedor")
+    parser.add_argument('--producto', help="solo los lotes de este producto")
+    args = parser.parse_args(argv)
+    from .datos import obtener_indice_lotes
+    indice = obtener_indice_lotes()
+    filtros = {'proveedor': args.proveedor, 'producto': args.producto}
+    if args.antiguedad is not None:
+        lotes = indice.lotes_con_antiguedad(args.antiguedad, **filtros)
+    else:
+        lotes = indice.lotes_abiertos(**filtros)
+    for lote in lotes:
+        print(f"{lote['fecha'][:10]}  {lote['lote']}  {lote['producto']:<8} {lote['proveedor']:<30} "
+              f"{lote['cantidad']:>8.0f} u. {lote['peso_kg']:>10.1f} kg")
+    if args.proveedor or args.producto:
+        restante = indice.restante(proveedor=args.proveedor) if args.proveedor else indice.restante(producto=args.producto)
+        print(f"Quedan {restante['cantidad']:.0f} u. y {restante['peso_kg']:.1f} kg en {restante['lotes_abiertos']} lote(s) abiertos")
+    else:
+        print(f"{len(lotes)} lote(s) abiertos")
+
+if __name__ == '__main__':
+    main()
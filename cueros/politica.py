@@ -0,0 +1,147 @@
+"""Política de llamadas a Firestore: plazos, reintentos y cortacircuitos"""
+import random
+import threading
+import time
+from collections import deque
+
+from google.api_core import exceptions as google_exceptions
+
+ERRORES_REINTENTABLES = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.Aborted,
+    google_exceptions.InternalServerError,
+    google_exceptions.Unknown,
+    ConnectionError,
+    TimeoutError,
+)
+
+# Errores tras los que no se sabe si la escritura se aplicó: la respuesta pudo perderse
+# después del commit. Los demás reintentables rechazan la llamada sin aplicarla.
+ERRORES_AMBIGUOS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.Unknown,
+    ConnectionError,
+    TimeoutError,
+)
+
+class CircuitoAbierto(Exception):
+    """Firestore está degradado y el cortacircuitos rechaza la llamada sin intentarla"""
+
+class PoliticaLlamadas:
+    """Ejecuta cada llamada a Firestore con plazo, reintentos con espera exponencial
+    (jitter completo) para errores transitorios y un cortacircuitos compartido.
+
+    Tras `umbral_fallos` llamadas seguidas que fallan por errores transitorios el
+    circuito se abre y las llamadas se rechazan durante `enfriamiento` segundos; luego
+    se deja pasar una de prueba (semiabierto) que lo cierra si tiene éxito.
+    """
+
+    def __init__(self, plazo=15.0, max_intentos=4, espera_base=0.25, espera_max=4.0, umbral_fallos=5, enfriamiento=30.0):
+        self.plazo = plazo
+        self.max_intentos = max_intentos
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento = enfriamiento
+        self._lock = threading.Lock()
+        self._fallos_seguidos = 0
+        self._abierto_desde = None
+        self._prueba_en_curso = False
+        self._metricas = {}
+
+    def estado(self):
+        with self._lock:
+            if self._abierto_desde is None:
+                return 'cerrado'
+            if time.monotonic() - self._abierto_desde >= self.enfriamiento:
+                return 'semiabierto'
+            return 'abierto'
+
+    def _metrica(self, operacion):
+        if operacion not in self._metricas:
+            self._metricas[operacion] = {
+                'llamadas': 0, 'exitos': 0, 'reintentos': 0, 'fallos': 0,
+                'rechazadas': 0, 'latencias': deque(maxlen=500),
+            }
+        return self._metricas[operacion]
+
+    def _autorizar(self, operacion):
+        with self._lock:
+            metrica = self._metrica(operacion)
+            metrica['llamadas'] += 1
+            if self._abierto_desde is None:
+                return
+            if time.monotonic() - self._abierto_desde >= self.enfriamiento and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return
+            metrica['rechazadas'] += 1
+        raise CircuitoAbierto(f"Firestore degradado: se omitió '{operacion}'")
+
+    def _registrar_resultado(self, operacion, exito, latencia, transitorio=False):
+        with self._lock:
+            metrica = self._metrica(operacion)
+            metrica['latencias'].append(latencia)
+            self._prueba_en_curso = False
+            if exito:
+                metrica['exitos'] += 1
+                self._fallos_seguidos = 0
+                self._abierto_desde = None
+                return
+            metrica['fallos'] += 1
+            if transitorio:
+                self._fallos_seguidos += 1
+                if self._abierto_desde is not None or self._fallos_seguidos >= self.umbral_fallos:
+                    self._abierto_desde = time.monotonic()
+
+    def ejecutar(self, operacion, funcion, plazo=None, idempotente=True):
+        """Llama a funcion(timeout) respetando el plazo total de la operación.
+
+        Con idempotente=False (p. ej. un add() con ID automático o un Increment) un
+        error ambiguo no se reintenta: repetir la escritura podría aplicarla dos veces.
+        """
+        self._autorizar(operacion)
+        inicio = time.monotonic()
+        limite = inicio + (plazo or self.plazo)
+        intento = 0
+        while True:
+            try:
+                resultado = funcion(max(0.1, limite - time.monotonic()))
+            except ERRORES_REINTENTABLES as e:
+                intento += 1
+                espera = random.uniform(0, min(self.espera_max, self.espera_base * 2 ** intento))
+                ambiguo = not idempotente and isinstance(e, ERRORES_AMBIGUOS)
+                if ambiguo or intento >= self.max_intentos or time.monotonic() + espera >= limite:
+                    self._registrar_resultado(operacion, False, time.monotonic() - inicio, transitorio=True)
+                    raise
+                with self._lock:
+                    self._metrica(operacion)['reintentos'] += 1
+                time.sleep(espera)
+            except Exception:
+                self._registrar_resultado(operacion, False, time.monotonic() - inicio)
+                raise
+            else:
+                self._registrar_resultado(operacion, True, time.monotonic() - inicio)
+                return resultado
+
+    def metricas(self):
+        """Resumen por operación: conteos y latencias p50/p95 en milisegundos"""
+        filas = []
+        with self._lock:
+            for operacion, metrica in sorted(self._metricas.items()):
+                latencias = sorted(metrica['latencias'])
+                p50 = latencias[len(latencias) // 2] * 1000 if latencias else 0.0
+                p95 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))] * 1000 if latencias else 0.0
+                filas.append({
+                    'operacion': operacion,
+                    'llamadas': metrica['llamadas'],
+                    'exitos': metrica['exitos'],
+                    'reintentos': metrica['reintentos'],
+                    'fallos': metrica['fallos'],
+                    'rechazadas': metrica['rechazadas'],
+                    'p50_ms': round(p50, 1),
+                    'p95_ms': round(p95, 1),
+                })
+        return filas
@@ -0,0 +1,132 @@
+"""Presupuesto de lecturas de Firestore por rerun y por sesión de la app.
+
+La app guarda una CuentaLecturas en cada sesión y la activa al empezar el rerun;
+desde ahí, las consultas de la capa de datos anotan sus lecturas en la cuenta
+activa, separadas por la sección de la página que las pidió. Antes de leer, la
+capa de datos aparta lo que estima gastar y limita la consulta a eso: si no
+alcanza, sirve el último resultado guardado de esa lectura o uno parcial (hasta
+las lecturas que quedan) y lo anota como degradado, para que la página lo avise. Sin cuenta activa (scripts,
+API) las lecturas no se limitan ni se anotan.
+
+La cuenta viaja en una contextvars.ContextVar: un hilo auxiliar la ve si se le
+pasa el contexto (contextvars.copy_context().run), como hace la precarga.
+"""
+import contextvars
+import threading
+
+from .config import PRESUPUESTO_LECTURAS_RERUN, PRESUPUESTO_LECTURAS_SESION
+
+SECCION_GENERAL = 'general'
+
+_cuenta = contextvars.ContextVar('cuenta_lecturas', default=None)
+_seccion = contextvars.ContextVar('seccion_lecturas', default=SECCION_GENERAL)
+
+class CuentaLecturas:
+    """Lecturas gastadas por una sesión (en total y en el rerun actual), por sección"""
+
+    def __init__(self, por_rerun=PRESUPUESTO_LECTURAS_RERUN, por_sesion=PRESUPUESTO_LECTURAS_SESION):
+        self.por_rerun = por_rerun
+        self.por_sesion = por_sesion
+        self._lock = threading.Lock()
+        self.reruns = 0
+        self.lecturas_sesion = 0
+        self.lecturas_rerun = 0
+        self._secciones = {}
+        self.degradadas = []
+
+    def iniciar_rerun(self):
+        with self._lock:
+            self.reruns += 1
+            self.lecturas_rerun = 0
+            self.degradadas = []
+            for seccion in self._secciones.values():
+                seccion['rerun'] = 0
+
+    def _disponibles(self):
+        restantes = []
+        if self.por_rerun:
+            restantes.append(self.por_rerun - self.lecturas_rerun)
+        if self.por_sesion:
+            restantes.append(self.por_sesion - self.lecturas_sesion)
+        return max(0, min(restantes)) if restantes else None
+
+    def disponibles(self):
+        """Lecturas que quedan en este rerun, o None si no hay límite"""
+        with self._lock:
+            return self._disponibles()
+
+    def _sumar(self, seccion, lecturas):
+        self.lecturas_rerun += lecturas
+        self.lecturas_sesion += lecturas
+        datos = self._secciones.setdefault(seccion, {'sesion': 0, 'rerun': 0, 'consultas': 0, 'degradadas': 0})
+        datos['sesion'] += lecturas
+        datos['rerun'] += lecturas
+        return datos
+
+    def reservar(self, seccion, estimado=None):
+        """Aparta lecturas antes de una consulta: el estimado si alcanza, si no las que quedan.
+
+        Sin estimado aparta todo lo disponible. Devuelve None si no hay límite.
+        """
+        with self._lock:
+            disponibles = self._disponibles()
+            if disponibles is None:
+                return None
+            reservadas = disponibles if estimado is None else min(estimado, disponibles)
+            self._sumar(seccion, reservadas)
+            return reservadas
+
+    def registrar(self, seccion, lecturas, reservadas=None):
+        """Anota las lecturas reales de una consulta, devolviendo lo reservado antes"""
+        with self._lock:
+            self._sumar(seccion, lecturas - (reservadas or 0))['consultas'] += 1
+
+    def degradar(self, seccion, operacion, motivo):
+        with self._lock:
+            self._secciones.setdefault(seccion, {'sesion': 0, 'rerun': 0, 'consultas': 0, 'degradadas': 0})['degradadas'] += 1
+            self.degradadas.append({'seccion': seccion, 'operacion': operacion, 'motivo': motivo})
+
+    def informe(self):
+        """Lecturas por sección en este rerun y en la sesión, de la que más gastó a la que menos"""
+        with self._lock:
+            filas = [{'seccion': seccion, 'lecturas_rerun': datos['rerun'], 'lecturas_sesion': datos['sesion'],
+                      'consultas': datos['consultas'], 'degradadas': datos['degradadas']}
+                     for seccion, datos in self._secciones.items()]
+        return sorted(filas, key=lambda fila: (-fila['lecturas_sesion'], fila['seccion']))
+
+def iniciar_rerun(cuenta):
+    """Activa la cuenta de la sesión para este rerun (en el hilo que dibuja la página)"""
+    cuenta.iniciar_rerun()
+    _cuenta.set(cuenta)
+    _seccion.set(SECCION_GENERAL)
+    return cuenta
+
+def cuenta_activa():
+    return _cuenta.get()
+
+def entrar_seccion(nombre):
+    """Las lecturas que siguen (en este contexto) se anotan en la sección nombre"""
+    _seccion.set(nombre)
+
+def limitado():
+    """True si hay una cuenta activa con algún límite de lecturas"""
+    cuenta = _cuenta.get()
+    return cuenta is not None and bool(cuenta.por_rerun or cuenta.por_sesion)
+
+def reservar(estimado=None):
+    cuenta = _cuenta.get()
+    return cuenta.reservar(_seccion.get(), estimado) if cuenta is not None else None
+
+def registrar(lecturas, reservadas=None):
+    cuenta = _cuenta.get()
+    if cuenta is not None:
+        cuenta.registrar(_seccion.get(), lecturas, reservadas)
+
+def degradar(operacion, motivo):
+    cuenta = _cuenta.get()
+    if cuenta is not None:
+        cuenta.degradar(_seccion.get(), operacion, motivo)
+
+def lecturas_de(documentos):
+    """Lecturas que Firestore factura por una consulta: una por documento, mínimo una"""
+    return max(1, len(documentos))
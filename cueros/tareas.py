@@ -0,0 +1,184 @@
+"""Recálculo en segundo plano de las vistas derivadas y su estado para el diagnóstico.
+
+Cada tarea es una función que deja su resultado en una caché por versión de los
+datos (como reporte_antiguedad u obtener_motor_filtros) y una clave con las
+versiones de las que depende. Un hilo del proceso revisa las claves cada tanto,
+y enseguida después de un aviso de cambio, y recalcula solo las tareas cuya clave
+cambió: el rerun del primer usuario después de un cambio encuentra la vista en
+la caché en lugar de calcularla. De cada tarea se guardan las duraciones, la
+última ejecución correcta y el último error.
+"""
+import argparse
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from . import avisos
+
+class ProgramadorTareas:
+    """Tareas de recálculo registradas con registrar(), ejecutadas por un hilo cada `cada` segundos.
+
+    Tras avisar() (por ejemplo, desde un suscriptor del almacén) el hilo espera
+    `espera_cambios` segundos, para juntar una ráfaga de cambios en una sola
+    pasada, y revisa las tareas sin esperar al próximo intervalo.
+    """
+
+    def __init__(self, cada=10.0, espera_cambios=1.0):
+        self.cada = cada
+        self.espera_cambios = espera_cambios
+        self._lock = threading.Lock()
+        # Una tarea a la vez: el hilo y un recálculo pedido desde la página no se pisan
+        self._ejecutando = threading.Lock()
+        self._tareas = {}
+        self._aviso = threading.Event()
+        self._hilo = None
+        self.pasadas = 0
+
+    def registrar(self, nombre, funcion, clave=None, lista=None):
+        """Registra funcion() como tarea.
+
+        clave() identifica los datos de los que depende la vista: la tarea corre
+        solo si cambió desde la última ejecución correcta (sin clave, en cada
+        pasada). lista() dice si ya se puede calcular (p. ej. con el almacén cargado).
+        """
+        with self._lock:
+            self._tareas[nombre] = {
+                'funcion': funcion, 'clave': clave, 'lista': lista, 'clave_hecha': None,
+                'ejecuciones': 0, 'errores': 0, 'duraciones': deque(maxlen=50),
+                'ultimo_exito': None, 'ultimo_error': None, 'momento_error': None,
+            }
+
+    def nombres(self):
+        with self._lock:
+            return list(self._tareas)
+
+    def avisar(self, *_cambios):
+        """Pide una pasada pronto; acepta los argumentos de un suscriptor del almacén"""
+        self._aviso.set()
+
+    def ejecutar(self, nombre, forzar=False):
+        """Corre la tarea si está lista y sus datos cambiaron (o con forzar); devuelve si corrió"""
+        tarea = self._tareas[nombre]
+        with self._ejecutando:
+            try:
+                if tarea['lista'] is not None and not tarea['lista']():
+                    return False
+                clave = tarea['clave']() if tarea['clave'] is not None else None
+            except Exception as e:
+                self._fallo(tarea, f"no se pudo revisar: {str(e)}")
+                return False
+            if not forzar and clave is not None and clave == tarea['clave_hecha']:
+                return False
+            inicio = time.perf_counter()
+            try:
+                # Los avisos de la capa de datos no tienen página donde mostrarse: cuentan como error de la tarea
+                with avisos.capturar() as mensajes:
+                    tarea['funcion']()
+                error = next((mensaje for tipo, mensaje in mensajes if tipo == 'error'), None)
+            except Exception as e:
+                error = str(e)
+            duracion = (time.perf_counter() - inicio) * 1000
+            with self._lock:
+                tarea['ejecuciones'] += 1
+                tarea['duraciones'].append(duracion)
+                if error is None:
+                    tarea['clave_hecha'] = clave
+                    tarea['ultimo_exito'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if error is not None:
+                self._fallo(tarea, error)
+            return True
+
+    def _fallo(self, tarea, error):
+        with self._lock:
+            tarea['errores'] += 1
+            tarea['ultimo_error'] = error
+            tarea['momento_error'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def ejecutar_pendientes(self, forzar=False):
+        """Una pasada por todas las tareas; devuelve los nombres de las que corrieron"""
+        corridas = [nombre for nombre in self.nombres() if self.ejecutar(nombre, forzar)]
+        self.pasadas += 1
+        return corridas
+
+    def _trabajar(self):
+        while True:
+            self.ejecutar_pendientes()
+            if self._aviso.wait(self.cada):
+                time.sleep(self.espera_cambios)
+                self._aviso.clear()
+
+    def iniciar(self):
+        """Arranca el hilo (una vez); con cada=0 no se arranca y las vistas se calculan al pedirlas"""
+        if not self.cada:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._trabajar, name="recalculo", daemon=True)
+                self._hilo.start()
+
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def informe(self):
+        """Una fila por tarea: ejecuciones, errores, duraciones (ms), última ejecución correcta, último error y si está al día"""
+        filas = []
+        for nombre in self.nombres():
+            tarea = self._tareas[nombre]
+            try:
+                al_dia = tarea['clave'] is not None and tarea['clave']() == tarea['clave_hecha']
+            except Exception:
+                al_dia = False
+            with self._lock:
+                duraciones = list(tarea['duraciones'])
+                filas.append({
+                    'tarea': nombre,
+                    'al_dia': al_dia,
+                    'ejecuciones': tarea['ejecuciones'],
+                    'errores': tarea['errores'],
+                    'ultima_ms': duraciones[-1] if duraciones else None,
+                    'media_ms': sum(duraciones) / len(duraciones) if duraciones else None,
+                    'max_ms': max(duraciones, default=None),
+                    'ultimo_exito': tarea['ultimo_exito'],
+                    'ultimo_error': tarea['ultimo_error'],
+                    'momento_error': tarea['momento_error'],
+                })
+        return filas
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalcula las vistas derivadas y muestra cuánto tarda cada tarea")
+    parser.add_argument('--seguir', action='store_true', help="seguir recalculando cuando cambien los datos (Ctrl+C para terminar)")
+    parser.add_argument('--espera', type=float, default=120.0, help="segundos a esperar la carga del almacén")
+    args = parser.parse_args(argv)
+    from .datos import obtener_almacen, obtener_programador
+    if not obtener_almacen().esperar_carga(args.espera):
+        print("El almacén no terminó de cargar: se recalcula solo lo que ya está listo")
+    programador = obtener_programador()
+
+    def mostrar():
+        for fila in programador.informe():
+            duracion = f"{fila['ultima_ms']:>9.1f} ms" if fila['ultima_ms'] is not None else "     sin correr"
+            error = f"  error: {fila['ultimo_error']}" if fila['ultimo_error'] else ""
+            print(f"{fila['tarea']:<20} {duracion}  ejecuciones {fila['ejecuciones']}{error}")
+
+    programador.ejecutar_pendientes(forzar=True)
+    mostrar()
+    if args.seguir:
+        programador.iniciar()
+
+        def ejecuciones():
+            return sum(fila['ejecuciones'] for fila in programador.informe())
+
+        try:
+            vistas = ejecuciones()
+            while True:
+                time.sleep(1)
+                if ejecuciones() != vistas:
+                    vistas = ejecuciones()
+                    print(f"--- {datetime.now():%H:%M:%S}")
+                    mostrar()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
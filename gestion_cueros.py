@@ -1,20 +1,39 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import hashlib
 from pathlib import Path
 import json
-import os
-import firebase_admin
-from firebase_admin import credentials, firestore
-from io import BytesIO
+import time
+from cueros import archivo, avisos, conexion, presupuesto
+from cueros.archivo import anio_corte_archivo, anios_archivados, archivar_movimientos
+from cueros.almacen import COLECCIONES_ALMACEN
+from cueros.calculos import TRAMOS_ANTIGUEDAD, balance_cliente, saldo_pagos
+from cueros.config import ARCHIVO_CORTE_DIAS, COSTOS_LOCAL, DIARIO_LOCAL, FIREBASE_CREDS
+from cueros.datos import (
+    init_db, agregar_movimiento, autenticar_usuario,
+    crear_usuario, actualizar_estado_usuario, actualizar_password,
+    actualizar_rol_usuario, eliminar_usuario, actualizar_movimiento, eliminar_movimiento,
+    eliminar_movimientos_cliente, crear_cliente, actualizar_cliente,
+    eliminar_cliente, obtener_cliente_por_id, agregar_pago_cuenta,
+    obtener_pagos_cuenta_cliente, eliminar_pago_cuenta,
+    obtener_politica, obtener_almacen, obtener_cola, buscar, precargar_pagina, totales_cliente,
+    obtener_motor_costos, reporte_antiguedad, verificar_vista, metricas_globales, verificar_kpi,
+    ultima_verificacion_kpi, obtener_motor_filtros, actualizar_en_bloque, obtener_indice_lotes,
+    obtener_resumen_clientes, iniciar_recalculo, estado_recalculo, obtener_programador,
+)
+from cueros.dinero import a_centavos, a_pesos, importes, sumar_centavos
+from cueros.duplicados import UMBRAL_SIMILITUD, aplicar_fusion, buscar_duplicados
+from cueros.edicion import COLUMNAS_EDITABLES, cambios_tabla, tabla_edicion
+from cueros.estados_cuenta import construir_estado_cuenta, generar_excel_bytes, generar_estados_zip
 
 # --- CONFIGURACIÓN DE LA PÁGINA ---
 st.set_page_config(page_title="Gestión Cueros", layout="wide")
 st.title("🐄 Gestión de Stock y Pagos - Cueros")
 
 SESSION_FILE = Path(__file__).resolve().parent / ".session.json"
-FIREBASE_CREDS = Path(__file__).resolve().parent / "firebase_config.json"
+
+# Los errores y avisos de la capa de datos se muestran en la página
+avisos.configurar(error=st.error, aviso=st.warning)
 
 # --- INICIALIZACIÓN DE FIREBASE ---
 def get_firebase_credentials():
@@ -23,369 +42,41 @@ def get_firebase_credentials():
     # Opción 1: Streamlit Secrets (recomendado para deployment)
     try:
         if 'firebase' in st.secrets:
-            # Convertir a dict regular y asegurar que private_key tenga formato correcto
-            firebase_secrets = {
-                "type": str(st.secrets["firebase"]["type"]),
-                "project_id": str(st.secrets["firebase"]["project_id"]),
-                "private_key_id": str(st.secrets["firebase"]["private_key_id"]),
-                "private_key": str(st.secrets["firebase"]["private_key"]),
-                "client_email": str(st.secrets["firebase"]["client_email"]),
-                "client_id": str(st.secrets["firebase"]["client_id"]),
-                "auth_uri": str(st.secrets["firebase"]["auth_uri"]),
-                "token_uri": str(st.secrets["firebase"]["token_uri"]),
-                "auth_provider_x509_cert_url": str(st.secrets["firebase"]["auth_provider_x509_cert_url"]),
-                "client_x509_cert_url": str(st.secrets["firebase"]["client_x509_cert_url"]),
-                "universe_domain": str(st.secrets["firebase"].get("universe_domain", "googleapis.com"))
-            }
-            return firebase_secrets
+            return conexion.credenciales_desde_secrets(st.secrets)
     except Exception as e:
         st.warning(f"⚠️ Error al leer secrets de Streamlit: {str(e)}")
     
-    # Opción 2: Archivo firebase_config.json (recomendado para desarrollo local)
-    if FIREBASE_CREDS.exists():
-        try:
-            with open(FIREBASE_CREDS, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            st.warning(f"⚠️ Error al leer firebase_config.json: {str(e)}")
-    
-    # Opción 3: Variables de entorno
-    if os.getenv('FIREBASE_PROJECT_ID'):
-        try:
-            return {
-                "type": os.getenv('FIREBASE_TYPE', 'service_account'),
-                "project_id": os.getenv('FIREBASE_PROJECT_ID'),
-                "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
-                # Replace escaped newlines - env vars often store multi-line keys as single line with \n
-                "private_key": os.getenv('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n'),
-                "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
-                "client_id": os.getenv('FIREBASE_CLIENT_ID'),
-                "auth_uri": os.getenv('FIREBASE_AUTH_URI', 'https://accounts.google.com/o/oauth2/auth'),
-                "token_uri": os.getenv('FIREBASE_TOKEN_URI', 'https://oauth2.googleapis.com/token'),
-                "auth_provider_x509_cert_url": os.getenv('FIREBASE_AUTH_PROVIDER_CERT_URL', 'https://www.googleapis.com/oauth2/v1/certs'),
-                "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_CERT_URL'),
-                "universe_domain": os.getenv('FIREBASE_UNIVERSE_DOMAIN', 'googleapis.com')
-            }
-        except Exception as e:
-            st.warning(f"⚠️ Error al leer variables de entorno: {str(e)}")
-    
-    return None
+    # Opción 2 y 3: firebase_config.json o variables de entorno
+    return conexion.cargar_credenciales(incluir_secrets=False)
 
-if not firebase_admin._apps:
+if not conexion.inicializada():
     try:
-        creds_dict = get_firebase_credentials()
+        conexion.inicializar(get_firebase_credentials())
+        st.sidebar.success("✅ Conectado a Firebase")
+    except conexion.SinCredenciales:
+        st.error("❌ Error: No se encontraron credenciales de Firebase")
+        st.info("📄 **Opciones para configurar Firebase:**")
+        st.markdown("""
+        **Opción 1: Archivo de configuración (desarrollo local)**
+        - Crea el archivo `firebase_config.json` con tus credenciales de Firebase
+        - Ver `firebase_config_example.json` para el formato correcto
         
-        if creds_dict:
-            cred = credentials.Certificate(creds_dict)
-            firebase_admin.initialize_app(cred)
-            db = firestore.client()
-            st.sidebar.success("✅ Conectado a Firebase")
-        else:
-            st.error("❌ Error: No se encontraron credenciales de Firebase")
-            st.info("📄 **Opciones para configurar Firebase:**")
-            st.markdown("""
-            **Opción 1: Archivo de configuración (desarrollo local)**
-            - Crea el archivo `firebase_config.json` con tus credenciales de Firebase
-            - Ver `firebase_config_example.json` para el formato correcto
-            
-            **Opción 2: Streamlit Secrets (recomendado para deployment)**
-            - Crea el archivo `.streamlit/secrets.toml` 
-            - Ver `.streamlit/secrets.toml.example` para el formato correcto
-            
-            **Opción 3: Variables de entorno**
-            - Define las variables de entorno necesarias (ver documentación)
-            """)
-            st.stop()
+        **Opción 2: Streamlit Secrets (recomendado para deployment)**
+        - Crea el archivo `.streamlit/secrets.toml` 
+        - Ver `.streamlit/secrets.toml.example` para el formato correcto
+        
+        **Opción 3: Variables de entorno**
+        - Define las variables de entorno necesarias (ver documentación)
+        """)
+        st.stop()
     except Exception as e:
         st.error(f"❌ Error al conectar con Firebase: {str(e)}")
         st.stop()
-else:
-    db = firestore.client()
-
-# --- FUNCIONES DE BASE DE DATOS FIREBASE ---
-def init_db():
-    """Inicializar colecciones de Firebase (ya se crean automáticamente)"""
-    try:
-        # Verificar que exista un usuario admin
-        usuarios_ref = db.collection('usuarios')
-        admin_query = usuarios_ref.where('usuario', '==', 'admin').limit(1).get()
-        
-        if not admin_query:
-            # Crear admin por defecto
-            password_hash = hashlib.sha256('admin'.encode('utf-8')).hexdigest()
-            usuarios_ref.add({
-                'usuario': 'admin',
-                'password_hash': password_hash,
-                'rol': 'admin',
-                'activo': 1,
-                'fecha_creacion': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-        return True
-    except Exception as e:
-        st.error(f"Error al inicializar Firebase: {str(e)}")
-        return False
-
-def agregar_movimiento(tipo, producto, descripcion, cantidad, peso, precio_total, neto, iva_rate, modo_pago, detalle_pago, dinero_a_cuenta, estado):
-    try:
-        db.collection('movimientos').add({
-            'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'tipo': tipo,
-            'producto': producto,
-            'descripcion': descripcion,
-            'cantidad': cantidad,
-            'peso_kg': peso,
-            'precio_total': precio_total,
-            'neto': neto,
-            'iva_rate': iva_rate,
-            'modo_pago': modo_pago,
-            'detalle_pago': detalle_pago,
-            'dinero_a_cuenta': dinero_a_cuenta,
-            'estado_pago': estado
-        })
-    except Exception as e:
-        st.error(f"Error al agregar movimiento: {str(e)}")
-
-def obtener_datos():
-    try:
-        movimientos = db.collection('movimientos').order_by('fecha', direction=firestore.Query.DESCENDING).stream()
-        data = []
-        for mov in movimientos:
-            mov_dict = mov.to_dict()
-            mov_dict['id'] = mov.id
-            data.append(mov_dict)
-        return pd.DataFrame(data) if data else pd.DataFrame()
-    except Exception as e:
-        st.error(f"Error al leer movimientos: {str(e)}")
-        return pd.DataFrame()
-
-def autenticar_usuario(usuario, password):
-    try:
-        password_hash = hashlib.sha256(password.encode('utf-8')).hexdigest()
-        usuarios_ref = db.collection('usuarios')
-        query = usuarios_ref.where('usuario', '==', usuario).where('password_hash', '==', password_hash).limit(1).get()
-        
-        for doc in query:
-            user_data = doc.to_dict()
-            if user_data.get('activo') == 1:
-                return {'usuario': user_data['usuario'], 'rol': user_data['rol']}
-        return None
-    except Exception as e:
-        st.error(f"Error de autenticación: {str(e)}")
-        return None
-
-def crear_usuario(usuario, password, rol):
-    try:
-        password_hash = hashlib.sha256(password.encode('utf-8')).hexdigest()
-        db.collection('usuarios').add({
-            'usuario': usuario,
-            'password_hash': password_hash,
-            'rol': rol,
-            'activo': 1,
-            'fecha_creacion': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-    except Exception as e:
-        st.error(f"Error al crear usuario: {str(e)}")
-        raise
-
-def obtener_usuarios():
-    try:
-        usuarios = db.collection('usuarios').stream()
-        data = []
-        for user in usuarios:
-            user_dict = user.to_dict()
-            user_dict['id'] = user.id
-            data.append(user_dict)
-        return pd.DataFrame(data) if data else pd.DataFrame()
-    except Exception as e:
-        st.error(f"Error al obtener usuarios: {str(e)}")
-        return pd.DataFrame()
-
-def actualizar_estado_usuario(user_id, activo):
-    try:
-        db.collection('usuarios').document(user_id).update({
-            'activo': 1 if activo else 0
-        })
-    except Exception as e:
-        st.error(f"Error al actualizar estado: {str(e)}")
-
-def actualizar_password(user_id, new_password):
-    try:
-        password_hash = hashlib.sha256(new_password.encode('utf-8')).hexdigest()
-        db.collection('usuarios').document(user_id).update({
-            'password_hash': password_hash
-        })
-    except Exception as e:
-        st.error(f"Error al actualizar contraseña: {str(e)}")
-
-def actualizar_rol_usuario(user_id, rol):
-    try:
-        doc = db.collection('usuarios').document(user_id).get()
-        if doc.exists and doc.to_dict().get('usuario') != 'admin':
-            db.collection('usuarios').document(user_id).update({'rol': rol})
-    except Exception as e:
-        st.error(f"Error al actualizar rol: {str(e)}")
-
-def eliminar_usuario(user_id):
-    try:
-        doc = db.collection('usuarios').document(user_id).get()
-        if doc.exists and doc.to_dict().get('usuario') != 'admin':
-            db.collection('usuarios').document(user_id).delete()
-    except Exception as e:
-        st.error(f"Error al eliminar usuario: {str(e)}")
-
-def actualizar_movimiento(mov_id, tipo, producto, descripcion, cantidad, peso_kg, precio_total, neto, iva_rate, modo_pago, detalle_pago, dinero_a_cuenta, estado_pago):
-    try:
-        db.collection('movimientos').document(mov_id).update({
-            'tipo': tipo,
-            'producto': producto,
-            'descripcion': descripcion,
-            'cantidad': cantidad,
-            'peso_kg': peso_kg,
-            'precio_total': precio_total,
-            'neto': neto,
-            'iva_rate': iva_rate,
-            'modo_pago': modo_pago,
-            'detalle_pago': detalle_pago,
-            'dinero_a_cuenta': dinero_a_cuenta,
-            'estado_pago': estado_pago
-        })
-    except Exception as e:
-        st.error(f"Error al actualizar movimiento: {str(e)}")
-
-def eliminar_movimiento(mov_id):
-    try:
-        db.collection('movimientos').document(mov_id).delete()
-    except Exception as e:
-        st.error(f"Error al eliminar movimiento: {str(e)}")
-
-def eliminar_movimientos_cliente(cliente):
-    try:
-        movimientos = db.collection('movimientos').where('descripcion', '==', cliente).stream()
-        for mov in movimientos:
-            mov.reference.delete()
-    except Exception as e:
-        st.error(f"Error al eliminar movimientos: {str(e)}")
-
-def crear_cliente(nombre, tipo, contacto, telefono, email, direccion, notas):
-    try:
-        db.collection('clientes').add({
-            'nombre': nombre,
-            'tipo': tipo,
-            'contacto': contacto,
-            'telefono': telefono,
-            'email': email,
-            'direccion': direccion,
-            'notas': notas,
-            'activo': 1,
-            'fecha_creacion': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-    except Exception as e:
-        st.error(f"Error al crear cliente: {str(e)}")
-        raise
-
-def obtener_clientes():
-    try:
-        clientes = db.collection('clientes').order_by('nombre').stream()
-        data = []
-        for cliente in clientes:
-            cliente_dict = cliente.to_dict()
-            cliente_dict['id'] = cliente.id
-            data.append(cliente_dict)
-        return pd.DataFrame(data) if data else pd.DataFrame()
-    except Exception as e:
-        st.error(f"Error al obtener clientes: {str(e)}")
-        return pd.DataFrame()
-
-def actualizar_cliente(cliente_id, nombre, tipo, contacto, telefono, email, direccion, notas, activo):
-    try:
-        db.collection('clientes').document(cliente_id).update({
-            'nombre': nombre,
-            'tipo': tipo,
-            'contacto': contacto,
-            'telefono': telefono,
-            'email': email,
-            'direccion': direccion,
-            'notas': notas,
-            'activo': 1 if activo else 0
-        })
-    except Exception as e:
-        st.error(f"Error al actualizar cliente: {str(e)}")
-
-def eliminar_cliente(cliente_id):
-    try:
-        db.collection('clientes').document(cliente_id).delete()
-    except Exception as e:
-        st.error(f"Error al eliminar cliente: {str(e)}")
 
-def obtener_cliente_por_id(cliente_id):
-    try:
-        doc = db.collection('clientes').document(cliente_id).get()
-        if doc.exists:
-            data = doc.to_dict()
-            data['id'] = doc.id
-            return data
-        return None
-    except Exception as e:
-        st.error(f"Error al obtener cliente: {str(e)}")
-        return None
-
-def agregar_pago_cuenta(cliente_nombre, monto, concepto, tipo):
-    try:
-        db.collection('pagos_cuenta').add({
-            'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'cliente_nombre': cliente_nombre,
-            'monto': monto,
-            'concepto': concepto,
-            'tipo': tipo
-        })
-    except Exception as e:
-        st.error(f"Error al agregar pago: {str(e)}")
-
-def obtener_pagos_cuenta():
-    try:
-        pagos = db.collection('pagos_cuenta').order_by('fecha', direction=firestore.Query.DESCENDING).stream()
-        data = []
-        for pago in pagos:
-            pago_dict = pago.to_dict()
-            pago_dict['id'] = pago.id
-            data.append(pago_dict)
-        return pd.DataFrame(data) if data else pd.DataFrame()
-    except Exception as e:
-        st.error(f"Error al obtener pagos: {str(e)}")
-        return pd.DataFrame()
-
-def obtener_pagos_cuenta_cliente(cliente_nombre):
-    try:
-        pagos = db.collection('pagos_cuenta').where('cliente_nombre', '==', cliente_nombre).order_by('fecha', direction=firestore.Query.DESCENDING).stream()
-        data = []
-        for pago in pagos:
-            pago_dict = pago.to_dict()
-            pago_dict['id'] = pago.id
-            data.append(pago_dict)
-        return pd.DataFrame(data) if data else pd.DataFrame()
-    except Exception as e:
-        st.error(f"Error al obtener pagos del cliente: {str(e)}")
-        return pd.DataFrame()
-
-def calcular_saldo_cliente(cliente_nombre):
-    try:
-        df_pagos = obtener_pagos_cuenta_cliente(cliente_nombre)
-        saldo = 0
-        for _, row in df_pagos.iterrows():
-            if row['tipo'] == 'ingreso':
-                saldo += row['monto']
-            else:
-                saldo -= row['monto']
-        return saldo
-    except Exception as e:
-        st.error(f"Error al calcular saldo: {str(e)}")
-        return 0
-
-def eliminar_pago_cuenta(pago_id):
-    try:
-        db.collection('pagos_cuenta').document(pago_id).delete()
-    except Exception as e:
-        st.error(f"Error al eliminar pago: {str(e)}")
+@st.cache_data
+def leer_archivo_anio(anio, modificado=None):
+    """Movimientos archivados de un año (la caché se invalida si cambia su huella en Firebase)"""
+    return archivo.leer_archivo_anio(anio)
 
 def guardar_sesion(usuario, rol):
     try:
@@ -413,15 +104,33 @@ def eliminar_sesion():
 def generar_excel(dataframe, nombre_hoja="Datos"):
     """Genera un archivo Excel desde un DataFrame"""
     try:
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            dataframe.to_excel(writer, sheet_name=nombre_hoja, index=False)
-        output.seek(0)
-        return output.getvalue()
+        return generar_excel_bytes(dataframe, nombre_hoja)
     except Exception as e:
         st.error(f"Error al generar Excel: {str(e)}")
         return None
 
+def filtrar_por_cliente(nombre):
+    """Callback de la búsqueda: aplica el cliente elegido al filtro de movimientos"""
+    st.session_state.filtro_cliente = nombre
+
+def grilla_edicion(coleccion, df, column_config, key):
+    """Grilla editable de una colección; al guardar envía solo las celdas cambiadas, en un lote"""
+    original = tabla_edicion(coleccion, df)
+    if original.empty:
+        st.info("No hay datos para editar")
+        return
+    editada = st.data_editor(
+        original, key=key, num_rows="fixed", use_container_width=True, column_config=column_config,
+        disabled=[c for c in original.columns if c not in COLUMNAS_EDITABLES[coleccion]]
+    )
+    cambios = cambios_tabla(coleccion, original, editada)
+    if st.button(f"Guardar cambios ({len(cambios)} fila(s))", key=f"btn_guardar_{key}", disabled=not cambios):
+        actualizados = actualizar_en_bloque(coleccion, cambios)
+        if actualizados:
+            st.success(f"{actualizados} fila(s) actualizadas")
+        del st.session_state[key]
+        st.rerun()
+
 @st.dialog("Confirmar eliminacion")
 def confirmar_eliminacion(mov_id, descripcion, total):
     st.write(f"ID: {mov_id}")
@@ -488,6 +197,14 @@ if 'pago_form_key' not in st.session_state:
 if 'last_refresh' not in st.session_state:
     st.session_state.last_refresh = 0
 
+# Presupuesto de lecturas de Firestore de esta sesión; cada sección anota lo que lee
+if 'cuenta_lecturas' not in st.session_state:
+    st.session_state.cuenta_lecturas = presupuesto.CuentaLecturas()
+cuenta_lecturas = presupuesto.iniciar_rerun(st.session_state.cuenta_lecturas)
+# Se completa al final de la página si alguna sección se quedó sin lecturas
+aviso_presupuesto = st.container()
+presupuesto.entrar_seccion('acceso')
+
 # --- LOGIN ---
 if 'auth' not in st.session_state:
     sesion_guardada = cargar_sesion()
@@ -500,10 +217,11 @@ with st.sidebar.expander("Acceso", expanded=True):
         st.success("✓ Conectado a Firebase")
         # Mostrar estadísticas de datos persistentes
         try:
-            num_usuarios = len(list(db.collection('usuarios').stream()))
-            num_clientes = len(list(db.collection('clientes').stream()))
-            num_movimientos = len(list(db.collection('movimientos').stream()))
-            num_pagos = len(list(db.collection('pagos_cuenta').stream()))
+            almacen = obtener_almacen()
+            num_usuarios = almacen.contar('usuarios')
+            num_clientes = almacen.contar('clientes')
+            num_movimientos = almacen.contar('movimientos')
+            num_pagos = almacen.contar('pagos_cuenta')
             st.caption(f"📊 {num_usuarios} usuarios | {num_clientes} clientes")
             st.caption(f"📦 {num_movimientos} movimientos | {num_pagos} pagos")
         except Exception as e:
@@ -528,11 +246,47 @@ with st.sidebar.expander("Acceso", expanded=True):
 if not st.session_state.auth:
     st.stop()
 
+# Todas las lecturas de la página se lanzan a la vez; cada sección espera solo la suya
+precarga = precargar_pagina(['clientes', 'movimientos', 'pagos_cuenta', 'usuarios'] if st.session_state.auth['rol'] == 'admin' else ['clientes', 'movimientos', 'pagos_cuenta'])
+# Las vistas derivadas (resumen de clientes, antigüedad, costos...) se recalculan en segundo plano al cambiar los datos
+iniciar_recalculo()
+
+# --- ESCRITURAS PENDIENTES DE CONFIRMAR EN FIREBASE ---
+cola_escritura = obtener_cola()
+escrituras_pendientes = cola_escritura.pendientes()
+escrituras_fallidas = cola_escritura.fallidas()
+if obtener_politica().estado() != 'cerrado':
+    st.sidebar.warning("⚠️ Firebase responde con errores: se muestran datos guardados hasta que se recupere")
+if cola_escritura.sin_conexion:
+    st.sidebar.warning("📴 Sin conexión con Firebase: los cambios se guardan en el diario local y se sincronizarán al volver la conexión")
+if escrituras_pendientes:
+    st.sidebar.caption(f"⏳ {len(escrituras_pendientes)} registro(s) pendientes de sincronizar con Firebase")
+if escrituras_fallidas:
+    with st.sidebar.expander(f"⚠️ {len(escrituras_fallidas)} registro(s) sin guardar en Firebase", expanded=True):
+        for entrada in escrituras_fallidas:
+            datos_entrada = entrada['datos'] or entrada['anterior'] or {}
+            nombre_entrada = datos_entrada.get('descripcion') or datos_entrada.get('cliente_nombre') or datos_entrada.get('nombre', '')
+            etiqueta_estado = "Conflicto" if entrada['estado'] == 'conflicto' else "Error"
+            st.write(f"{entrada['operacion']} en {entrada['coleccion']}: {nombre_entrada} ({entrada['encolado']})")
+            st.caption(f"{etiqueta_estado}: {entrada['error']}")
+            if st.button("Descartar", key=f"descartar_escritura_{entrada['clave']}"):
+                cola_escritura.descartar_fallida(entrada['clave'])
+                st.rerun()
+        col_r1, col_r2 = st.columns(2)
+        if col_r1.button("Reintentar todos", key="btn_reintentar_escrituras"):
+            cola_escritura.reintentar_fallidas()
+            st.rerun()
+        if any(e['estado'] == 'conflicto' for e in escrituras_fallidas):
+            if col_r2.button("Aplicar igual", key="btn_forzar_escrituras", help="Sobrescribe los cambios hechos en Firebase por otro usuario"):
+                cola_escritura.reintentar_fallidas(forzar=True)
+                st.rerun()
+
 # --- BARRA LATERAL (ESTADO DE CUENTA SIEMPRE VISIBLE) ---
+presupuesto.entrar_seccion('barra_lateral')
 st.sidebar.header("💰 Estado de Cuenta")
 
 # Obtener lista de clientes para selector
-df_clientes_estado = obtener_clientes()
+df_clientes_estado = precarga.resultado('clientes')
 if not df_clientes_estado.empty:
     clientes_activos_estado = df_clientes_estado[df_clientes_estado['activo'] == 1]
     if not clientes_activos_estado.empty:
@@ -540,35 +294,21 @@ if not df_clientes_estado.empty:
         cliente_seleccionado_sidebar = st.sidebar.selectbox("Ver estado de cuenta de:", opciones_clientes_estado, key="cliente_sidebar_estado")
         
         if cliente_seleccionado_sidebar != "-- Seleccionar cliente --":
-            # Obtener datos del cliente
-            df_todas_movimientos = obtener_datos()
-            
-            # Validar que el DataFrame tenga la columna 'descripcion'
-            if not df_todas_movimientos.empty and 'descripcion' in df_todas_movimientos.columns:
-                df_cliente_estado = df_todas_movimientos[df_todas_movimientos['descripcion'] == cliente_seleccionado_sidebar]
-            else:
-                df_cliente_estado = pd.DataFrame()
-                
+            # Totales del cliente (agregaciones en Firestore si el almacén no está listo)
+            totales_estado = totales_cliente(cliente_seleccionado_sidebar)
+            compras = totales_estado['total_comprado']
+            ventas = totales_estado['total_vendido']
+            compras_impagag = totales_estado['deuda_compras']
+            ventas_impagag = totales_estado['deuda_ventas']
+
             try:
                 df_pagos_cliente_estado = obtener_pagos_cuenta_cliente(cliente_seleccionado_sidebar)
             except:
                 df_pagos_cliente_estado = pd.DataFrame()
             
-            # Calcular totales rápido
-            compras = 0
-            ventas = 0
-            compras_impagag = 0
-            ventas_impagag = 0
-            
-            if not df_cliente_estado.empty:
-                if 'precio_total' in df_cliente_estado.columns and 'tipo' in df_cliente_estado.columns and 'estado_pago' in df_cliente_estado.columns:
-                    compras = df_cliente_estado[df_cliente_estado['tipo'] == 'Ingreso (Compra)']['precio_total'].sum()
-                    ventas = df_cliente_estado[df_cliente_estado['tipo'] == 'Egreso (Venta)']['precio_total'].sum()
-                    compras_impagag = df_cliente_estado[(df_cliente_estado['tipo'] == 'Ingreso (Compra)') & (df_cliente_estado['estado_pago'] == 'Impago')]['precio_total'].sum()
-                    ventas_impagag = df_cliente_estado[(df_cliente_estado['tipo'] == 'Egreso (Venta)') & (df_cliente_estado['estado_pago'] == 'Impago')]['precio_total'].sum()
-            
-            saldo_cuenta = calcular_saldo_cliente(cliente_seleccionado_sidebar)
-            balance_total = ventas_impagag - compras_impagag + saldo_cuenta
+            saldo_cuenta = saldo_pagos(df_pagos_cliente_estado)
+            # En centavos: un saldo saldado da exactamente 0, sin residuos de coma flotante
+            balance_total = a_pesos(a_centavos(ventas_impagag) - a_centavos(compras_impagag) + a_centavos(saldo_cuenta))
             
             # Mostrar resumen en el sidebar
             st.sidebar.markdown("---")
@@ -610,7 +350,7 @@ if st.session_state.auth['rol'] == 'admin':
     producto = st.sidebar.selectbox("Producto", ["Sal", "Cueros"])
     
     # Selector de cliente/proveedor
-    df_clientes_sidebar = obtener_clientes()
+    df_clientes_sidebar = precarga.resultado('clientes')
     if not df_clientes_sidebar.empty:
         clientes_activos = df_clientes_sidebar[df_clientes_sidebar['activo'] == 1]
         if not clientes_activos.empty:
@@ -636,11 +376,21 @@ if st.session_state.auth['rol'] == 'admin':
     detalle_pago = st.sidebar.text_input("Detalle del pago (opcional)")
     dinero_a_cuenta = st.sidebar.number_input("Dinero a cuenta ($)", min_value=0.0, step=100.0)
     estado_pago = st.sidebar.radio("Estado del Pago", ["Pagado", "Impago"])
+    lotes_venta = []
+    if tipo_operacion == "Egreso (Venta)":
+        lotes_disponibles = {lote['lote']: lote for lote in obtener_indice_lotes().lotes_abiertos(producto=producto)}
+        lotes_venta = st.sidebar.multiselect(
+            "Lotes (opcional)", list(lotes_disponibles),
+            format_func=lambda lote_id: f"{lotes_disponibles[lote_id]['fecha'][:10]} · {lotes_disponibles[lote_id]['proveedor']} · "
+                                        f"{lotes_disponibles[lote_id]['cantidad']:.0f} u. / {lotes_disponibles[lote_id]['peso_kg']:.1f} kg",
+            help="Se consumen en el orden elegido; lo que falte sale de los lotes más viejos del producto"
+        )
 
     iva_map = {"0%": 0.0, "10.5%": 0.105, "21%": 0.21}
     iva_rate = iva_map[iva_opcion]
-    neto = precio_kg * peso_input
-    total_con_iva = neto * (1 + iva_rate)
+    montos = importes(precio_kg, peso_input, iva_rate)
+    neto = a_pesos(montos['neto'])
+    total_con_iva = a_pesos(montos['total'])
     promedio_unidad = (neto / cant_input) if cant_input > 0 else 0.0
 
     st.sidebar.markdown("**Detalle de calculo**")
@@ -662,7 +412,8 @@ if st.session_state.auth['rol'] == 'admin':
                 modo_pago,
                 detalle_pago,
                 dinero_a_cuenta,
-                estado_pago
+                estado_pago,
+                lotes=lotes_venta
             )
             st.sidebar.success("¡Registrado con éxito!")
             st.rerun() # Recargar la página para ver cambios
@@ -672,9 +423,10 @@ else:
     st.sidebar.info("Solo administradores pueden registrar compras y ventas.")
 
 # --- PANEL PRINCIPAL ---
+presupuesto.entrar_seccion('registro')
 
 # 1. Obtener datos
-df = obtener_datos()
+df = precarga.resultado('movimientos')
 
 if not df.empty:
     if 'last_deleted' in st.session_state and st.session_state.last_deleted is not None:
@@ -689,12 +441,40 @@ if not df.empty:
     if 'last_pago_deleted' in st.session_state and st.session_state.last_pago_deleted is not None:
         st.success(f"Pago a cuenta eliminado (ID {st.session_state.last_pago_deleted})")
         st.session_state.last_pago_deleted = None
+    clientes = sorted(df['descripcion'].dropna().unique().tolist()) if 'descripcion' in df.columns else []
+
+    # Búsqueda (por prefijo, sin acentos) en clientes y movimientos
+    busqueda = st.text_input("🔎 Buscar clientes y movimientos", key="busqueda", placeholder="Nombre, contacto, notas, descripción o detalle de pago")
+    if busqueda.strip():
+        inicio_busqueda = time.perf_counter()
+        resultados = buscar(busqueda, limite=50)
+        st.caption(f"{len(resultados)} resultados en {(time.perf_counter() - inicio_busqueda) * 1000:.1f} ms")
+        clientes_encontrados = [r for r in resultados if r['coleccion'] == 'clientes'][:6]
+        movimientos_encontrados = [r['id'] for r in resultados if r['coleccion'] == 'movimientos']
+        if clientes_encontrados:
+            st.write("**Clientes** (clic para filtrar sus movimientos):")
+            cols_busqueda = st.columns(len(clientes_encontrados))
+            for col_busqueda, resultado in zip(cols_busqueda, clientes_encontrados):
+                col_busqueda.button(
+                    resultado['nombre'], key=f"busqueda_cliente_{resultado['id']}",
+                    help=resultado.get('contacto') or None,
+                    disabled=resultado['nombre'] not in clientes,
+                    on_click=filtrar_por_cliente, args=(resultado['nombre'],)
+                )
+        if movimientos_encontrados and 'id' in df.columns:
+            # Se conserva el orden por relevancia de la búsqueda
+            df_encontrados = df.set_index(df['id'].astype(str))
+            df_encontrados = df_encontrados.loc[[i for i in movimientos_encontrados if i in df_encontrados.index]]
+            columnas_busqueda = [c for c in ['fecha', 'tipo', 'producto', 'descripcion', 'detalle_pago', 'precio_total', 'estado_pago'] if c in df_encontrados.columns]
+            st.dataframe(df_encontrados[columnas_busqueda], hide_index=True, use_container_width=True)
+        if not resultados:
+            st.caption("Sin resultados")
+
     # Filtros
     st.subheader("Filtros")
     col_f1, col_f2, col_f3, col_f4 = st.columns([2, 2, 3, 1])
     filtro_pago = col_f1.selectbox("Filtrar por estado de pago:", ["Todos", "Impago", "Pagado"], key="filtro_pago")
     filtro_producto = col_f2.selectbox("Filtrar por producto:", ["Todos", "Sal", "Cueros"], key="filtro_producto")
-    clientes = sorted(df['descripcion'].dropna().unique().tolist()) if 'descripcion' in df.columns else []
     opciones_clientes = ["Todos"] + clientes
     filtro_cliente = col_f3.selectbox("Filtrar por cliente / descripcion", opciones_clientes, key="filtro_cliente")
     if col_f4.button("Limpiar"):
@@ -703,41 +483,42 @@ if not df.empty:
         st.session_state.filtro_cliente = "Todos"
         st.rerun()
 
-    df_metric = df
-    if filtro_pago != "Todos" and 'estado_pago' in df_metric.columns:
-        df_metric = df_metric[df_metric['estado_pago'] == filtro_pago]
-    if filtro_producto != "Todos" and 'producto' in df_metric.columns:
-        df_metric = df_metric[df_metric['producto'] == filtro_producto]
-    if filtro_cliente != "Todos" and 'descripcion' in df_metric.columns:
-        df_metric = df_metric[df_metric['descripcion'] == filtro_cliente]
+    # Índices y sumas por celda de filtros, precalculados por versión de los datos
+    motor_filtros = obtener_motor_filtros(df)
+    filtros = tuple(None if valor == "Todos" else valor for valor in (filtro_pago, filtro_producto, filtro_cliente))
+    df_metric = motor_filtros.filas(*filtros)
 
     # 2. Cálculos de Stock y Finanzas
-    stock_actual_u = 0
-    stock_actual_kg = 0
-    deuda_compras = 0
-    a_cobrar_ventas = 0
-    cobrado_ventas = 0
-    pagado_compras = 0
-    dinero_esperado = 0
-    
-    if not df_metric.empty and 'tipo' in df_metric.columns:
-        ingresos = df_metric[df_metric['tipo'] == 'Ingreso (Compra)']
-        egresos = df_metric[df_metric['tipo'] == 'Egreso (Venta)']
-        
-        if 'cantidad' in df_metric.columns:
-            stock_actual_u = ingresos['cantidad'].sum() - egresos['cantidad'].sum()
-        if 'peso_kg' in df_metric.columns:
-            stock_actual_kg = ingresos['peso_kg'].sum() - egresos['peso_kg'].sum()
-        
-        # Deudas (Lo que debo pagar por compras impagas)
-        if 'estado_pago' in df_metric.columns and 'precio_total' in df_metric.columns:
-            deuda_compras = ingresos[ingresos['estado_pago'] == 'Impago']['precio_total'].sum()
-            # A cobrar (Lo que me deben por ventas impagas)
-            a_cobrar_ventas = egresos[egresos['estado_pago'] == 'Impago']['precio_total'].sum()
-            # Dinero esperado (cobrado ventas - pagado compras)
-            cobrado_ventas = egresos[egresos['estado_pago'] == 'Pagado']['precio_total'].sum()
-            pagado_compras = ingresos[ingresos['estado_pago'] == 'Pagado']['precio_total'].sum()
-            dinero_esperado = cobrado_ventas - pagado_compras
+    # Sin filtros, las tarjetas salen del documento de totales globales (una lectura)
+    metricas = None
+    if filtros == (None, None, None):
+        metricas = metricas_globales()
+    if metricas is None:
+        metricas = motor_filtros.metricas(*filtros)
+    stock_actual_u = metricas['stock_unidades']
+    stock_actual_kg = metricas['stock_kg']
+    deuda_compras = metricas['deuda_compras']
+    a_cobrar_ventas = metricas['a_cobrar_ventas']
+    dinero_esperado = metricas['dinero_esperado']
+
+    # Costo de lo vendido y margen de cada venta (motor incremental de costos)
+    motor_costos = obtener_motor_costos()
+    costos_movimientos = motor_costos.costos_por_id('movimientos')
+    costos_apertura = motor_costos.costos_por_id('saldos_apertura')
+
+    def costos_de(df_filas, campo):
+        if df_filas.empty or 'id' not in df_filas.columns:
+            return pd.Series(dtype=float, index=df_filas.index)
+        ids = df_filas['id'].astype(str)
+        valores = ids.map(lambda i: costos_movimientos.get(i, {}).get(campo))
+        if 'es_apertura' in df_filas.columns:
+            apertura = df_filas['es_apertura'] == True
+            valores[apertura] = ids[apertura].map(lambda i: costos_apertura.get(i, {}).get(campo))
+        return valores.astype(float)
+
+    costo_vendido = costos_de(df_metric, 'costo_venta').sum()
+    margen_bruto = costos_de(df_metric, 'margen').sum()
+    ingreso_vendido = costos_de(df_metric, 'ingreso_neto').sum()
 
     # 3. Métricas en tarjetas
     col_a, col_b, col_c, col_d, col_e = st.columns(5)
@@ -746,19 +527,18 @@ if not df.empty:
     col_c.metric("Por Cobrar (Ventas)", f"${a_cobrar_ventas:,.2f}", delta_color="normal")
     col_d.metric("Por Pagar (Compras)", f"${deuda_compras:,.2f}", delta_color="inverse")
     col_e.metric("Dinero Esperado", f"${dinero_esperado:,.2f}")
+    col_f, col_g, col_h = st.columns(3)
+    col_f.metric("Costo de lo Vendido", f"${costo_vendido:,.2f}")
+    col_g.metric("Margen Bruto", f"${margen_bruto:,.2f}")
+    col_h.metric("Margen %", f"{margen_bruto / ingreso_vendido * 100:.1f}%" if ingreso_vendido else "-")
+    st.caption(f"Costo {'FIFO' if motor_costos.metodo == 'fifo' else 'promedio ponderado por kg'}, sobre montos netos (sin IVA)")
 
     st.markdown("---")
 
     # 4. Tabla interactiva
     st.subheader("📋 Registro de Movimientos")
 
-    df_show = df
-    if filtro_pago != "Todos" and 'estado_pago' in df_show.columns:
-        df_show = df_show[df_show['estado_pago'] == filtro_pago]
-    if filtro_producto != "Todos" and 'producto' in df_show.columns:
-        df_show = df_show[df_show['producto'] == filtro_producto]
-    if filtro_cliente != "Todos" and 'descripcion' in df_show.columns:
-        df_show = df_show[df_show['descripcion'] == filtro_cliente]
+    df_show = df_metric
 
     df_show_display = df_show.copy()
     if 'iva_rate' in df_show_display.columns:
@@ -769,15 +549,26 @@ if not df.empty:
     ]
     columnas_disponibles = [c for c in columnas_base if c in df_show_display.columns]
     df_show_display = df_show_display[columnas_disponibles]
+    if costos_movimientos or costos_apertura:
+        df_show_display['costo_venta'] = costos_de(df_show, 'costo_venta').round(2)
+        df_show_display['margen'] = costos_de(df_show, 'margen').round(2)
+    estado_sincronizacion = {e['id']: '⏳ Pendiente' for e in escrituras_pendientes}
+    estado_sincronizacion.update({e['id']: '⚠️ Fallida' for e in escrituras_fallidas})
+    if estado_sincronizacion and 'id' in df_show_display.columns:
+        df_show_display['sincronizacion'] = df_show_display['id'].map(estado_sincronizacion).fillna('✓')
 
     st.dataframe(df_show_display, use_container_width=True)
 
     if st.session_state.auth['rol'] == 'admin':
         st.markdown("---")
         st.subheader("Eliminar movimientos")
+        ids_apertura = set(df_show.loc[df_show['es_apertura'] == True, 'id']) if 'es_apertura' in df_show.columns else set()
         for _, row in df_show_display.iterrows():
+            if row['id'] in ids_apertura:
+                continue
             col_id, col_desc, col_total, col_del = st.columns([1, 5, 2, 1])
-            mov_id = int(row['id'])
+            # Los IDs de Firestore son alfanuméricos (solo los datos migrados tienen IDs numéricos)
+            mov_id = str(row['id'])
             descripcion = str(row['descripcion'])
             total = float(row.get('precio_total', 0) or 0)
             col_id.write(mov_id)
@@ -786,13 +577,82 @@ if not df.empty:
             if col_del.button("X", key=f"del_{mov_id}"):
                 confirmar_eliminacion(mov_id, descripcion, total)
 
+    anios_archivo = anios_archivados()
+    if anios_archivo:
+        with st.expander("🗄️ Archivo histórico"):
+            st.caption("Los años archivados se muestran en el registro como saldos de apertura. Aquí puedes consultar su detalle.")
+            anio_archivo = st.selectbox("Año archivado", list(reversed(anios_archivo)), key="anio_archivo")
+            df_archivo = leer_archivo_anio(anio_archivo, modificado=archivo.huella_archivo_anio(anio_archivo))
+            st.dataframe(df_archivo, use_container_width=True)
+            csv_archivo = df_archivo.to_csv(index=False).encode('utf-8')
+            st.download_button(
+                label="📄 Descargar año en CSV",
+                data=csv_archivo,
+                file_name=f"movimientos_{anio_archivo}.csv",
+                mime="text/csv",
+                key="download_archivo_csv"
+            )
+
+    with st.expander("⏳ Antigüedad de deudas impagas"):
+        presupuesto.entrar_seccion('antiguedad')
+        df_antiguedad = reporte_antiguedad()
+        if filtro_cliente != "Todos":
+            df_antiguedad = df_antiguedad[df_antiguedad['cliente'] == filtro_cliente]
+        if df_antiguedad.empty:
+            st.info("No hay movimientos impagos")
+        else:
+            resumen_tramos = df_antiguedad.groupby('sentido')[[*TRAMOS_ANTIGUEDAD, 'total']].sum()
+            st.dataframe(resumen_tramos.round(2), use_container_width=True)
+            sentido = st.radio("Ver", ["Por cobrar", "Por pagar"], horizontal=True, key="antiguedad_sentido")
+            df_sentido = df_antiguedad[df_antiguedad['sentido'] == sentido].drop(columns='sentido')
+            st.dataframe(df_sentido.round(2), use_container_width=True, hide_index=True)
+            col_exp1, col_exp2 = st.columns(2)
+            fecha_reporte = datetime.now().strftime('%Y%m%d')
+            col_exp1.download_button(
+                label="📥 Descargar Excel",
+                data=generar_excel_bytes(df_antiguedad, nombre_hoja="Antigüedad"),
+                file_name=f"antiguedad_deudas_{fecha_reporte}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key="download_antiguedad_excel"
+            )
+            col_exp2.download_button(
+                label="📄 Descargar CSV",
+                data=df_antiguedad.to_csv(index=False).encode('utf-8'),
+                file_name=f"antiguedad_deudas_{fecha_reporte}.csv",
+                mime="text/csv",
+                key="download_antiguedad_csv"
+            )
+
+    with st.expander("📦 Lotes abiertos"):
+        indice_lotes = obtener_indice_lotes()
+        col_l1, col_l2, col_l3 = st.columns(3)
+        producto_lotes = col_l1.selectbox("Producto", ["Todos", "Sal", "Cueros"], key="lotes_producto")
+        proveedor_lotes = col_l2.selectbox("Proveedor", ["Todos"] + clientes, key="lotes_proveedor")
+        antiguedad_lotes = col_l3.number_input("Comprados hace más de (días)", min_value=0, step=1, value=0, key="lotes_antiguedad")
+        filtros_lotes = {
+            'producto': None if producto_lotes == "Todos" else producto_lotes,
+            'proveedor': None if proveedor_lotes == "Todos" else proveedor_lotes,
+        }
+        lotes = indice_lotes.lotes_con_antiguedad(antiguedad_lotes, **filtros_lotes) if antiguedad_lotes else indice_lotes.lotes_abiertos(**filtros_lotes)
+        if filtros_lotes['proveedor'] is not None:
+            restante_lotes = indice_lotes.restante(proveedor=filtros_lotes['proveedor'])
+            st.caption(f"{proveedor_lotes}: quedan {restante_lotes['cantidad']:.0f} u. y {restante_lotes['peso_kg']:,.1f} kg "
+                       f"en {restante_lotes['lotes_abiertos']} lote(s)")
+        if lotes:
+            df_lotes = pd.DataFrame(lotes).drop(columns='abierto')
+            st.dataframe(df_lotes.round(2), use_container_width=True, hide_index=True)
+            st.caption(f"{len(lotes)} lote(s) · {df_lotes['cantidad'].sum():.0f} u. · {df_lotes['peso_kg'].sum():,.1f} kg")
+        else:
+            st.info("No hay lotes abiertos con esos filtros")
+
     # --- RESUMEN POR CLIENTE ---
+    presupuesto.entrar_seccion('estado_cuenta')
     st.markdown("---")
     st.subheader("📄 Estado de Cuenta Detallado")
     
     # Obtener lista de clientes únicos desde movimientos y pagos
     clientes_movimientos = sorted(df['descripcion'].dropna().unique().tolist()) if 'descripcion' in df.columns else []
-    df_pagos_todos = obtener_pagos_cuenta()
+    df_pagos_todos = precarga.resultado('pagos_cuenta')
     clientes_pagos = df_pagos_todos['cliente_nombre'].unique().tolist() if not df_pagos_todos.empty else []
     clientes_unicos = sorted(list(set(clientes_movimientos + clientes_pagos)))
     
@@ -811,29 +671,26 @@ if not df.empty:
         df_cliente = df[df['descripcion'] == cliente_resumen]
         df_pagos_cliente = obtener_pagos_cuenta_cliente(cliente_resumen)
         
-        # Calcular totales
-        compras_cliente = df_cliente[df_cliente['tipo'] == 'Ingreso (Compra)']  # Lo que yo compré a este proveedor
-        ventas_cliente = df_cliente[df_cliente['tipo'] == 'Egreso (Venta)']  # Lo que yo vendí a este cliente
-        
-        total_comprado = compras_cliente['precio_total'].sum()
-        total_vendido = ventas_cliente['precio_total'].sum()
+        # Calcular totales (sumas exactas en centavos)
+        balance = balance_cliente(df_cliente, df_pagos_cliente)
+        total_comprado = balance['total_comprado']  # Lo que yo compré a este proveedor
+        total_vendido = balance['total_vendido']  # Lo que yo vendí a este cliente
         
         # Pagos
-        compras_pagadas = compras_cliente[compras_cliente['estado_pago'] == 'Pagado']['precio_total'].sum()
-        compras_impagas = compras_cliente[compras_cliente['estado_pago'] == 'Impago']['precio_total'].sum()
-        ventas_cobradas = ventas_cliente[ventas_cliente['estado_pago'] == 'Pagado']['precio_total'].sum()
-        ventas_impagag = ventas_cliente[ventas_cliente['estado_pago'] == 'Impago']['precio_total'].sum()
+        compras_impagas = balance['deuda_compras']
+        ventas_impagag = balance['deuda_ventas']
+        pagados = df_cliente['estado_pago'] == 'Pagado'
+        compras_pagadas = a_pesos(sumar_centavos(df_cliente, 'precio_total', (df_cliente['tipo'] == 'Ingreso (Compra)') & pagados))
+        ventas_cobradas = a_pesos(sumar_centavos(df_cliente, 'precio_total', (df_cliente['tipo'] == 'Egreso (Venta)') & pagados))
         
         # Saldo de pagos a cuenta
-        saldo_cuenta = calcular_saldo_cliente(cliente_resumen)
+        saldo_cuenta = balance['saldo_cuenta']
         
         # Balance general
         # Si es proveedor: le debo lo que compré y no pagué
         # Si es cliente: me debe lo que vendí y no cobré
         # El saldo a cuenta se suma/resta
-        balance_compras = compras_impagas  # Lo que le debo
-        balance_ventas = ventas_impagag    # Lo que me debe
-        balance_final = balance_ventas - balance_compras + saldo_cuenta
+        balance_final = balance['balance_final']
         
         # Mostrar tarjetas de resumen
         st.markdown("### 📊 Resumen General")
@@ -872,52 +729,9 @@ if not df.empty:
         st.markdown("### 📋 Estado de Cuenta Detallado")
         
         # Crear tabla unificada de movimientos
-        movimientos_cuenta = []
-        
-        # Agregar compras
-        for _, row in compras_cliente.iterrows():
-            movimientos_cuenta.append({
-                'Fecha': row['fecha'],
-                'Tipo': 'Compra (Yo compré)',
-                'Detalle': f"{row['producto']} - {row['cantidad']} u. - {row['peso_kg']} kg",
-                'Monto': row['precio_total'],
-                'Estado': row['estado_pago'],
-                'Debe': 0 if row['estado_pago'] == 'Pagado' else row['precio_total'],
-                'Haber': 0
-            })
-        
-        # Agregar ventas
-        for _, row in ventas_cliente.iterrows():
-            movimientos_cuenta.append({
-                'Fecha': row['fecha'],
-                'Tipo': 'Venta (Yo vendí)',
-                'Detalle': f"{row['producto']} - {row['cantidad']} u. - {row['peso_kg']} kg",
-                'Monto': row['precio_total'],
-                'Estado': row['estado_pago'],
-                'Debe': 0,
-                'Haber': 0 if row['estado_pago'] == 'Pagado' else row['precio_total']
-            })
+        df_cuenta = construir_estado_cuenta(df_cliente, df_pagos_cliente)
         
-        # Agregar pagos a cuenta
-        for _, row in df_pagos_cliente.iterrows():
-            movimientos_cuenta.append({
-                'Fecha': row['fecha'],
-                'Tipo': f"Pago a cuenta ({row['tipo']})",
-                'Detalle': row['concepto'],
-                'Monto': row['monto'],
-                'Estado': '-',
-                'Debe': 0 if row['tipo'] == 'ingreso' else row['monto'],
-                'Haber': row['monto'] if row['tipo'] == 'ingreso' else 0
-            })
-        
-        # Crear DataFrame y ordenar por fecha
-        if movimientos_cuenta:
-            df_cuenta = pd.DataFrame(movimientos_cuenta)
-            df_cuenta = df_cuenta.sort_values('Fecha', ascending=False)
-            
-            # Calcular balance acumulado
-            df_cuenta['Balance'] = (df_cuenta['Haber'] - df_cuenta['Debe']).cumsum()[::-1]
-            
+        if not df_cuenta.empty:
             st.dataframe(df_cuenta, use_container_width=True)
             
             # Exportar a Excel y CSV
@@ -958,30 +772,18 @@ if not df.empty:
         # Vista general de todos los clientes
         st.markdown("### 📊 Resumen General de Todos los Clientes")
         
-        resumen_general = []
-        if clientes_unicos:
-            for cliente in clientes_unicos:
-                df_cliente = df[df['descripcion'] == cliente] if not df.empty else pd.DataFrame()
-                compras = df_cliente[df_cliente['tipo'] == 'Ingreso (Compra)']['precio_total'].sum() if not df_cliente.empty else 0
-                ventas = df_cliente[df_cliente['tipo'] == 'Egreso (Venta)']['precio_total'].sum() if not df_cliente.empty else 0
-                compras_impagag = df_cliente[(df_cliente['tipo'] == 'Ingreso (Compra)') & (df_cliente['estado_pago'] == 'Impago')]['precio_total'].sum() if not df_cliente.empty else 0
-                ventas_impagag = df_cliente[(df_cliente['tipo'] == 'Egreso (Venta)') & (df_cliente['estado_pago'] == 'Impago')]['precio_total'].sum() if not df_cliente.empty else 0
-                saldo = calcular_saldo_cliente(cliente)
-                balance = ventas_impagag - compras_impagag + saldo
-                
-                resumen_general.append({
-                    'Cliente': cliente,
-                    'Total Comprado': compras,
-                    'Total Vendido': ventas,
-                    'Deuda Compras': compras_impagag,
-                    'Deuda Ventas': ventas_impagag,
-                    'Saldo a Cuenta': saldo,
-                    'Balance Final': balance
-                })
+        # Precalculado por el hilo de recálculo (o acá, si los datos cambiaron recién)
+        df_resumen = obtener_resumen_clientes(df, df_pagos_todos).rename(columns={
+            'cliente': 'Cliente',
+            'total_comprado': 'Total Comprado',
+            'total_vendido': 'Total Vendido',
+            'deuda_compras': 'Deuda Compras',
+            'deuda_ventas': 'Deuda Ventas',
+            'saldo_cuenta': 'Saldo a Cuenta',
+            'balance_final': 'Balance Final',
+        })
         
-        if resumen_general:
-            df_resumen = pd.DataFrame(resumen_general)
-            df_resumen = df_resumen.sort_values('Balance Final', ascending=False)
+        if not df_resumen.empty:
             
             # Colorear las filas según el balance
             def color_balance(val):
@@ -1025,10 +827,31 @@ if not df.empty:
         else:
             st.info("No hay clientes con movimientos registrados")
 
+        if clientes_unicos:
+            st.markdown("---")
+            st.markdown("### 📦 Estados de cuenta de todos los clientes")
+            if st.button("Generar ZIP con todos los estados de cuenta", key="btn_generar_estados_zip"):
+                with st.spinner(f"Generando {len(clientes_unicos)} estados de cuenta..."):
+                    inicio_zip = time.perf_counter()
+                    try:
+                        st.session_state.estados_zip = generar_estados_zip(df, df_pagos_todos, clientes_unicos)
+                        st.caption(f"{len(clientes_unicos)} estados generados en {time.perf_counter() - inicio_zip:.1f} s")
+                    except Exception as e:
+                        st.error(f"Error al generar los estados de cuenta: {str(e)}")
+            if st.session_state.get('estados_zip'):
+                st.download_button(
+                    label="🗜️ Descargar ZIP de estados de cuenta",
+                    data=st.session_state.estados_zip,
+                    file_name=f"estados_cuenta_{datetime.now().strftime('%Y%m%d')}.zip",
+                    mime="application/zip",
+                    key="download_estados_zip"
+                )
+
 else:
     st.info("Aún no hay movimientos registrados. Usa el menú de la izquierda.")
 
 # --- ADMINISTRACION DE USUARIOS ---
+presupuesto.entrar_seccion('administracion')
 if st.session_state.auth['rol'] == 'admin':
     st.markdown("---")
     st.subheader("Administracion de Usuarios")
@@ -1041,7 +864,7 @@ if st.session_state.auth['rol'] == 'admin':
             st.rerun()
 
     with st.expander("Log de Usuarios Creados"):
-        df_users_log = obtener_usuarios()
+        df_users_log = precarga.resultado('usuarios')
         st.dataframe(df_users_log, use_container_width=True)
 
     with st.expander("Crear usuario"):
@@ -1061,7 +884,7 @@ if st.session_state.auth['rol'] == 'admin':
                 st.error("Completa usuario y contrasena")
 
     with st.expander("Gestionar usuarios"):
-        df_users = obtener_usuarios()
+        df_users = precarga.resultado('usuarios')
         st.dataframe(df_users, use_container_width=True)
         user_id = st.number_input("ID de usuario", min_value=1, step=1, key="manage_user_id")
         activar = st.checkbox("Activo", value=True, key="manage_user_activo")
@@ -1088,6 +911,39 @@ if st.session_state.auth['rol'] == 'admin':
                 confirmar_eliminacion_usuario(user_id, usuario_nombre)
 
     st.subheader("Administracion de Movimientos")
+    with st.expander("Archivar movimientos antiguos"):
+        anio_corte_sugerido = anio_corte_archivo()
+        anio_corte = st.number_input("Archivar los años anteriores a", min_value=2000, max_value=datetime.now().year, value=anio_corte_sugerido, step=1, key="anio_corte_archivo")
+        st.caption(f"Por defecto se conservan activos los últimos {ARCHIVO_CORTE_DIAS} días (variable ARCHIVO_CORTE_DIAS). "
+                   "Los movimientos archivados se guardan comprimidos en Firebase (colección archivo_movimientos) y se reemplazan por saldos de apertura.")
+        # Archivar borra los movimientos de Firestore en bloque: se confirma escribiendo el año de corte
+        confirmacion_archivo = st.text_input(f"Para confirmar, escribe {int(anio_corte)}", key="confirmar_archivo")
+        confirmado = confirmacion_archivo.strip() == str(int(anio_corte)) and st.session_state.auth['rol'] == 'admin'
+        if st.button("Archivar", key="btn_archivar_movimientos", disabled=not confirmado):
+            archivados = archivar_movimientos(int(anio_corte))
+            if archivados:
+                st.success("Archivados: " + ", ".join(f"{anio}: {cantidad} movimientos" for anio, cantidad in archivados.items()))
+            else:
+                st.info("No hay movimientos para archivar")
+
+    with st.expander("Editar movimientos en tabla"):
+        st.caption("Neto y total se recalculan al cambiar el precio por kg, los kg o el IVA. "
+                   "Todas las filas editadas se guardan juntas.")
+        grilla_edicion('movimientos', precarga.resultado('movimientos'), {
+            'tipo': st.column_config.SelectboxColumn("Tipo", options=["Ingreso (Compra)", "Egreso (Venta)"], required=True),
+            'producto': st.column_config.SelectboxColumn("Producto", options=["Sal", "Cueros"], required=True),
+            'descripcion': st.column_config.TextColumn("Descripcion", required=True),
+            'cantidad': st.column_config.NumberColumn("Cantidad", min_value=1, step=1),
+            'peso_kg': st.column_config.NumberColumn("Peso (kg)", min_value=0.0, step=0.1),
+            'precio_kg': st.column_config.NumberColumn("Precio por kg", min_value=0.0, step=10.0, format="$%.2f"),
+            'iva_rate': st.column_config.SelectboxColumn("IVA", options=[0.0, 0.105, 0.21]),
+            'modo_pago': st.column_config.SelectboxColumn("Modo de Pago", options=["Efectivo", "A cuenta", "Cheque", "Otros productos"]),
+            'dinero_a_cuenta': st.column_config.NumberColumn("A cuenta", min_value=0.0, step=100.0, format="$%.2f"),
+            'estado_pago': st.column_config.SelectboxColumn("Estado", options=["Pagado", "Impago"], required=True),
+            'neto': st.column_config.NumberColumn("Neto", format="$%.2f"),
+            'precio_total': st.column_config.NumberColumn("Total con IVA", format="$%.2f"),
+        }, key="grilla_movimientos")
+
     with st.expander("Editar movimiento"):
         mov_id = st.number_input("ID de movimiento", min_value=1, step=1, key="mov_id")
         tipo_edit = st.selectbox("Tipo de Operacion", ["Ingreso (Compra)", "Egreso (Venta)"], key="mov_tipo")
@@ -1105,8 +961,9 @@ if st.session_state.auth['rol'] == 'admin':
         estado_edit = st.selectbox("Estado de Pago", ["Pagado", "Impago"], key="mov_estado")
 
         iva_rate_edit = iva_map[iva_edit]
-        neto_edit = precio_kg_edit * peso_edit
-        total_con_iva_edit = neto_edit * (1 + iva_rate_edit)
+        montos_edit = importes(precio_kg_edit, peso_edit, iva_rate_edit)
+        neto_edit = a_pesos(montos_edit['neto'])
+        total_con_iva_edit = a_pesos(montos_edit['total'])
         promedio_unidad_edit = (neto_edit / cant_edit) if cant_edit > 0 else 0.0
         st.write(f"Neto: ${neto_edit:,.2f}")
         st.write(f"Total con IVA: ${total_con_iva_edit:,.2f}")
@@ -1137,7 +994,7 @@ if st.session_state.auth['rol'] == 'admin':
     st.subheader("Administracion de Clientes")
 
     with st.expander("Log de Clientes Creados"):
-        df_clientes_log = obtener_clientes()
+        df_clientes_log = precarga.resultado('clientes')
         st.dataframe(df_clientes_log, use_container_width=True)
 
     with st.expander("Crear cliente"):
@@ -1161,8 +1018,15 @@ if st.session_state.auth['rol'] == 'admin':
             else:
                 st.error("Completa el nombre del cliente")
 
+    with st.expander("Editar clientes en tabla"):
+        grilla_edicion('clientes', precarga.resultado('clientes'), {
+            'nombre': st.column_config.TextColumn("Nombre", required=True),
+            'tipo': st.column_config.SelectboxColumn("Tipo", options=["Cliente", "Proveedor"]),
+            'activo': st.column_config.CheckboxColumn("Activo"),
+        }, key="grilla_clientes")
+
     with st.expander("Gestionar clientes"):
-        df_clientes = obtener_clientes()
+        df_clientes = precarga.resultado('clientes')
         st.dataframe(df_clientes, use_container_width=True)
         cliente_id = st.number_input("ID de cliente", min_value=1, step=1, key="manage_cliente_id")
         cliente_data = obtener_cliente_por_id(cliente_id)
@@ -1206,12 +1070,40 @@ if st.session_state.auth['rol'] == 'admin':
             else:
                 st.warning("Cliente no encontrado")
 
+    with st.expander("Nombres duplicados"):
+        st.caption("Busca grafías distintas de un mismo cliente en movimientos, pagos a cuenta y el maestro de clientes. "
+                   "Al fusionar, todos los documentos pasan a usar el nombre elegido.")
+        umbral_duplicados = st.slider("Similitud mínima", min_value=0.70, max_value=1.0, value=UMBRAL_SIMILITUD, step=0.01, key="umbral_duplicados")
+        if st.button("Buscar duplicados", key="btn_buscar_duplicados"):
+            st.session_state.propuestas_duplicados = buscar_duplicados(umbral_duplicados)
+        propuestas_duplicados = st.session_state.get('propuestas_duplicados')
+        if propuestas_duplicados == []:
+            st.info("No se encontraron nombres duplicados")
+        elif propuestas_duplicados:
+            fusiones = []
+            for numero, propuesta in enumerate(propuestas_duplicados):
+                grupo = [propuesta['canonico'], *propuesta['variantes']]
+                col_dup1, col_dup2 = st.columns([1, 3])
+                aceptar = col_dup1.checkbox("Fusionar", key=f"fusionar_{numero}")
+                canonico = col_dup2.selectbox(
+                    "Nombre a conservar", grupo, key=f"canonico_{numero}",
+                    format_func=lambda nombre, usos=propuesta['usos']: f"{nombre} ({usos[nombre]} usos)",
+                    help=f"Similitud {propuesta['similitud']:.2f}"
+                )
+                if aceptar:
+                    fusiones.append((canonico, [nombre for nombre in grupo if nombre != canonico]))
+            if st.button("Fusionar seleccionados", key="btn_fusionar_duplicados", disabled=not fusiones):
+                for canonico, variantes in fusiones:
+                    escritos = aplicar_fusion(canonico, variantes)
+                    st.success(f"{canonico}: " + (", ".join(f"{coleccion}: {cantidad}" for coleccion, cantidad in escritos.items()) or "sin cambios"))
+                del st.session_state.propuestas_duplicados
+
     st.markdown("---")
     st.subheader("Gestion de Pagos a Cuenta")
 
     with st.expander("Registrar pago a cuenta"):
         st.info("Registra dinero que el cliente deja a cuenta o cuando se usa saldo")
-        df_clientes_pago = obtener_clientes()
+        df_clientes_pago = precarga.resultado('clientes')
         if not df_clientes_pago.empty:
             clientes_activos_pago = df_clientes_pago[df_clientes_pago['activo'] == 1]
             if not clientes_activos_pago.empty:
@@ -1247,7 +1139,7 @@ if st.session_state.auth['rol'] == 'admin':
                     st.error("Completa el monto y el concepto")
 
     with st.expander("Historial de pagos a cuenta"):
-        df_pagos_todos = obtener_pagos_cuenta()
+        df_pagos_todos = precarga.resultado('pagos_cuenta')
         if not df_pagos_todos.empty:
             # Agregar columna de saldo acumulado por cliente
             st.dataframe(df_pagos_todos, use_container_width=True)
@@ -1256,7 +1148,7 @@ if st.session_state.auth['rol'] == 'admin':
             st.markdown("**Saldos por cliente:**")
             clientes_con_saldo = df_pagos_todos['cliente_nombre'].unique()
             for cliente in clientes_con_saldo:
-                saldo = calcular_saldo_cliente(cliente)
+                saldo = saldo_pagos(df_pagos_todos[df_pagos_todos['cliente_nombre'] == cliente])
                 if saldo != 0:
                     color = "🟢" if saldo > 0 else "🔴"
                     st.write(f"{color} {cliente}: ${saldo:,.2f}")
@@ -1264,7 +1156,7 @@ if st.session_state.auth['rol'] == 'admin':
             st.info("No hay pagos a cuenta registrados")
 
     with st.expander("Eliminar pago a cuenta"):
-        df_pagos_del = obtener_pagos_cuenta()
+        df_pagos_del = precarga.resultado('pagos_cuenta')
         if not df_pagos_del.empty:
             st.dataframe(df_pagos_del, use_container_width=True)
             pago_id_del = st.number_input("ID del pago a eliminar", min_value=1, step=1, key="del_pago_id")
@@ -1281,6 +1173,7 @@ if st.session_state.auth['rol'] == 'admin':
 
     st.markdown("---")
     with st.expander("🔍 Diagnóstico de Firebase"):
+        presupuesto.entrar_seccion('diagnostico')
         st.write("**Información de la conexión:**")
         st.success("✅ Conectado a Firebase Firestore")
         st.code(f"Archivo de configuración: {FIREBASE_CREDS}")
@@ -1293,19 +1186,112 @@ if st.session_state.auth['rol'] == 'admin':
             st.write("- pagos_cuenta")
             
             st.write("**Conteo de documentos:**")
-            num_usuarios = len(list(db.collection('usuarios').stream()))
-            num_clientes = len(list(db.collection('clientes').stream()))
-            num_movimientos = len(list(db.collection('movimientos').stream()))
-            num_pagos = len(list(db.collection('pagos_cuenta').stream()))
+            almacen = obtener_almacen()
+            num_usuarios = almacen.contar('usuarios')
+            num_clientes = almacen.contar('clientes')
+            num_movimientos = almacen.contar('movimientos')
+            num_pagos = almacen.contar('pagos_cuenta')
             
             st.write(f"Usuarios: {num_usuarios}")
             st.write(f"Clientes: {num_clientes}")
             st.write(f"Movimientos: {num_movimientos}")
             st.write(f"Pagos a cuenta: {num_pagos}")
+
+            st.write("**Sincronización en tiempo real:**")
+            for coleccion in COLECCIONES_ALMACEN:
+                if almacen.en_vivo(coleccion):
+                    estado = "🟢 activa"
+                elif almacen.listo(coleccion):
+                    estado = "🟡 sin conexión (copia local)"
+                else:
+                    estado = "🔴 inactiva (lectura directa)"
+                st.write(f"- {coleccion}: {estado} (versión {almacen.version(coleccion)})")
+            st.caption(f"Documentos recibidos por los listeners desde el arranque: {almacen.documentos_recibidos}")
+            errores_almacen = almacen.errores()
+            if errores_almacen:
+                st.warning("Errores al propagar cambios del almacén (las vistas afectadas pueden estar desactualizadas):")
+                st.dataframe(pd.DataFrame(errores_almacen), use_container_width=True, hide_index=True)
+            motor_costos = obtener_motor_costos()
+            st.caption(f"Motor de costos ({motor_costos.metodo}): {motor_costos.aplicados_incrementales} movimientos aplicados "
+                       f"en forma incremental, {motor_costos.recalculos} recálculos completos · {COSTOS_LOCAL}"
+                       + (" · recálculo pendiente: se muestran los últimos resultados consistentes" if motor_costos.requiere_recalculo else ""))
+            st.caption(f"Diario local: {DIARIO_LOCAL} ({len(cola_escritura.pendientes())} pendientes, {cola_escritura.confirmadas} confirmadas en esta ejecución)")
+
+            st.write("**Registro de cambios:**")
+            desde_firestore = st.checkbox("Comparar con Firebase (escaneo completo en paralelo) en lugar de la copia en memoria", key="verificar_desde_firestore")
+            if st.button("Reconstruir y verificar vistas", key="btn_verificar_vistas"):
+                for vista in ('stock', 'saldos'):
+                    informe_vista, diferencias = verificar_vista(vista, desde_firestore=desde_firestore)
+                    origen = "instantánea inicial creada" if informe_vista.get('inicial') else f"{informe_vista['eventos']} eventos desde la última instantánea"
+                    if diferencias:
+                        st.warning(f"Vista {vista}: {origen}, {len(diferencias)} diferencias con los datos actuales")
+                        st.dataframe(pd.DataFrame(diferencias).round(2), use_container_width=True, hide_index=True)
+                    else:
+                        st.success(f"Vista {vista}: {origen}, coincide con los datos actuales")
+
+            st.write("**Totales globales (kpis/global):**")
+            verificacion_kpi = ultima_verificacion_kpi()
+            if verificacion_kpi.get('error'):
+                st.caption(f"Última verificación ({verificacion_kpi['momento']}): error {verificacion_kpi['error']}")
+            elif verificacion_kpi:
+                estado_kpi = "corregido" if verificacion_kpi['corregido'] else ("con deriva, se corrige si se repite" if verificacion_kpi['diferencias'] else "sin deriva")
+                st.caption(f"Última verificación periódica: {verificacion_kpi['momento']} ({estado_kpi})")
+            else:
+                st.caption("La verificación periódica todavía no corrió")
+            if st.button("Recalcular y corregir totales", key="btn_verificar_kpi"):
+                informe_kpi = verificar_kpi(corregir=True, desde_firestore=desde_firestore)
+                if informe_kpi['diferencias']:
+                    st.warning(f"Totales corregidos: {', '.join(f'{campo} {diferencia:+}' for campo, diferencia in informe_kpi['diferencias'].items())}")
+                else:
+                    st.success("Los totales globales coinciden con los movimientos")
+
+            st.write("**Recálculo de vistas en segundo plano:**")
+            recalculo = estado_recalculo()
+            if recalculo['activo']:
+                st.caption(f"Hilo activo: revisa los datos cada {recalculo['cada']} s y enseguida después de cada cambio")
+            else:
+                st.caption("Hilo inactivo (RECALCULO_CADA=0 o sin almacén en memoria): las vistas se calculan al pedirlas")
+            st.dataframe(pd.DataFrame(recalculo['tareas']).round(1), use_container_width=True, hide_index=True)
+            if st.button("Recalcular vistas ahora", key="btn_recalcular_vistas"):
+                corridas = obtener_programador().ejecutar_pendientes(forzar=True)
+                st.success(f"Recalculadas: {', '.join(corridas) or 'ninguna (el almacén no está cargado)'}")
+
+            politica = obtener_politica()
+            st.write(f"**Llamadas a Firestore** (cortacircuitos: {politica.estado()}):")
+            metricas_llamadas = politica.metricas()
+            if metricas_llamadas:
+                st.dataframe(pd.DataFrame(metricas_llamadas), use_container_width=True)
+            else:
+                st.caption("Sin llamadas directas registradas")
+
+            st.write("**Lecturas de Firestore de esta sesión:**")
+            limites_lecturas = " · ".join(f"{limite:,} por {alcance}" for alcance, limite in (("rerun", cuenta_lecturas.por_rerun), ("sesión", cuenta_lecturas.por_sesion)) if limite) or "sin límite"
+            st.caption(f"{cuenta_lecturas.lecturas_rerun:,} en este rerun, {cuenta_lecturas.lecturas_sesion:,} en {cuenta_lecturas.reruns} reruns "
+                       f"(presupuesto: {limites_lecturas}). Las lecturas servidas por el almacén en memoria no se cuentan: las paga una vez el listener del proceso.")
+            informe_lecturas = cuenta_lecturas.informe()
+            if informe_lecturas:
+                st.dataframe(pd.DataFrame(informe_lecturas), use_container_width=True, hide_index=True)
+
+            st.write("**Precarga de esta página:**")
+            precarga.esperar()
+            informe_precarga = precarga.informe()
+            st.dataframe(pd.DataFrame(informe_precarga['lecturas']).round(1), use_container_width=True, hide_index=True)
+            st.caption(f"Suma de lecturas: {informe_precarga['suma_ms']:.1f} ms · Tiempo de la precarga: {informe_precarga['total_ms']:.1f} ms "
+                       f"(lectura más lenta: {informe_precarga['mas_lenta_ms']:.1f} ms) · Solapamiento: {informe_precarga['solapamiento']:.1f}x")
             
             if st.button("Verificar integridad", key="btn_verify_integrity"):
                 st.success("✅ Firebase funcionando correctamente")
                 st.info("Los datos se sincronizan automáticamente en la nube")
                 
         except Exception as e:
-            st.error(f"❌ Error al consultar Firebase: {str(e)}")
\ No newline at end of file
+            st.error(f"❌ Error al consultar Firebase: {str(e)}")
+
+# --- AVISO DE PRESUPUESTO DE LECTURAS ---
+if cuenta_lecturas.degradadas:
+    with aviso_presupuesto:
+        secciones_degradadas = sorted({d['seccion'] for d in cuenta_lecturas.degradadas})
+        st.warning(f"⚠️ Se alcanzó el presupuesto de lecturas de Firestore: {', '.join(secciones_degradadas)} "
+                   f"muestra(n) datos guardados o parciales ({cuenta_lecturas.lecturas_rerun:,} lecturas en este rerun, "
+                   f"{cuenta_lecturas.lecturas_sesion:,} en la sesión)")
+        for degradada in cuenta_lecturas.degradadas:
+            st.caption(f"{degradada['seccion']} · {degradada['operacion']}: {degradada['motivo']}")
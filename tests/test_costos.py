@@ -0,0 +1,136 @@
+import pytest
+
+from cueros.costos import TIPO_COMPRA, TIPO_VENTA, MotorCostos
+
+def compra(fecha, kg, neto, producto='vaca'):
+    return {'fecha': fecha, 'tipo': TIPO_COMPRA, 'producto': producto, 'peso_kg': kg, 'neto': neto}
+
+def venta(fecha, kg, neto, producto='vaca'):
+    return {'fecha': fecha, 'tipo': TIPO_VENTA, 'producto': producto, 'peso_kg': kg, 'neto': neto}
+
+def motor_con(metodo, documentos, **kwargs):
+    motor = MotorCostos(metodo, **kwargs)
+    motor.aplicar_cambios('movimientos', documentos, reemplazar=True)
+    return motor
+
+def test_promedio_ponderado():
+    motor = motor_con('promedio', {
+        'c1': compra('2024-01-01', 10, 1000),
+        'c2': compra('2024-01-02', 10, 3000),
+        'v1': venta('2024-01-03', 5, 1500),
+    })
+    resultado = motor.resultado_venta('movimientos', 'v1')
+    assert resultado['costo_venta'] == pytest.approx(1000)
+    assert resultado['margen'] == pytest.approx(500)
+    assert resultado['kg_sin_costo'] == 0
+    estado = motor.estado_productos()['vaca']
+    assert estado['kg'] == pytest.approx(15)
+    assert estado['costo_kg'] == pytest.approx(200)
+    assert estado['costo'] == pytest.approx(3000)
+
+def test_promedio_con_stock_negativo():
+    # La venta se cargó con fecha anterior a la compra que la respalda
+    motor = motor_con('promedio', {
+        'v1': venta('2024-01-01', 5, 600),
+        'c1': compra('2024-01-02', 10, 1200),
+    })
+    resultado = motor.resultado_venta('movimientos', 'v1')
+    assert resultado['costo_venta'] == 0
+    assert resultado['kg_sin_costo'] == 5
+    estado = motor.estado_productos()['vaca']
+    assert estado['kg'] == pytest.approx(5)
+    # El promedio arranca de la compra, no del stock negativo
+    assert estado['costo_kg'] == pytest.approx(120)
+    assert estado['costo'] == pytest.approx(600)
+
+def test_fifo_consume_lotes_parciales():
+    motor = motor_con('fifo', {
+        'c1': compra('2024-01-01', 10, 100),
+        'c2': compra('2024-01-02', 10, 200),
+        'v1': venta('2024-01-03', 15, 450),
+        'v2': venta('2024-01-04', 10, 400),
+    })
+    # 10 kg del primer lote a 10 y 5 del segundo a 20
+    assert motor.resultado_venta('movimientos', 'v1')['costo_venta'] == pytest.approx(200)
+    # Quedan 5 kg a 20; los otros 5 se valorizan al último costo conocido
+    segunda = motor.resultado_venta('movimientos', 'v2')
+    assert segunda['costo_venta'] == pytest.approx(200)
+    assert segunda['kg_sin_costo'] == pytest.approx(5)
+    estado = motor.estado_productos()['vaca']
+    assert estado['kg'] == pytest.approx(-5)
+    assert estado['costo'] == 0
+
+def test_fifo_con_stock_negativo_y_compra_posterior():
+    motor = motor_con('fifo', {
+        'v1': venta('2024-01-01', 4, 100),
+        'c1': compra('2024-01-02', 10, 150),
+        'v2': venta('2024-01-03', 3, 90),
+    })
+    assert motor.resultado_venta('movimientos', 'v1')['kg_sin_costo'] == 4
+    assert motor.resultado_venta('movimientos', 'v2')['costo_venta'] == pytest.approx(45)
+    assert motor.estado_productos()['vaca']['kg'] == pytest.approx(3)
+
+@pytest.mark.parametrize('metodo', ['promedio', 'fifo'])
+def test_fecha_anterior_recalcula_igual_que_desde_cero(metodo):
+    documentos = {
+        'c1': compra('2024-01-01', 10, 1000),
+        'v1': venta('2024-01-05', 8, 1200),
+    }
+    motor = motor_con(metodo, documentos)
+    assert motor.aplicados_incrementales == 2
+    atrasada = {'c0': compra('2023-12-01', 10, 500)}
+    motor.aplicar_cambios('movimientos', atrasada)
+    assert motor.requiere_recalculo
+    desde_cero = motor_con(metodo, {**documentos, **atrasada})
+    assert motor.resultados() == desde_cero.resultados()
+    assert motor.estado_productos() == desde_cero.estado_productos()
+    assert motor.recalculos == 1
+
+def test_en_segundo_plano_sirve_los_ultimos_resultados_consistentes():
+    motor = motor_con('promedio', {
+        'c1': compra('2024-01-01', 10, 1000),
+        'v1': venta('2024-01-05', 5, 1000),
+    }, en_segundo_plano=lambda: True)
+    antes = motor.resultados()
+    motor.aplicar_cambios('movimientos', {'c0': compra('2023-12-01', 10, 3000)})
+    assert motor.requiere_recalculo
+    assert motor.resultados() == antes
+    assert motor.recalculos == 0
+    assert motor.poner_al_dia()
+    assert not motor.requiere_recalculo
+    assert motor.resultado_venta('movimientos', 'v1')['costo_venta'] == pytest.approx(1000)
+
+def test_recalculo_descartado_si_llegan_cambios():
+    motor = motor_con('promedio', {'c1': compra('2024-01-01', 10, 1000)}, en_segundo_plano=lambda: True)
+    motor.aplicar_cambios('movimientos', {'c1': compra('2024-01-01', 10, 2000)})
+    aplicar = MotorCostos._aplicar
+
+    def aplicar_y_cambiar(copia, clave, datos_huella):
+        aplicar(copia, clave, datos_huella)
+        if copia is not motor and 'v1' not in motor._huellas:
+            motor.aplicar_cambios('movimientos', {'v1': venta('2024-01-02', 1, 500)})
+
+    MotorCostos._aplicar = aplicar_y_cambiar
+    try:
+        assert not motor.recalcular()
+    finally:
+        MotorCostos._aplicar = aplicar
+    assert motor.requiere_recalculo
+    assert motor.poner_al_dia()
+    assert motor.resultado_venta('movimientos', 'v1')['costo_venta'] == pytest.approx(200)
+
+def test_estado_persistido_solo_con_las_ventas_vigentes(tmp_path):
+    ruta = tmp_path / 'costos.sqlite'
+    motor = motor_con('promedio', {
+        'c1': compra('2024-01-01', 10, 1000),
+        'v1': venta('2024-01-05', 5, 1000),
+        'v2': venta('2024-01-06', 1, 300),
+    }, ruta=ruta)
+    # Editar una venta a compra y cargar una compra atrasada obliga a recalcular
+    motor.aplicar_cambios('movimientos', {'v2': compra('2024-01-06', 1, 300), 'c0': compra('2023-12-01', 10, 3000)})
+    esperado = motor.resultados()
+    assert set(esperado) == {'movimientos/v1'}
+    recargado = MotorCostos('promedio', ruta=ruta)
+    assert not recargado.requiere_recalculo
+    assert recargado.resultados() == esperado
+    assert recargado.estado_productos() == motor.estado_productos()
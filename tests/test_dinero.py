@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cueros.dinero import (_pesos_a_centavos, a_centavos, a_pesos, calcular_iva, centavos_documento,
+                           columna_centavos, importes, importes_columnas, sumar_centavos)
+
+@pytest.mark.parametrize('pesos, centavos', [
+    (0.005, 1), (0.015, 2), (0.125, 13), (0.145, 15), (1.005, 101), (2.675, 268),
+    (10.005, 1001), (1234.565, 123457), (-0.005, -1), (-1.005, -101), (-2.675, -268),
+    ('0.005', 1), ('1.005', 101), (0.004999, 0), (None, 0), ('abc', 0), (float('nan'), 0),
+])
+def test_a_centavos_redondea_la_mitad_lejos_de_cero(pesos, centavos):
+    assert a_centavos(pesos) == centavos
+
+def test_pesos_a_centavos_coincide_con_a_centavos():
+    # Todos los importes con tres decimales entre -100 y 100, incluidos los .xx5
+    milesimos = np.arange(-100000, 100001)
+    pesos = np.round(milesimos / 1000, 3)
+    vectorial = _pesos_a_centavos(pesos).astype('int64')
+    escalar = np.array([a_centavos(float(valor)) for valor in pesos])
+    distintos = pesos[vectorial != escalar]
+    assert distintos.size == 0, distintos[:10]
+
+def test_iva_e_importes_vectoriales_coinciden_con_los_escalares():
+    precio = pd.Series([10.0, 2.675, 0.145, 333.33, 1.5])
+    peso = pd.Series([1.5, 3.0, 7.0, 0.333, 101.0])
+    iva = pd.Series([0.21, 0.105, 0.21, 0.0, 0.27])
+    columnas = importes_columnas(precio, peso, iva)
+    for fila in range(len(precio)):
+        esperado = importes(precio[fila], peso[fila], iva[fila])
+        assert columnas.loc[fila].to_dict() == esperado
+    assert calcular_iva(1005, 0.1) == 101
+
+def test_centavos_documento_usa_los_centavos_si_coinciden_con_los_pesos():
+    assert centavos_documento({'neto': 12.34, 'neto_centavos': 1234}, 'neto') == 1234
+    assert centavos_documento({'neto_centavos': 1234}, 'neto') == 1234
+    assert centavos_documento({'neto': 'n/d', 'neto_centavos': 1234}, 'neto') == 1234
+
+def test_centavos_documento_vuelve_a_los_pesos_si_no_coinciden():
+    # Pesos editados en la consola sin tocar los centavos
+    assert centavos_documento({'neto': 20.0, 'neto_centavos': 1234}, 'neto') == 2000
+    assert centavos_documento({'neto': 1.005}, 'neto') == 101
+    assert centavos_documento({'neto': 1.0, 'neto_centavos': True}, 'neto') == 100
+
+def test_columna_centavos_coincide_con_centavos_documento():
+    documentos = [
+        {'neto': 12.34, 'neto_centavos': 1234},
+        {'neto': 20.0, 'neto_centavos': 1234},
+        {'neto': 1.005},
+        {'neto_centavos': 500},
+        {'neto': -2.675, 'neto_centavos': -268},
+        {},
+    ]
+    df = pd.DataFrame(documentos)
+    esperado = [centavos_documento(documento, 'neto') for documento in documentos]
+    assert columna_centavos(df, 'neto').tolist() == esperado
+    assert sumar_centavos(df, 'neto') == sum(esperado)
+
+def test_columna_centavos_sin_columna_de_centavos():
+    df = pd.DataFrame({'monto': [0.005, 0.015, 1.005]})
+    assert columna_centavos(df, 'monto').tolist() == [1, 2, 101]
+    assert columna_centavos(pd.DataFrame(), 'monto').dtype == 'int64'
+
+def test_a_pesos():
+    assert a_pesos(101) == 1.01
+    assert a_centavos(a_pesos(-268)) == -268